@@ -0,0 +1,98 @@
+"""Fleet command throughput with 1 to `MAX_ADAPTERS` simulated adapters.
+
+Every device is in range of all the adapters, with a random RSSI; each
+adapter's radio handles one write at a time, taking `AIRTIME` seconds.
+`ROUNDS` group commands are sent to `DEVICES` devices, through a pool placing
+the connections with an `AdapterBalancer`.
+
+    poetry run python benchmarks/adapters.py
+"""
+
+import asyncio
+import random
+import time
+
+from am43_bleak.balancer import AdapterBalancer
+from am43_bleak.client import AM43Client
+from am43_bleak.fleet import send_group_command
+from am43_bleak.pool import ConnectionPool, get_adapter
+from am43_bleak.protocol import PositionControl
+from am43_bleak.simulator import SimulatedAdapter, SimulatedBleakClient, SimulatedDevice
+
+MAX_ADAPTERS = 4
+DEVICES = 20
+ROUNDS = 5
+AIRTIME = 0.005
+LATENCY = 0.01
+CONNECT_TIME = 0.02
+MAX_CONNECTIONS = 7
+
+
+async def measure(adapter_count: int, rng: random.Random) -> tuple[float, dict]:
+    devices = [
+        SimulatedDevice(f"02:00:00:00:00:{i:02X}", pin=1) for i in range(DEVICES)
+    ]
+    adapters = {
+        name: SimulatedAdapter(name, airtime=AIRTIME)
+        for name in (f"hci{i}" for i in range(adapter_count))
+    }
+
+    balancer = AdapterBalancer()
+    for adapter in adapters.values():
+        for device in devices:
+            adapter.rssi[device.address] = rng.randint(-90, -50)
+            balancer.observe(
+                adapter.ble_device(device), adapter.rssi[device.address], adapter.name
+            )
+
+    by_address = {device.address: device for device in devices}
+
+    def client_factory(ble_device):
+        return AM43Client(
+            ble_device,
+            client=SimulatedBleakClient(
+                by_address[ble_device.address],
+                latency=LATENCY,
+                connect_time=CONNECT_TIME,
+                adapter=adapters[get_adapter(ble_device)],
+            ),
+        )
+
+    pool = ConnectionPool(
+        pins={device.address: 1 for device in devices},
+        max_connections=MAX_CONNECTIONS,
+        client_factory=client_factory,
+        balancer=balancer,
+    )
+
+    targets = [device.ble_device("hci0") for device in devices]
+    started = time.perf_counter()
+    for i in range(ROUNDS):
+        outcomes = await send_group_command(
+            pool, targets, PositionControl(position=i * 10)
+        )
+        assert all(outcome.is_success for outcome in outcomes)
+    elapsed = time.perf_counter() - started
+
+    placement = {}
+    for session in pool._sessions.values():
+        placement[session.adapter] = placement.get(session.adapter, 0) + 1
+    await pool.close()
+
+    return DEVICES * ROUNDS / elapsed, placement
+
+
+async def main():
+    rng = random.Random(1)
+    baseline = None
+    for adapter_count in range(1, MAX_ADAPTERS + 1):
+        throughput, placement = await measure(adapter_count, rng)
+        baseline = baseline or throughput
+        print(
+            f"{adapter_count} adapter(s): {throughput:7.1f} commands/s "
+            f"(x{throughput / baseline:.2f}), connections {dict(sorted(placement.items()))}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
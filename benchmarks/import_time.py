@@ -0,0 +1,98 @@
+"""Cold import time of the package, checked against a budget.
+
+Every module is imported in a fresh interpreter with `python -X importtime`,
+the best of several runs is taken. Only the time spent in the package's own
+modules is compared with the budget, third-party imports (construct, numpy)
+are reported separately. Exits with a non-zero status when over the budget.
+
+Run with `poetry run python benchmarks/import_time.py [--budget-ms 60]`, the
+same check runs as part of the tests (tests/test_import_time.py).
+"""
+
+import argparse
+import subprocess
+import sys
+
+MODULES = (
+    "am43_bleak.protocol",
+    "am43_bleak.codec",
+    "am43_bleak.stream",
+    "am43_bleak.frame_cache",
+)
+
+# About 15-25 ms are spent in the package now, the budget leaves room for
+# noisy machines while still catching e.g. a struct built for every class
+DEFAULT_BUDGET_MS = 60.0
+DEFAULT_RUNS = 7
+
+# Nothing but the message classes is expected to be built on import
+CHECK_LAZY = """
+import {module}
+from am43_bleak.protocol import Payload, _message_structs
+built = len(_message_structs) + sum(
+    len(m._constructs)
+    for m in (Payload.REQUEST_MESSAGE_TYPE_MAP, Payload.RESPONSE_MESSAGE_TYPE_MAP)
+)
+print(built)
+"""
+
+
+def import_times(module: str) -> tuple:
+    """Returns own and total import time of the module in microseconds"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    own = total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header
+        name = name.strip()
+        if name == "am43_bleak" or name.startswith("am43_bleak."):
+            own += int(self_us)
+        if name == module:
+            total = int(cumulative_us)
+
+    return own, total
+
+
+def built_structs(module: str) -> int:
+    result = subprocess.run(
+        [sys.executable, "-c", CHECK_LAZY.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return int(result.stdout)
+
+
+def main(budget_ms: float = DEFAULT_BUDGET_MS, runs: int = DEFAULT_RUNS) -> int:
+    status = 0
+    print(f"{'module':<26}{'own, ms':>10}{'total, ms':>12}{'structs':>10}")
+    for module in MODULES:
+        own, total = min(import_times(module) for _ in range(runs))
+        structs = built_structs(module)
+        print(f"{module:<26}{own / 1000:>10.1f}{total / 1000:>12.1f}{structs:>10}")
+
+        if own / 1000 > budget_ms:
+            print(f"  over the budget of {budget_ms:.1f} ms")
+            status = 1
+        if structs:
+            print("  message constructs are built on import")
+            status = 1
+
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    args = parser.parse_args()
+    sys.exit(main(args.budget_ms, args.runs))
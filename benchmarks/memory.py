@@ -0,0 +1,70 @@
+"""Memory retained per decoded message: `Message` objects vs records.
+
+Every sample frame is decoded `COUNT` times and the results are kept alive,
+the allocated memory is measured with `tracemalloc`.
+
+    poetry run python benchmarks/memory.py
+"""
+
+import gc
+import tracemalloc
+
+from message_build import REQUESTS, SEASON, make_timer
+
+from am43_bleak.codec import compiled_message_format
+from am43_bleak.protocol import message_format
+from am43_bleak.records import RecordFormat
+from am43_bleak.simulator import SimulatedDevice
+
+COUNT = 1000
+
+DECODERS = {
+    "construct": message_format.parse,
+    "compiled": compiled_message_format.parse,
+    "record": RecordFormat().parse,
+    "record+raw": RecordFormat(keep_raw=True).parse,
+}
+
+
+def _sample_frames() -> dict:
+    """name -> frame, for every device response class"""
+    device = SimulatedDevice("02:00:00:00:00:01", require_authentication=False)
+    device.state.timers[0] = make_timer()
+    device.state.timers[1] = make_timer()
+    device.state.summer = SEASON
+
+    ret = {}
+    for prepare in REQUESTS.values():
+        for reply in device.handle(prepare()):
+            name = type(reply.payload.message).__name__
+            ret.setdefault(name, compiled_message_format.build(reply))
+
+    return ret
+
+
+def measure(decode, frame: bytes) -> float:
+    """Bytes retained per decoded frame"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    # A separate copy each time, as received from the device, so the memory
+    # is only retained if the result keeps the frame
+    kept = [decode(bytes(bytearray(frame))) for _ in range(COUNT)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # The list itself isn't part of the messages
+    return (after - before - kept.__sizeof__()) / COUNT
+
+
+def main():
+    frames = _sample_frames()
+    print(f"{'message':<24}" + "".join(f"{name:>14}" for name in DECODERS))
+    for name, frame in frames.items():
+        row = "".join(
+            f"{measure(decode, frame):>12.0f} B" for decode in DECODERS.values()
+        )
+        print(f"{name:<24}{row}")
+
+
+if __name__ == "__main__":
+    main()
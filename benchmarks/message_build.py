@@ -0,0 +1,133 @@
+"""Micro-benchmark of `Message.prepare()` + build for every request type.
+
+Run with `poetry run python benchmarks/message_build.py`.
+"""
+
+import timeit
+
+from am43_bleak.codec import compiled_message_format
+from am43_bleak.protocol import (
+    ButtonsMode,
+    ContentControlDirect,
+    DayOfWeek,
+    DeviceType,
+    Direction,
+    LimitCommand,
+    Message,
+    MessageType,
+    Season,
+    SeasonLightLevel,
+    SeasonLightSwitchState,
+    SetLimitMode,
+    Timer,
+    TimerRepeat,
+    UpdateSeason,
+    UpdateTimer,
+    UpdateTimerAction,
+    WheelGearDiameter,
+    message_format,
+)
+
+
+def make_timer() -> Timer:
+    """Sample timer, shared by the other benchmarks"""
+    timer = Timer(
+        enabled=True,
+        target_position=100,
+        repeat=TimerRepeat.MONDAY | TimerRepeat.FRIDAY,
+        minutes=15,
+    )
+    timer.hours = 7
+    return timer
+
+
+SEASON = Season(
+    season_id=1,
+    is_enabled=True,
+    light_switch_state=SeasonLightSwitchState.OPEN2OPEN_CLOSE2CLOSE,
+    light_value_to_open=SeasonLightLevel.LUX_500,
+    light_value_to_close=SeasonLightLevel.LUX_20,
+    start_hour=6,
+    start_minute=0,
+    end_hour=22,
+    end_minute=30,
+)
+
+REQUESTS = {
+    MessageType.PASSWORD: lambda: Message.prepare(MessageType.PASSWORD, pin=1234),
+    MessageType.PASSWORD_CHANGE: lambda: Message.prepare(
+        MessageType.PASSWORD_CHANGE, pin=4321
+    ),
+    MessageType.UPDATE_NAME: lambda: Message.prepare(
+        MessageType.UPDATE_NAME, new_name="Living room"
+    ),
+    MessageType.CONTROL_DIRECT: lambda: Message.prepare(
+        MessageType.CONTROL_DIRECT, action=ContentControlDirect.OPEN
+    ),
+    MessageType.UPDATE_DEVICE_TIME: lambda: Message.prepare(
+        MessageType.UPDATE_DEVICE_TIME,
+        day_of_week=DayOfWeek.MONDAY,
+        hour=12,
+        minute=30,
+        second=0,
+    ),
+    MessageType.REQUEST_SETTINGS: lambda: Message.prepare(MessageType.REQUEST_SETTINGS),
+    MessageType.REQUEST_BATTERY_STATUS: lambda: Message.prepare(
+        MessageType.REQUEST_BATTERY_STATUS
+    ),
+    MessageType.REQUEST_ILLUMINANCE: lambda: Message.prepare(
+        MessageType.REQUEST_ILLUMINANCE
+    ),
+    MessageType.REQUEST_POSITION: lambda: Message.prepare(MessageType.REQUEST_POSITION),
+    MessageType.UPDATE_TIMER: lambda: Message.prepare(
+        MessageType.UPDATE_TIMER,
+        message=UpdateTimer(
+            timer_id=1, action=UpdateTimerAction.UPDATE, timer=make_timer()
+        ),
+    ),
+    MessageType.CONTROL_POSITION: lambda: Message.prepare(
+        MessageType.CONTROL_POSITION, position=42
+    ),
+    MessageType.UPDATE_LIMIT_OR_RESET: lambda: Message.prepare(
+        MessageType.UPDATE_LIMIT_OR_RESET,
+        command=LimitCommand.SAVE,
+        limit_mode=SetLimitMode.TOP,
+    ),
+    MessageType.UPDATE_SEASON: lambda: Message.prepare(
+        MessageType.UPDATE_SEASON, message=UpdateSeason(SEASON)
+    ),
+    MessageType.UPDATE_SETTINGS: lambda: Message.prepare(
+        MessageType.UPDATE_SETTINGS,
+        device_type=DeviceType.ROLLER_SHADE,
+        buttons_mode=ButtonsMode.INCHING,
+        direction=Direction.FORWARD,
+        speed=30,
+        length=1200,
+        wheel_gear_diameter=WheelGearDiameter.DIAMETER_18MM,
+    ),
+    MessageType.REQUEST_SPEED: lambda: Message.prepare(MessageType.REQUEST_SPEED),
+    MessageType.FAULT: lambda: Message.prepare(
+        MessageType.FAULT, operation_result=True
+    ),
+}
+
+
+def bench(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def main(number: int = 500):
+    print(
+        f"{'message type':<24}{'construct, us':>16}{'compiled, us':>16}{'speedup':>10}"
+    )
+    for message_type, prepare in REQUESTS.items():
+        construct_time = bench(lambda: message_format.build(prepare()), number)
+        compiled_time = bench(lambda: compiled_message_format.build(prepare()), number)
+        print(
+            f"{message_type.name:<24}{construct_time * 1e6:>16.1f}"
+            f"{compiled_time * 1e6:>16.1f}{construct_time / compiled_time:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Replay throughput of a wire capture, per decoder.
+
+Replays the capture given on the command line, or a synthetic one of every
+request and its replies repeated `COUNT` times, notified in `FRAGMENT_SIZE`
+chunks.
+
+    poetry run python benchmarks/replay.py [am43.cap]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from message_build import REQUESTS, SEASON, make_timer
+
+from am43_bleak.capture import CaptureReader, CaptureWriter, FrameKind, replay
+from am43_bleak.codec import compiled_message_format
+from am43_bleak.protocol import message_format
+from am43_bleak.records import RecordFormat
+from am43_bleak.simulator import SimulatedDevice
+
+COUNT = 1000
+FRAGMENT_SIZE = 20
+
+DECODERS = {
+    "construct": message_format,
+    "compiled": compiled_message_format,
+    "record": RecordFormat(),
+}
+
+
+def write_capture(path: str):
+    device = SimulatedDevice("02:00:00:00:00:01", require_authentication=False)
+    device.state.timers[0] = make_timer()
+    device.state.timers[1] = make_timer()
+    device.state.summer = SEASON
+
+    exchanges = []
+    for prepare in REQUESTS.values():
+        request = prepare()
+        replies = b"".join(
+            compiled_message_format.build(reply) for reply in device.handle(request)
+        )
+        exchanges.append((compiled_message_format.build(request), replies))
+
+    with CaptureWriter(path) as recorder:
+        for _ in range(COUNT):
+            for request, replies in exchanges:
+                recorder.record(device.address, FrameKind.SENT, request)
+                for i in range(0, len(replies), FRAGMENT_SIZE):
+                    recorder.record(
+                        device.address,
+                        FrameKind.RECEIVED,
+                        replies[i : i + FRAGMENT_SIZE],
+                    )
+
+
+def main():
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        fd, path = tempfile.mkstemp(suffix=".cap")
+        os.close(fd)
+        os.remove(path)
+        write_capture(path)
+
+    with CaptureReader(path) as reader:
+        frames = sum(1 for _ in reader)
+    print(f"{path}: {os.path.getsize(path)} bytes, {frames} frames")
+
+    for name, decoder in DECODERS.items():
+        started = time.perf_counter()
+        messages = sum(len(m) for _, m in replay(path, decoder))
+        elapsed = time.perf_counter() - started
+        print(
+            f"{name:<10} {messages:>8} messages {elapsed:8.3f} s "
+            f"{messages / elapsed:>10.0f} messages/s"
+        )
+
+    if len(sys.argv) == 1:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""Benchmark suite: message preparation, codecs and command round trips.
+
+Covers `Message.prepare()` for every request type, build and parse of every
+request and response message class with both `message_format` and the
+compiled codec, and command round trips of `AM43Client` against a simulated
+device without any latency, i.e. the client overhead alone.
+
+Every measurement is taken together with a fixed pure-Python workload, and
+reported relative to it, so that the speed of the machine (or a noisy
+neighbour at the time) cancels out. The suite is run several times: a
+baseline keeps the slowest result of every benchmark, a comparison the
+fastest one, and anything slower than the baseline by more than the
+tolerance is reported and makes the run fail.
+
+The baseline is committed in `baseline.json`, and the CI compares every
+change against it. Record it again when a change makes something faster on
+purpose, or a slower result is accepted:
+
+    poetry run python benchmarks/suite.py --save-baseline
+    poetry run python benchmarks/suite.py --output results.json
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+
+from message_build import REQUESTS, SEASON, make_timer
+
+from am43_bleak.client import AM43Client
+from am43_bleak.codec import compiled_message_format
+from am43_bleak.protocol import MessageType, message_format
+from am43_bleak.simulator import SimulatedBleakClient, SimulatedDevice
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_TOLERANCE = 0.25
+# Runs of the suite when recording a baseline, and when comparing with it
+BASELINE_RUNS = 3
+COMPARE_RUNS = 2
+
+# Seconds every measurement should take, and how many are taken
+TARGET_TIME = 0.02
+REPEAT = 5
+
+CODECS = {
+    "construct": message_format,
+    "compiled": compiled_message_format,
+}
+
+
+def _calibration():
+    # Fixed pure-Python workload the results are relative to
+    sum(i * i for i in range(1000))
+
+
+_calibration_timer = timeit.Timer(_calibration)
+
+
+@functools.lru_cache(maxsize=None)
+def _calibration_estimate() -> float:
+    number, elapsed = _calibration_timer.autorange()
+    return elapsed / number
+
+
+def _calibrate(duration: float) -> float:
+    """Seconds per calibration workload, measured for about `duration`"""
+    number = max(1, int(duration / _calibration_estimate()))
+    return _calibration_timer.timeit(number) / number
+
+
+def measure(func) -> float:
+    """Time per call of `func`, relative to the calibration workload.
+
+    Both are measured alternately, and the best of the repetitions is taken.
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while (elapsed := timer.timeit(number)) < TARGET_TIME / 10:
+        number *= 10
+    number = max(1, int(number * TARGET_TIME / elapsed))
+
+    best = calibration = float("inf")
+    for _ in range(REPEAT):
+        calibration = min(calibration, _calibrate(TARGET_TIME))
+        best = min(best, timer.timeit(number) / number)
+    return best / calibration
+
+
+def _device() -> SimulatedDevice:
+    device = SimulatedDevice("02:00:00:00:00:01", require_authentication=False)
+    device.state.timers[0] = make_timer()
+    device.state.summer = SEASON
+    return device
+
+
+def _sample_messages() -> dict:
+    """name -> sample message, for every request and response message class"""
+    device = _device()
+    ret = {}
+    for message_type, prepare in REQUESTS.items():
+        message = prepare()
+        ret[f"request.{message_type.name}.{type(message.payload.message).__name__}"] = (
+            message
+        )
+        for response in device.handle(message):
+            response_type = MessageType(response.payload.message_type)
+            name = type(response.payload.message).__name__
+            ret[f"response.{response_type.name}.{name}"] = response
+
+    return ret
+
+
+def bench_prepare(results: dict):
+    for message_type, prepare in REQUESTS.items():
+        results[f"prepare.{message_type.name}"] = measure(prepare)
+
+
+def bench_codecs(results: dict):
+    for name, message in _sample_messages().items():
+        frame = message_format.build(message)
+        for codec_name, codec in CODECS.items():
+            results[f"build.{codec_name}.{name}"] = measure(
+                lambda: codec.build(message)
+            )
+            results[f"parse.{codec_name}.{name}"] = measure(lambda: codec.parse(frame))
+
+
+async def _bench_round_trips(results: dict, count: int):
+    device = _device()
+    async with AM43Client(
+        device.ble_device(), client=SimulatedBleakClient(device)
+    ) as client:
+        commands = {
+            "set_position": lambda: client.set_position(42),
+            "get_battery_level": client.get_battery_level,
+            "get_settings": client.get_settings,
+            # Different message types in flight at the same time
+            "pipelined_4": lambda: asyncio.gather(
+                client.set_position(42),
+                client.get_battery_level(),
+                client.get_illuminance(),
+                client.get_settings(),
+            ),
+        }
+
+        for name, command in commands.items():
+            await command()  # warm-up
+            best = calibration = float("inf")
+            for _ in range(REPEAT):
+                started = time.perf_counter()
+                for _ in range(count):
+                    await command()
+                elapsed = time.perf_counter() - started
+                calibration = min(calibration, _calibrate(elapsed))
+                best = min(best, elapsed / count)
+            results[f"roundtrip.{name}"] = best / calibration
+
+
+def bench_round_trips(results: dict, count: int = 100):
+    asyncio.run(_bench_round_trips(results, count))
+
+
+def run_once() -> dict:
+    results = {}
+    bench_prepare(results)
+    bench_codecs(results)
+    bench_round_trips(results)
+    return results
+
+
+def run(runs: int, aggregate=min) -> dict:
+    """Runs the suite `runs` times, aggregating the results of each benchmark"""
+    all_results = [run_once() for _ in range(runs)]
+    return {
+        name: aggregate(results[name] for results in all_results)
+        for name in all_results[0]
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns (name, baseline, current) of the regressions"""
+    return [
+        (name, baseline[name], value)
+        for name, value in sorted(results.items())
+        if name in baseline and value > baseline[name] * (1 + tolerance)
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="file to write the results to")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        help=f"runs of the suite (default: {BASELINE_RUNS} when saving "
+        f"the baseline, {COMPARE_RUNS} otherwise)",
+    )
+    args = parser.parse_args()
+
+    if args.save_baseline:
+        runs, aggregate = args.runs or BASELINE_RUNS, max
+    else:
+        runs, aggregate = args.runs or COMPARE_RUNS, min
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": run(runs, aggregate),
+    }
+    for name, value in sorted(report["results"].items()):
+        print(f"{name:<72}{value:>12.4f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+
+    regressions = compare(report["results"], baseline, args.tolerance)
+    for name, before, after in regressions:
+        print(
+            f"REGRESSION {name}: {before:.4f} -> {after:.4f} "
+            f"({after / before - 1:+.0%})"
+        )
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Connection-free monitoring of devices through their advertisements.
+
+AM43 devices advertise `SERVICE_UUID` along with the local name; any
+service or manufacturer data they include is kept as-is, since its layout is
+not known. Repeated advertisements are deduplicated, an update is emitted
+only when the content changes, or the RSSI moves by `rssi_threshold` dB.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+import typing
+
+from bleak import BleakScanner
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+from bluetooth_data_tools import human_readable_name
+from bluetooth_sensor_state_data import BluetoothData
+
+from .const import DEFAULT_SCAN_TIMEOUT, SERVICE_UUID
+
+DEFAULT_RSSI_THRESHOLD = 5
+
+
+@dataclass(frozen=True)
+class AM43Advertisement:
+    address: str
+    name: str
+    rssi: int
+    # Content of the advertisement as received, the layout is unknown
+    service_data: typing.Optional[bytes] = None
+    manufacturer_data: typing.Mapping[int, bytes] = field(default_factory=dict)
+    # Everything but the RSSI, to tell whether anything has changed
+    content: tuple = field(default=(), repr=False)
+
+
+def is_am43(advertisement_data: AdvertisementData) -> bool:
+    return (
+        SERVICE_UUID in advertisement_data.service_uuids
+        or SERVICE_UUID in advertisement_data.service_data
+    )
+
+
+def parse_advertisement(
+    device: BLEDevice, advertisement_data: AdvertisementData
+) -> typing.Optional[AM43Advertisement]:
+    """Returns the device state carried by the advertisement, if it's an AM43"""
+    if not is_am43(advertisement_data):
+        return None
+
+    name = human_readable_name(
+        device.name, advertisement_data.local_name or "AM43", device.address
+    )
+    service_data = advertisement_data.service_data.get(SERVICE_UUID)
+    manufacturer_data = dict(advertisement_data.manufacturer_data)
+    return AM43Advertisement(
+        address=device.address,
+        name=name,
+        rssi=advertisement_data.rssi,
+        service_data=service_data,
+        manufacturer_data=manufacturer_data,
+        content=(name, service_data, tuple(sorted(manufacturer_data.items()))),
+    )
+
+
+class AM43BluetoothDeviceData(BluetoothData):
+    """`bluetooth-sensor-state-data` parser, for passive Bluetooth integrations
+    (e.g. Home Assistant) which provide `BluetoothServiceInfo`s"""
+
+    def _start_update(self, service_info):
+        if (
+            SERVICE_UUID not in service_info.service_uuids
+            and SERVICE_UUID not in service_info.service_data
+        ):
+            return
+
+        self.set_device_manufacturer("A-OK")
+        self.set_device_type("AM43")
+        name = human_readable_name(
+            None, service_info.name or "AM43", service_info.address
+        )
+        self.set_device_name(name)
+        self.set_title(name)
+
+
+class AdvertisementMonitor:
+    """Tracks the AM43 devices in range without connecting to them.
+
+    `callback` is called with every changed `AM43Advertisement`; the latest
+    one of every device is kept in `devices`. Scans through the default
+    adapter, unless another `adapter` is given.
+    """
+
+    def __init__(
+        self,
+        callback: typing.Optional[typing.Callable[[AM43Advertisement], None]] = None,
+        rssi_threshold: int = DEFAULT_RSSI_THRESHOLD,
+        scanning_mode: str = "active",
+        adapter: typing.Optional[str] = None,
+    ):
+        self.callback = callback
+        self.rssi_threshold = rssi_threshold
+        self.scanning_mode = scanning_mode
+        self.adapter = adapter
+        # address -> the latest emitted advertisement
+        self.devices: dict[str, AM43Advertisement] = {}
+        self.ble_devices: dict[str, BLEDevice] = {}
+        self._scanner: typing.Optional[BleakScanner] = None
+
+    def process(
+        self, device: BLEDevice, advertisement_data: AdvertisementData
+    ) -> typing.Optional[AM43Advertisement]:
+        """Returns the advertisement if it's new or changed, None otherwise"""
+        advertisement = parse_advertisement(device, advertisement_data)
+        if advertisement is None:
+            return None
+
+        self.ble_devices[device.address] = device
+        previous = self.devices.get(device.address)
+        if (
+            previous is not None
+            and previous.content == advertisement.content
+            and abs(previous.rssi - advertisement.rssi) < self.rssi_threshold
+        ):
+            return None
+
+        self.devices[device.address] = advertisement
+        if self.callback is not None:
+            self.callback(advertisement)
+
+        return advertisement
+
+    async def start(self):
+        kwargs = {} if self.adapter is None else {"adapter": self.adapter}
+        self._scanner = BleakScanner(
+            detection_callback=self.process,
+            service_uuids=[SERVICE_UUID],
+            scanning_mode=self.scanning_mode,
+            **kwargs,
+        )
+        await self._scanner.start()
+
+    async def stop(self):
+        scanner, self._scanner = self._scanner, None
+        if scanner is not None:
+            await scanner.stop()
+
+    async def __aenter__(self) -> "AdvertisementMonitor":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def scan(
+        self, timeout: float = DEFAULT_SCAN_TIMEOUT
+    ) -> dict[str, AM43Advertisement]:
+        """Scans for `timeout` seconds, returns the devices seen so far"""
+        async with self:
+            await asyncio.sleep(timeout)
+
+        return dict(self.devices)
+
+
+async def discover(
+    timeout: float = DEFAULT_SCAN_TIMEOUT,
+) -> dict[str, AM43Advertisement]:
+    return await AdvertisementMonitor().scan(timeout)
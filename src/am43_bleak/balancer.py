@@ -0,0 +1,164 @@
+"""Placement of the devices on several HCI adapters.
+
+A device in range of a few adapters is seen by each of them, and BlueZ ties
+every `BLEDevice` to the adapter it was seen by; the adapter to connect
+through is chosen by picking one of these. `AdapterBalancer` keeps the
+latest sighting of every device by every adapter, and picks the one with
+the best score: the smoothed RSSI, less `load_penalty` dB for every
+connection already open through the adapter. An adapter failing to connect
+to the device `failover_threshold` times in a row is skipped for
+`failover_timeout` seconds.
+
+    balancer = AdapterBalancer()
+    await balancer.start(["hci0", "hci1"])
+    pool = ConnectionPool(balancer=balancer)
+"""
+
+from dataclasses import dataclass
+import time
+import typing
+
+from bleak import BleakScanner
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+from .advertisement import is_am43
+from .const import SERVICE_UUID
+
+# RSSI dB an open connection is worth, how far a busy adapter is avoided
+DEFAULT_LOAD_PENALTY = 10
+# Seconds a sighting is used for
+DEFAULT_MAX_AGE = 300
+DEFAULT_FAILOVER_THRESHOLD = 2
+DEFAULT_FAILOVER_TIMEOUT = 60
+# Weight of a new RSSI sample in the smoothed value
+RSSI_ALPHA = 0.3
+
+
+@dataclass
+class Sighting:
+    device: BLEDevice
+    # Smoothed RSSI
+    rssi: float
+    # time.monotonic() of the latest advertisement
+    seen_at: float
+    # Connection failures in a row, and time.monotonic() of the last one
+    failures: int = 0
+    failed_at: typing.Optional[float] = None
+
+
+class AdapterBalancer:
+    def __init__(
+        self,
+        load_penalty: float = DEFAULT_LOAD_PENALTY,
+        max_age: float = DEFAULT_MAX_AGE,
+        failover_threshold: int = DEFAULT_FAILOVER_THRESHOLD,
+        failover_timeout: float = DEFAULT_FAILOVER_TIMEOUT,
+    ):
+        self.load_penalty = load_penalty
+        self.max_age = max_age
+        self.failover_threshold = failover_threshold
+        self.failover_timeout = failover_timeout
+        # address -> adapter -> Sighting
+        self._sightings: dict[str, dict[str, Sighting]] = {}
+        self._scanners: list[BleakScanner] = []
+
+    def observe(self, device: BLEDevice, rssi: int, adapter: str):
+        """Records the device as seen by the adapter"""
+        now = time.monotonic()
+        sightings = self._sightings.setdefault(device.address, {})
+        sighting = sightings.get(adapter)
+        if sighting is None or now - sighting.seen_at > self.max_age:
+            failures = sighting.failures if sighting is not None else 0
+            failed_at = sighting.failed_at if sighting is not None else None
+            sightings[adapter] = Sighting(device, rssi, now, failures, failed_at)
+            return
+
+        sighting.device = device
+        sighting.rssi += RSSI_ALPHA * (rssi - sighting.rssi)
+        sighting.seen_at = now
+
+    def _process(
+        self, adapter: str, device: BLEDevice, advertisement_data: AdvertisementData
+    ):
+        if is_am43(advertisement_data):
+            self.observe(device, advertisement_data.rssi, adapter)
+
+    async def start(self, adapters: typing.Iterable[str]):
+        """Scans through every adapter"""
+        for adapter in adapters:
+            scanner = BleakScanner(
+                detection_callback=lambda d, a, adapter=adapter: self._process(
+                    adapter, d, a
+                ),
+                service_uuids=[SERVICE_UUID],
+                adapter=adapter,
+            )
+            await scanner.start()
+            self._scanners.append(scanner)
+
+    async def stop(self):
+        scanners, self._scanners = self._scanners, []
+        for scanner in scanners:
+            await scanner.stop()
+
+    def _is_failing(self, sighting: Sighting, now: float) -> bool:
+        return (
+            sighting.failures >= self.failover_threshold
+            and now - sighting.failed_at < self.failover_timeout
+        )
+
+    def choose(
+        self,
+        device: BLEDevice,
+        loads: typing.Mapping[str, int],
+        max_connections: typing.Optional[int] = None,
+    ) -> BLEDevice:
+        """The device as seen by the adapter to connect through, `device`
+        itself if it wasn't seen lately.
+
+        `loads` are the connections open per adapter; full adapters are only
+        chosen if all of them are, failing ones if all of them are failing.
+        """
+        now = time.monotonic()
+        candidates = [
+            (adapter, sighting)
+            for adapter, sighting in self._sightings.get(device.address, {}).items()
+            if now - sighting.seen_at <= self.max_age
+        ]
+        if not candidates:
+            return device
+
+        working = [c for c in candidates if not self._is_failing(c[1], now)]
+        candidates = working or candidates
+        if max_connections is not None:
+            free = [c for c in candidates if loads.get(c[0], 0) < max_connections]
+            candidates = free or candidates
+
+        _, sighting = max(
+            candidates,
+            key=lambda c: c[1].rssi - self.load_penalty * loads.get(c[0], 0),
+        )
+        return sighting.device
+
+    def _sighting(self, address: str, adapter: str) -> typing.Optional[Sighting]:
+        return self._sightings.get(address, {}).get(adapter)
+
+    def on_connect_success(self, address: str, adapter: str):
+        sighting = self._sighting(address, adapter)
+        if sighting is not None:
+            sighting.failures = 0
+            sighting.failed_at = None
+
+    def on_connect_failure(self, address: str, adapter: str):
+        sighting = self._sighting(address, adapter)
+        if sighting is not None:
+            sighting.failures += 1
+            sighting.failed_at = time.monotonic()
+
+    def adapters(self, address: str) -> dict[str, float]:
+        """Adapter -> smoothed RSSI the device is seen with"""
+        return {
+            adapter: sighting.rssi
+            for adapter, sighting in self._sightings.get(address, {}).items()
+        }
@@ -0,0 +1,331 @@
+"""Bulk decoding of captured frames into columns.
+
+Frames are grouped by message type, all checksums of a group are verified at
+once, and every group of fixed-size messages is decoded into one column per
+field instead of one dataclass per frame. Columns contain the raw values as
+they are stored in the frames, i.e. enums are plain integers.
+
+NumPy is used when it's installed (`am43-bleak[numpy]`), the results are
+`numpy.ndarray`s then; otherwise `array.array`s are returned.
+"""
+
+from array import array
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import reduce
+from operator import xor
+import typing
+
+from .codec import (
+    FOOTER_FAILURE,
+    FOOTER_SUCCESS,
+    FOOTERS,
+    HEADER,
+    RESULT_MESSAGE_TYPES,
+    DataclassCodec,
+    compiled_message_format,
+)
+from .protocol import CLIENT_MESSAGE_TAG, MessageType
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+Frames = typing.Union[typing.Sequence[bytes], bytes, bytearray, memoryview]
+
+
+@dataclass
+class MessageGroup:
+    message_type: MessageType
+    is_device_response: bool
+    # Positions of the decoded frames in the batch
+    indices: typing.Any
+    # Field name -> values, for fixed-size messages
+    columns: dict = field(default_factory=dict)
+    # Decoded messages, for the messages which can't be split into columns
+    messages: list = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+
+@dataclass
+class FrameBatch:
+    # (message_type, is_device_response) -> MessageGroup
+    groups: dict
+    # Positions of frames with a broken structure, checksum or footer
+    invalid: list
+
+    def column(
+        self, message_type: MessageType, name: str, is_device_response: bool = True
+    ) -> typing.Any:
+        group = self.groups.get((message_type, is_device_response))
+        if group is None:
+            return _empty_column()
+        return group.columns[name]
+
+    @property
+    def positions(self) -> typing.Any:
+        return self.column(MessageType.REQUEST_SETTINGS, "current_position")
+
+    @property
+    def battery_levels(self) -> typing.Any:
+        return self.column(MessageType.REQUEST_BATTERY_STATUS, "level")
+
+    @property
+    def illuminance_levels(self) -> typing.Any:
+        return self.column(MessageType.REQUEST_ILLUMINANCE, "level")
+
+
+def _empty_column() -> typing.Any:
+    return numpy.empty(0, dtype=numpy.uint16) if numpy else array("H")
+
+
+def split_frames(buffer: typing.Union[bytes, bytearray, memoryview]) -> list:
+    """Splits a buffer of back-to-back frames, e.g. a capture, into frames"""
+    view = memoryview(buffer)
+    tag_size = len(CLIENT_MESSAGE_TAG)
+    ret = []
+    position = 0
+    while position < len(view):
+        header = position
+        if view[position : position + tag_size] == CLIENT_MESSAGE_TAG:
+            header += tag_size
+        if header + 2 >= len(view) or view[header] != HEADER:
+            raise ValueError(f"No frame found at offset {position}")
+
+        end = header + 4 + view[header + 2]
+        ret.append(view[position:end])
+        position = end
+
+    return ret
+
+
+def _result_footer(codec: DataclassCodec, body: bytes) -> typing.Optional[int]:
+    """Footer of a result message with the given body, None if it's broken"""
+    try:
+        is_success = codec.decode(body).is_success
+    except Exception:
+        return None
+    return FOOTER_SUCCESS[0] if is_success else FOOTER_FAILURE[0]
+
+
+def _const_slots(codec: DataclassCodec) -> list:
+    """(position, constant) of the constant fields of a byte-aligned codec"""
+    ret = []
+    position = 0
+    for f in codec.fields:
+        if f.kind == "const":
+            ret.append((position, f.const))
+        position += f.width
+    return ret
+
+
+def _is_frame_valid(
+    frame, offset: int, is_result: bool, codec: typing.Optional[DataclassCodec]
+) -> bool:
+    footer = frame[-1]
+    if codec is None:
+        if reduce(xor, frame[offset:-1], 0) == footer:
+            return True
+        return is_result and footer in FOOTERS
+
+    body = bytes(frame[offset + 3 : -1])
+    if is_result:
+        if footer != _result_footer(codec, body):
+            return False
+    elif reduce(xor, frame[offset:-1], 0) != footer:
+        return False
+
+    return all(
+        body[position : position + len(const)] == const
+        for position, const in _const_slots(codec)
+    )
+
+
+def _validate(
+    frames: list,
+    offset: int,
+    is_result: bool,
+    codec: typing.Optional[DataclassCodec] = None,
+) -> tuple:
+    """Returns validity of each frame and the frames as a matrix, if possible.
+
+    Without a codec result footers are only checked to be one of `FOOTERS`,
+    the frames are verified when they're decoded. With a columnar codec the
+    footers must match the decoded results, and constant fields their values.
+    """
+    if numpy is None:
+        return [_is_frame_valid(f, offset, is_result, codec) for f in frames], None
+
+    matrix = numpy.frombuffer(b"".join(frames), dtype=numpy.uint8).reshape(
+        len(frames), -1
+    )
+    footers = matrix[:, -1]
+    bodies = matrix[:, offset + 3 : -1]
+    if codec is not None and is_result:
+        rows, inverse = numpy.unique(bodies, axis=0, return_inverse=True)
+        expected = [_result_footer(codec, row.tobytes()) for row in rows]
+        expected = numpy.array(
+            [-1 if f is None else f for f in expected], dtype=numpy.int16
+        )
+        valid = expected[inverse.reshape(-1)] == footers
+    else:
+        valid = numpy.bitwise_xor.reduce(matrix[:, offset:-1], axis=1) == footers
+        if is_result:
+            valid |= numpy.isin(footers, FOOTERS)
+
+    if codec is not None:
+        for position, const in _const_slots(codec):
+            expected = numpy.frombuffer(const, dtype=numpy.uint8)
+            valid &= (bodies[:, position : position + len(const)] == expected).all(
+                axis=1
+            )
+
+    return valid, matrix[valid]
+
+
+def _columnar_codec(message_type: int, is_device_response: bool):
+    codec_map = compiled_message_format.codecs[is_device_response]
+    codecs = codec_map.get(message_type)
+    if codecs is None or len(codecs) != 1 or codec_map.has_raw_fallback(message_type):
+        return None
+
+    codec = codecs[0]
+    if codec.size is None or any(
+        f.kind not in (None, "int", "flag", "bytes", "const") for f in codec.fields
+    ):
+        return None
+    if codec.bitwise and codec.size > 8:
+        return None
+
+    return codec
+
+
+def _extract_columns(codec: DataclassCodec, bodies, matrix) -> dict:
+    """Splits the message bodies into one column per integer/flag field"""
+    columns = {}
+    position = 0
+    size = codec.size * (8 if codec.bitwise else 1)
+
+    if codec.bitwise:
+        if matrix is not None:
+            values = numpy.zeros(len(matrix), dtype=numpy.uint64)
+            for i in range(codec.size):
+                values = (values << numpy.uint64(8)) | matrix[:, i]
+        else:
+            values = [int.from_bytes(body, "big") for body in bodies]
+
+    for f in codec.fields:
+        if f.kind is None:
+            continue
+
+        if f.kind in ("int", "flag"):
+            if codec.bitwise:
+                shift = size - position - f.width
+                mask = (1 << f.width) - 1
+                if matrix is not None:
+                    column = (values >> numpy.uint64(shift)) & numpy.uint64(mask)
+                    column = column.astype(numpy.uint16)
+                else:
+                    column = array("H", [(v >> shift) & mask for v in values])
+            elif matrix is not None:
+                column = matrix[:, position].astype(numpy.uint16)
+                if f.width == 2:
+                    column = (column << 8) | matrix[:, position + 1]
+            else:
+                column = array(
+                    "H",
+                    [
+                        int.from_bytes(body[position : position + f.width], "big")
+                        for body in bodies
+                    ],
+                )
+
+            if f.kind == "flag":
+                column = column != 0 if matrix is not None else array("B", column)
+
+            columns[f.name] = column
+
+        position += f.width
+
+    return columns
+
+
+def decode_batch(frames: Frames) -> FrameBatch:
+    if isinstance(frames, (bytes, bytearray, memoryview)):
+        frames = split_frames(frames)
+
+    tag_size = len(CLIENT_MESSAGE_TAG)
+    # (message_type, is_device_response) -> frame length -> frame positions
+    layouts = defaultdict(lambda: defaultdict(list))
+    invalid = []
+    for i, frame in enumerate(frames):
+        offset = tag_size if frame[:tag_size] == CLIENT_MESSAGE_TAG else 0
+        if (
+            len(frame) < offset + 4
+            or frame[offset] != HEADER
+            or len(frame) != offset + 4 + frame[offset + 2]
+        ):
+            invalid.append(i)
+            continue
+
+        layouts[(frame[offset + 1], offset == 0)][len(frame)].append(i)
+
+    groups = {}
+    for (message_type, is_device_response), lengths in layouts.items():
+        offset = 0 if is_device_response else tag_size
+        is_result = (message_type, is_device_response) in RESULT_MESSAGE_TYPES
+        group = MessageGroup(MessageType(message_type), is_device_response, [])
+
+        codec = _columnar_codec(message_type, is_device_response)
+        if codec is not None:
+            # Fixed-size messages of any other size can't be decoded
+            length = offset + 4 + codec.size
+            for other_length, indices in lengths.items():
+                if other_length != length:
+                    invalid.extend(indices)
+
+            indices = lengths.get(length)
+            if not indices:
+                continue
+
+            group_frames = [bytes(frames[i]) for i in indices]
+            valid, matrix = _validate(group_frames, offset, is_result, codec)
+            invalid.extend(i for i, v in zip(indices, valid) if not v)
+            group.indices = [i for i, v in zip(indices, valid) if v]
+            group.columns = _extract_columns(
+                codec,
+                [f[offset + 3 : -1] for f, v in zip(group_frames, valid) if v],
+                matrix[:, offset + 3 : -1] if matrix is not None else None,
+            )
+        else:
+            decoded = []
+            for indices in lengths.values():
+                group_frames = [bytes(frames[i]) for i in indices]
+                valid, _ = _validate(group_frames, offset, is_result)
+                for i, frame, v in zip(indices, group_frames, valid):
+                    try:
+                        if not v:
+                            raise ValueError("Wrong checksum")
+                        decoded.append(
+                            (i, compiled_message_format.parse(frame).payload.message)
+                        )
+                    except Exception:
+                        invalid.append(i)
+
+            decoded.sort(key=lambda item: item[0])
+            group.indices = [i for i, _ in decoded]
+            group.messages = [message for _, message in decoded]
+
+        if group.indices:
+            group.indices = (
+                numpy.array(group.indices, dtype=numpy.int64)
+                if numpy
+                else array("q", group.indices)
+            )
+            groups[(group.message_type, is_device_response)] = group
+
+    invalid.sort()
+    return FrameBatch(groups=groups, invalid=invalid)
@@ -0,0 +1,154 @@
+import asyncio
+from contextlib import AbstractAsyncContextManager
+import time
+import typing
+
+from bleak.backends.device import BLEDevice
+
+from .client import AM43Client
+from .protocol import Message, MessageType
+
+Connect = typing.Callable[[BLEDevice], AbstractAsyncContextManager[AM43Client]]
+
+# Seconds a value is considered fresh, unless invalidated by a write
+DEFAULT_TTLS = {
+    MessageType.REQUEST_SETTINGS: 30,
+    MessageType.REQUEST_BATTERY_STATUS: 300,
+    MessageType.REQUEST_ILLUMINANCE: 10,
+    MessageType.LIST_TIMERS: 3600,
+    MessageType.LIST_SEASONS: 3600,
+}
+
+# Timers and seasons are only sent by the device along with the settings
+FETCH_MESSAGE_TYPES = {
+    MessageType.LIST_TIMERS: MessageType.REQUEST_SETTINGS,
+    MessageType.LIST_SEASONS: MessageType.REQUEST_SETTINGS,
+}
+
+# Cached values made outdated by a successful command
+INVALIDATED_MESSAGE_TYPES = {
+    MessageType.UPDATE_SETTINGS: (MessageType.REQUEST_SETTINGS,),
+    MessageType.UPDATE_TIMER: (MessageType.LIST_TIMERS,),
+    MessageType.UPDATE_SEASON: (MessageType.LIST_SEASONS,),
+    # The name isn't part of any cached value
+    MessageType.UPDATE_NAME: (),
+    # Position, and the limits for the calibration
+    MessageType.CONTROL_DIRECT: (MessageType.REQUEST_SETTINGS,),
+    MessageType.CONTROL_POSITION: (MessageType.REQUEST_SETTINGS,),
+    MessageType.UPDATE_LIMIT_OR_RESET: tuple(DEFAULT_TTLS),
+}
+
+
+class StateCache:
+    """Device state shared by many consumers.
+
+    Values are cached per device and message type for the TTL of the type,
+    and concurrent reads of the same value share a single request. Commands
+    sent through `request()` invalidate the values they change. The devices
+    are connected through `connect` (e.g. `ConnectionPool.acquire`) only when
+    a value has to be fetched.
+    """
+
+    def __init__(
+        self,
+        connect: Connect,
+        ttls: typing.Optional[typing.Mapping[MessageType, float]] = None,
+    ):
+        self.connect = connect
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        # (address, message_type) -> (value, expires at)
+        self._values: dict[tuple, tuple] = {}
+        # (address, message_type) -> incremented by every invalidation
+        self._generations: dict[tuple, int] = {}
+        # (address, fetched message_type) -> task of the request in flight, and
+        # the generations of the values when it was started
+        self._in_flight: dict[tuple, tuple[asyncio.Task, dict]] = {}
+
+    async def get(self, device: BLEDevice, message_type: MessageType) -> typing.Any:
+        """Returns the message content, e.g. `SettingsResponse`"""
+        if message_type not in self.ttls:
+            raise KeyError(f"{message_type!r} is not cacheable")
+
+        key = (device.address, message_type)
+        cached = self._values.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+
+        fetch_type = FETCH_MESSAGE_TYPES.get(message_type, message_type)
+        fetch_key = (device.address, fetch_type)
+        task, generations = self._in_flight.get(fetch_key, (None, None))
+        # A request started before the value was invalidated may return the
+        # outdated value, it's only joined if started afterwards
+        if task is None or generations[message_type] != self._generations.get(key, 0):
+            message_types = (fetch_type,) + tuple(
+                t for t, f in FETCH_MESSAGE_TYPES.items() if f == fetch_type
+            )
+            generations = {
+                t: self._generations.get((device.address, t), 0) for t in message_types
+            }
+            task = asyncio.ensure_future(self._fetch(device, fetch_type, generations))
+            self._in_flight[fetch_key] = (task, generations)
+            task.add_done_callback(lambda _: self._on_fetched(fetch_key, task))
+
+        # A cancelled reader doesn't cancel the request for the others
+        return (await asyncio.shield(task))[message_type]
+
+    def _on_fetched(self, fetch_key: tuple, task: asyncio.Task):
+        in_flight = self._in_flight.get(fetch_key)
+        if in_flight is not None and in_flight[0] is task:
+            del self._in_flight[fetch_key]
+
+    async def _fetch(
+        self, device: BLEDevice, fetch_type: MessageType, generations: dict
+    ) -> dict:
+        async with self.connect(device) as client:
+            if fetch_type == MessageType.REQUEST_SETTINGS:
+                settings = await client.get_settings()
+                values = {
+                    MessageType.REQUEST_SETTINGS: settings.settings,
+                    MessageType.LIST_TIMERS: settings.timers,
+                    MessageType.LIST_SEASONS: settings.seasons,
+                }
+            else:
+                response = await client.request(fetch_type)
+                values = {fetch_type: response.payload.message}
+
+        now = time.monotonic()
+        for message_type, value in values.items():
+            key = (device.address, message_type)
+            # Invalidated while the request was in flight, the value may be
+            # already outdated
+            if self._generations.get(key, 0) == generations[message_type]:
+                self._values[key] = (value, now + self.ttls[message_type])
+
+        return values
+
+    def invalidate(self, address: str, *message_types: MessageType):
+        """Drops the cached values, all of the device if no types are given"""
+        for message_type in message_types or tuple(self.ttls):
+            key = (address, message_type)
+            self._values.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        for address, message_type in list(self._values):
+            self.invalidate(address, message_type)
+
+    async def request(
+        self, device: BLEDevice, message_type: MessageType, **kwargs
+    ) -> Message:
+        """Sends a command, invalidating the cached values it changes"""
+        invalidated = INVALIDATED_MESSAGE_TYPES.get(message_type, ())
+        try:
+            async with self.connect(device) as client:
+                response = await client.request(message_type, **kwargs)
+        except BaseException:
+            # The command may have been applied nevertheless
+            if invalidated:
+                self.invalidate(device.address, *invalidated)
+            raise
+
+        if invalidated:
+            self.invalidate(device.address, *invalidated)
+
+        return response
@@ -0,0 +1,208 @@
+"""Wire capture: an append-only log of the raw frames, and its replay.
+
+The log starts with a header (magic, version and the wall-clock start time),
+followed by records of a fixed 13-byte header and the data:
+
+    microseconds since the start  u64
+    device index                  u16
+    kind                          u8   (sent, received, or a device)
+    length                        u16
+    data
+
+Addresses are written once, in a `DEVICE` record declaring the index. The
+received data is stored exactly as notified, fragments included, so the
+replay goes through `StreamDecoder` the same way the live traffic does.
+
+    with CaptureWriter("am43.cap") as recorder:
+        client = AM43Client(device, recorder=recorder)
+        ...
+
+    for frame, messages in replay("am43.cap"):
+        ...
+"""
+
+import asyncio
+import enum
+import mmap
+import os
+import struct
+import time
+import typing
+
+from .codec import compiled_message_format
+from .protocol import Message
+from .stream import StreamDecoder
+
+MAGIC = b"AM43CAP\x00"
+VERSION = 1
+
+# magic, version, reserved, start time (seconds since the epoch)
+FILE_HEADER = struct.Struct("<8sHHd")
+# microseconds since the start, device index, kind, length
+RECORD_HEADER = struct.Struct("<QHBH")
+
+
+class FrameKind(enum.IntEnum):
+    SENT = 0
+    RECEIVED = 1
+    # Declares the address of a device index
+    DEVICE = 2
+
+
+class CapturedFrame(typing.NamedTuple):
+    # Seconds since the start of the capture
+    timestamp: float
+    address: str
+    kind: FrameKind
+    # A view into the mapped file, valid while the reader is open
+    data: memoryview
+
+
+class CaptureWriter:
+    """Appends the frames to a capture file.
+
+    The file is opened for appending, a new one gets the header first.
+    Records go through a write buffer, so recording a frame is a `pack()`
+    and a copy.
+    """
+
+    def __init__(self, path: typing.Union[str, os.PathLike]):
+        self.path = path
+        self._file = open(path, "ab")
+        self._devices: dict[str, int] = {}
+        self._started = time.monotonic_ns()
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION, 0, time.time()))
+        else:
+            # Times of the appended records continue from the last one
+            with CaptureReader(path) as reader:
+                last = reader.last_timestamp
+                self._devices = dict(reader.devices)
+            self._started -= int(last * 1e9)
+
+    def _device_index(self, address: str) -> int:
+        index = self._devices.get(address)
+        if index is None:
+            index = self._devices[address] = len(self._devices)
+            self._write(index, FrameKind.DEVICE, address.encode())
+        return index
+
+    def _write(self, index: int, kind: FrameKind, data: bytes):
+        elapsed = (time.monotonic_ns() - self._started) // 1000
+        self._file.write(RECORD_HEADER.pack(elapsed, index, kind, len(data)))
+        self._file.write(data)
+
+    def record(self, address: str, kind: FrameKind, data: bytes):
+        self._write(self._device_index(address), kind, data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CaptureReader:
+    """Memory-mapped capture file, iterated without copying the data"""
+
+    def __init__(self, path: typing.Union[str, os.PathLike]):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._view = memoryview(self._mmap)
+        magic, version, _, self.started_at = FILE_HEADER.unpack_from(self._view)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        if version != VERSION:
+            raise ValueError(f"Unsupported capture version {version}")
+
+        # address -> index and back, filled while iterating
+        self.devices: dict[str, int] = {}
+        self._addresses: dict[int, str] = {}
+
+    def __iter__(self) -> typing.Iterator[CapturedFrame]:
+        view = self._view
+        offset = FILE_HEADER.size
+        size = len(view)
+        unpack = RECORD_HEADER.unpack_from
+        header_size = RECORD_HEADER.size
+
+        while offset + header_size <= size:
+            elapsed, index, kind, length = unpack(view, offset)
+            start = offset + header_size
+            offset = start + length
+            if offset > size:
+                break  # truncated by an interrupted write
+
+            data = view[start:offset]
+            if kind == FrameKind.DEVICE:
+                address = bytes(data).decode()
+                self._addresses[index] = address
+                self.devices[address] = index
+                continue
+
+            yield CapturedFrame(
+                elapsed / 1e6, self._addresses[index], FrameKind(kind), data
+            )
+
+    @property
+    def last_timestamp(self) -> float:
+        timestamp = 0.0
+        for frame in self:
+            timestamp = frame.timestamp
+        return timestamp
+
+    def close(self):
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # frames are still referenced, unmapped once they are gone
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def replay(
+    path: typing.Union[str, os.PathLike], message_format=compiled_message_format
+) -> typing.Iterator[tuple[CapturedFrame, list[Message]]]:
+    """Decodes the capture at full speed, yielding every frame along with
+    the messages completed by it.
+
+    Any object with the `parse()` of `message_format` can be used, e.g.
+    `records.record_format`.
+    """
+    decoders: dict[tuple, StreamDecoder] = {}
+    with CaptureReader(path) as reader:
+        for frame in reader:
+            key = (frame.address, frame.kind)
+            decoder = decoders.get(key)
+            if decoder is None:
+                decoder = decoders[key] = StreamDecoder(message_format)
+            yield frame, decoder.feed(frame.data)
+
+
+async def replay_realtime(
+    path: typing.Union[str, os.PathLike],
+    message_format=compiled_message_format,
+    speed: float = 1.0,
+) -> typing.AsyncIterator[tuple[CapturedFrame, list[Message]]]:
+    """Same as `replay()`, keeping the recorded intervals (divided by
+    `speed`) between the frames"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for frame, messages in replay(path, message_format):
+        delay = started + frame.timestamp / speed - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield frame, messages
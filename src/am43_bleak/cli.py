@@ -0,0 +1,203 @@
+"""`am43` command: the daemon, and a thin client of it.
+
+    am43 daemon --pin 02:00:00:00:00:01=8888
+    am43 position 02:00:00:00:00:01 30
+    am43 battery 02:00:00:00:00:01
+
+The client only needs the standard library, the Bluetooth stack and the
+protocol are loaded by the daemon once.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import typing
+
+SOCKET_NAME = "am43.sock"
+# Seconds to wait for the daemon, which may have to scan and connect first
+DEFAULT_REQUEST_TIMEOUT = 60
+
+
+class DaemonError(Exception):
+    pass
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, SOCKET_NAME)
+    return os.path.join("/tmp", f"am43-{os.getuid()}.sock")
+
+
+def request(
+    command: str,
+    socket_path: typing.Optional[str] = None,
+    timeout: float = DEFAULT_REQUEST_TIMEOUT,
+    **arguments,
+) -> typing.Any:
+    """Sends a request to the daemon, returns the result"""
+    socket_path = socket_path or default_socket_path()
+    payload = json.dumps({"command": command, **arguments}).encode() + b"\n"
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError) as exc:
+            raise DaemonError(f"The daemon isn't running at {socket_path}") from exc
+
+        sock.sendall(payload)
+        with sock.makefile("rb") as f:
+            line = f.readline()
+
+    if not line:
+        raise DaemonError("The daemon closed the connection")
+
+    response = json.loads(line)
+    if "error" in response:
+        raise DaemonError(response["error"])
+    return response["result"]
+
+
+def _parse_pin(value: str) -> tuple[str, int]:
+    address, sep, pin = value.rpartition("=")
+    if not sep or not address or not pin.isdigit():
+        raise argparse.ArgumentTypeError("expected ADDRESS=PIN")
+    return address.upper(), int(pin)
+
+
+def _position(value: str) -> int:
+    position = int(value)
+    if not 0 <= position <= 100:
+        raise argparse.ArgumentTypeError("must be within 0..100")
+    return position
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="am43", description="Control AM43 blinds through a local daemon"
+    )
+    parser.add_argument(
+        "--socket", help=f"daemon socket (default: {default_socket_path()})"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    daemon = commands.add_parser("daemon", help="run the daemon")
+    daemon.add_argument(
+        "--pin",
+        type=_parse_pin,
+        action="append",
+        default=[],
+        metavar="ADDRESS=PIN",
+        help="PIN of a device, may be repeated",
+    )
+    daemon.add_argument(
+        "--idle-timeout",
+        type=float,
+        help="seconds an unused connection is kept open",
+    )
+    daemon.add_argument(
+        "--adapter",
+        action="append",
+        default=[],
+        help="HCI adapter to connect through, may be repeated to balance the "
+        "connections over several",
+    )
+    daemon.add_argument(
+        "--no-scan",
+        action="store_true",
+        help="look for the devices only when they're requested",
+    )
+    daemon.add_argument("-v", "--verbose", action="store_true")
+
+    commands.add_parser("devices", help="list the known devices")
+    for name, description in (
+        ("open", "open the blind"),
+        ("close", "close the blind"),
+        ("stop", "stop the blind"),
+        ("battery", "print the battery level"),
+        ("illuminance", "print the illuminance level"),
+    ):
+        commands.add_parser(name, help=description).add_argument("address")
+
+    position = commands.add_parser(
+        "position", help="print the position, or move the blind to it"
+    )
+    position.add_argument("address")
+    position.add_argument(
+        "position", type=_position, nargs="?", help="0 (open) to 100 (closed)"
+    )
+
+    return parser
+
+
+def _run_daemon(args: argparse.Namespace):
+    # The Bluetooth stack is only loaded here
+    import asyncio
+    import logging
+
+    from .balancer import AdapterBalancer
+    from .daemon import AM43Daemon
+    from .pool import ConnectionPool
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    pool_kwargs = {}
+    if args.idle_timeout is not None:
+        pool_kwargs["idle_timeout"] = args.idle_timeout
+
+    if args.adapter:
+        pool_kwargs["balancer"] = AdapterBalancer()
+
+    daemon = AM43Daemon(
+        args.socket or default_socket_path(),
+        pool=ConnectionPool(pins=dict(args.pin), warm_up=True, **pool_kwargs),
+        scan=not args.no_scan,
+        adapters=args.adapter,
+    )
+    asyncio.run(daemon.run())
+
+
+def _print_result(command: str, result: typing.Any):
+    if command == "devices":
+        for device in result:
+            state = "connected" if device["connected"] else ""
+            print(f"{device['address']}\t{device['name'] or ''}\t{state}".rstrip())
+    elif isinstance(result, dict):
+        print(result["status"])
+    else:
+        print(result)
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    args = _build_parser().parse_args(argv)
+    if args.command == "daemon":
+        try:
+            _run_daemon(args)
+        except RuntimeError as exc:
+            print(f"am43: {exc}", file=sys.stderr)
+            return 1
+        return 0
+
+    arguments = {
+        name: value
+        for name, value in vars(args).items()
+        if name not in ("command", "socket") and value is not None
+    }
+    try:
+        result = request(args.command, args.socket, **arguments)
+    except (DaemonError, OSError) as exc:
+        print(f"am43: {exc}", file=sys.stderr)
+        return 1
+
+    _print_result(args.command, result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,424 @@
+import asyncio
+from contextlib import AsyncExitStack
+from datetime import tzinfo
+import logging
+import time
+import typing
+
+from bleak import BleakClient
+from bleak.backends.device import BLEDevice
+from bleak_retry_connector import BleakClientWithServiceCache, establish_connection
+
+from .capture import CaptureWriter, FrameKind
+from .codec import compiled_message_format
+from .const import CHARACTERISTIC_UUID, DEFAULT_RETRY_COUNT, DEFAULT_RETRY_TIMEOUT
+from .frame_cache import FrameCache, frame_cache
+from .instrumentation import Instrumentation
+from .protocol import (
+    ContentControlDirect,
+    IlluminanceLevel,
+    ListSeasonsResponse,
+    ListTimersResponse,
+    Message,
+    MessageType,
+    SettingsResponse,
+    UpdateDeviceTime,
+)
+from .retry import RetryPolicy
+from .stream import StreamDecoder
+
+_LOGGER = logging.getLogger(__name__)
+
+# Device messages sent in reply to a request, the request is complete once
+# all of them are received. Any other request is answered with the same type.
+RESPONSE_MESSAGE_TYPES = {
+    MessageType.REQUEST_SETTINGS: (
+        MessageType.REQUEST_SETTINGS,
+        MessageType.LIST_TIMERS,
+        MessageType.LIST_SEASONS,
+    ),
+    MessageType.REQUEST_POSITION: (MessageType.UNSPECIFIED,),
+    MessageType.REQUEST_SPEED: (MessageType.UNSPECIFIED,),
+}
+
+
+class AM43Error(Exception):
+    pass
+
+
+class DisconnectedError(AM43Error):
+    pass
+
+
+class OperationFailedError(AM43Error):
+    pass
+
+
+class CircuitOpenError(AM43Error):
+    """The device kept failing, requests aren't sent until it's probed again"""
+
+
+class DeviceSettings(typing.NamedTuple):
+    settings: SettingsResponse
+    timers: ListTimersResponse
+    seasons: ListSeasonsResponse
+
+
+class DeviceSnapshot(typing.NamedTuple):
+    settings: DeviceSettings
+    battery_level: int
+
+
+def get_response_types(message_type: MessageType) -> tuple:
+    return RESPONSE_MESSAGE_TYPES.get(message_type, (message_type,))
+
+
+class AM43Client:
+    """Asyncio client for a single device.
+
+    Notifications are subscribed to once, and every device message is matched
+    with the pending request by its message type. Requests answered with
+    different message types are sent without waiting for each other; the
+    ones sharing a response type are queued, since their responses can't be
+    told apart. Device messages which expect a confirmation are confirmed
+    right away.
+    """
+
+    def __init__(
+        self,
+        device: BLEDevice,
+        timeout: float = DEFAULT_RETRY_TIMEOUT,
+        retry_count: int = DEFAULT_RETRY_COUNT,
+        write_with_response: bool = False,
+        client: typing.Optional[BleakClient] = None,
+        frames: FrameCache = frame_cache,
+        instrumentation: typing.Optional[Instrumentation] = None,
+        retry_policy: typing.Optional[RetryPolicy] = None,
+        recorder: typing.Optional[CaptureWriter] = None,
+    ):
+        self.device = device
+        # Time to wait for the responses before the request is re-sent
+        self.timeout = timeout
+        self.retry_count = retry_count
+        self.write_with_response = write_with_response
+        # Adaptive timeouts and circuit breaking, instead of the fixed values
+        self.retry_policy = retry_policy
+        self.frames = frames
+        # Used instead of establishing a connection, e.g. a simulated device
+        self._external_client = client
+        self._client = None
+        self.instrumentation = instrumentation
+        # Every frame sent and notification received is written to it
+        self.recorder = recorder
+        if instrumentation is None:
+            self._decoder = StreamDecoder()
+        else:
+            self._decoder = StreamDecoder(
+                instrumentation.wrap_format(compiled_message_format)
+            )
+            self._record_retry_settings()
+        self._malformed_frames = 0
+        # response message type -> future of the request waiting for it
+        self._pending: dict[int, asyncio.Future] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._write_lock = asyncio.Lock()
+        self._background_tasks = set()
+        # Called with every device message, incl. the unsolicited ones
+        self._listeners: list[typing.Callable[[Message], None]] = []
+        # State fetched by the last `warm_up()`
+        self.snapshot: typing.Optional[DeviceSnapshot] = None
+
+    def _record_retry_settings(self):
+        policy = self.retry_policy
+        if policy is None:
+            self.instrumentation.record_client(
+                self.device.address, self.timeout, self.retry_count
+            )
+        else:
+            self.instrumentation.record_client(
+                self.device.address, policy.rto, policy.retry_count
+            )
+
+    @property
+    def is_connected(self) -> bool:
+        return self._client is not None and self._client.is_connected
+
+    async def connect(self):
+        if self._external_client is not None:
+            self._client = self._external_client
+            if not self._client.is_connected:
+                await self._client.connect()
+        elif self._client is None:
+            self._client = await establish_connection(
+                BleakClientWithServiceCache,
+                self.device,
+                self.device.name or self.device.address,
+                disconnected_callback=self._on_disconnected,
+                max_attempts=self.retry_count,
+            )
+
+        self._decoder.reset()
+        await self._client.start_notify(CHARACTERISTIC_UUID, self._on_notification)
+
+    async def disconnect(self):
+        client, self._client = self._client, None
+        if client is not None:
+            await client.disconnect()
+        self._fail_pending(DisconnectedError("Disconnected"))
+
+    async def __aenter__(self) -> "AM43Client":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.disconnect()
+
+    def _on_disconnected(self, client: BleakClient):
+        _LOGGER.debug("%s: disconnected", self.device.address)
+        if client is self._client:
+            self._client = None
+        self._fail_pending(DisconnectedError("Disconnected"))
+
+    def _fail_pending(self, exc: Exception):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+    def _on_notification(self, _characteristic, data: bytearray):
+        if self.recorder is not None:
+            self.recorder.record(self.device.address, FrameKind.RECEIVED, data)
+
+        for message in self._decoder.feed(data):
+            self._handle_message(message)
+
+        if (
+            self.instrumentation is not None
+            and self._decoder.malformed_frames != self._malformed_frames
+        ):
+            self.instrumentation.record_malformed_frames(
+                self.device.address,
+                self._decoder.malformed_frames - self._malformed_frames,
+            )
+            self._malformed_frames = self._decoder.malformed_frames
+
+    def subscribe(
+        self, callback: typing.Callable[[Message], None]
+    ) -> typing.Callable[[], None]:
+        """Calls `callback` with every device message, returns the unsubscribe"""
+        self._listeners.append(callback)
+        return lambda: self._listeners.remove(callback)
+
+    def _handle_message(self, message: Message):
+        if message.is_confirmation_expected:
+            self._run_in_background(
+                self._write(self.frames.build_confirmation(message, True))
+            )
+            if self.instrumentation is not None:
+                self.instrumentation.record_confirmation(
+                    self.device.address, message.payload.message_type
+                )
+
+        for listener in list(self._listeners):
+            try:
+                listener(message)
+            except Exception:
+                _LOGGER.exception("%s: error in a listener", self.device.address)
+
+        future = self._pending.get(int(message.payload.message_type))
+        if future is not None and not future.done():
+            future.set_result(message)
+        else:
+            _LOGGER.debug("%s: unsolicited message %r", self.device.address, message)
+
+    def _run_in_background(self, coro: typing.Awaitable):
+        task = asyncio.ensure_future(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        task.add_done_callback(self._log_background_error)
+
+    def _log_background_error(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            _LOGGER.warning(
+                "%s: failed to send a confirmation: %s",
+                self.device.address,
+                task.exception(),
+            )
+
+    async def _write(self, frame: bytes) -> float:
+        """Writes a frame, returns the time it was sent at, i.e. after waiting
+        for the other writes"""
+        if not self.is_connected:
+            raise DisconnectedError("Not connected")
+
+        async with self._write_lock:
+            sent_at = time.perf_counter()
+            if self.recorder is not None:
+                self.recorder.record(self.device.address, FrameKind.SENT, frame)
+            await self._client.write_gatt_char(
+                CHARACTERISTIC_UUID, frame, response=self.write_with_response
+            )
+        return sent_at
+
+    async def _request(self, message_type: MessageType, frame: bytes) -> list:
+        policy = self.retry_policy
+        if policy is not None and not policy.allow_request():
+            raise CircuitOpenError(f"{self.device.address} keeps failing")
+
+        response_types = sorted(int(t) for t in get_response_types(message_type))
+
+        async with AsyncExitStack() as stack:
+            # Always in the same order, so requests sharing only some of the
+            # response types can't deadlock
+            for response_type in response_types:
+                lock = self._locks.setdefault(response_type, asyncio.Lock())
+                await stack.enter_async_context(lock)
+
+            loop = asyncio.get_running_loop()
+            futures = {t: loop.create_future() for t in response_types}
+            self._pending.update(futures)
+            attempts = max(
+                self.retry_count if policy is None else policy.retry_count, 1
+            )
+            try:
+                for attempt in range(attempts):
+                    sent_at = await self._write(frame)
+                    # Responses to an earlier attempt are accepted as well
+                    await asyncio.wait(
+                        futures.values(),
+                        timeout=(
+                            self.timeout
+                            if policy is None
+                            else policy.get_timeout(attempt)
+                        ),
+                    )
+                    if all(f.done() for f in futures.values()):
+                        rtt = time.perf_counter() - sent_at
+                        responses = [
+                            futures[int(t)].result()
+                            for t in get_response_types(message_type)
+                        ]
+                        if policy is not None:
+                            policy.on_success(rtt if attempt == 0 else None)
+                        if self.instrumentation is not None:
+                            if policy is not None and attempt == 0:
+                                # The timeout is adapted to the new sample
+                                self._record_retry_settings()
+                            self.instrumentation.record_request(
+                                self.device.address, message_type, rtt, attempt + 1
+                            )
+                        return responses
+
+                if policy is not None:
+                    policy.on_failure()
+                if self.instrumentation is not None:
+                    self.instrumentation.record_timeout(
+                        self.device.address, message_type, attempts
+                    )
+                raise TimeoutError(f"No response to {message_type!r}")
+            except DisconnectedError:
+                if policy is not None:
+                    policy.on_failure()
+                raise
+            finally:
+                for response_type, future in futures.items():
+                    future.cancel()
+                    if self._pending.get(response_type) is future:
+                        del self._pending[response_type]
+
+    async def request(
+        self,
+        message_type: MessageType,
+        message: typing.Any = None,
+        **kwargs,
+    ) -> Message:
+        """Sends a request and returns the (first) device response to it"""
+        if message is not None:
+            kwargs["message"] = message
+        frame = self._build(message_type, **kwargs)
+        return (await self._request(message_type, frame))[0]
+
+    def _build(self, message_type: MessageType, **kwargs) -> bytes:
+        if self.instrumentation is None:
+            return self.frames.build(message_type, **kwargs)
+
+        started = time.perf_counter()
+        frame = self.frames.build(message_type, **kwargs)
+        self.instrumentation.record_encode(message_type, time.perf_counter() - started)
+        return frame
+
+    async def _operation(self, message_type: MessageType, **kwargs):
+        response = await self.request(message_type, **kwargs)
+        if not response.payload.message.is_success:
+            raise OperationFailedError(f"{message_type!r} failed")
+
+    async def authenticate(self, pin: int):
+        await self._operation(MessageType.PASSWORD, pin=pin)
+
+    async def open(self):
+        await self._operation(
+            MessageType.CONTROL_DIRECT, action=ContentControlDirect.OPEN
+        )
+
+    async def close(self):
+        await self._operation(
+            MessageType.CONTROL_DIRECT, action=ContentControlDirect.CLOSE
+        )
+
+    async def stop(self):
+        await self._operation(
+            MessageType.CONTROL_DIRECT, action=ContentControlDirect.STOP
+        )
+
+    async def set_position(self, position: int):
+        await self._operation(MessageType.CONTROL_POSITION, position=position)
+
+    async def get_battery_level(self) -> int:
+        response = await self.request(MessageType.REQUEST_BATTERY_STATUS)
+        return response.payload.message.level
+
+    async def get_illuminance(self) -> IlluminanceLevel:
+        response = await self.request(MessageType.REQUEST_ILLUMINANCE)
+        return response.payload.message
+
+    async def get_settings(self) -> DeviceSettings:
+        message_type = MessageType.REQUEST_SETTINGS
+        responses = await self._request(message_type, self._build(message_type))
+        return DeviceSettings(*(r.payload.message for r in responses))
+
+    async def sync_time(self, tz: typing.Optional[tzinfo] = None):
+        await self._operation(
+            MessageType.UPDATE_DEVICE_TIME, message=UpdateDeviceTime.now(tz)
+        )
+
+    async def warm_up(
+        self,
+        pin: typing.Optional[int] = None,
+        sync_time: bool = True,
+        tz: typing.Optional[tzinfo] = None,
+    ) -> DeviceSnapshot:
+        """Authenticates, sets the time and fetches the state of a freshly
+        connected device.
+
+        The requests are written back to back, in this order (the write lock
+        is taken first come, first served), without waiting for each other's
+        responses; the device handles them in the order received. If the
+        authentication is lost, the following requests are retried as usual.
+        """
+        steps = []
+        if pin is not None:
+            steps.append(self.authenticate(pin))
+        if sync_time:
+            steps.append(self.sync_time(tz))
+        steps.append(self.get_settings())
+        steps.append(self.get_battery_level())
+
+        tasks = [asyncio.ensure_future(step) for step in steps]
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            # The first failure fails the warm-up, the rest is of no use
+            for task in tasks:
+                task.cancel()
+
+        self.snapshot = DeviceSnapshot(*results[-2:])
+        return self.snapshot
@@ -0,0 +1,602 @@
+"""Compiled codec for `message_format`.
+
+Every message class from `Payload.REQUEST_MESSAGE_TYPE_MAP` and
+`Payload.RESPONSE_MESSAGE_TYPE_MAP` is compiled once into a flat field table
+(a single `struct.Struct` for byte-aligned messages, shifts and masks for
+bit-level ones), so a frame is encoded or decoded without walking the construct
+tree. The tables are generated from the very same `csfield` definitions, and
+adapters, validators and computed fields are evaluated exactly as construct
+does, so the output is identical to `message_format`.
+
+Messages of unknown types are kept as raw bytes, as `message_format` does.
+Message types with a class that can't be compiled are found out when their
+codecs are built, and handed over to `message_format`; anything else the
+compiled path rejects, e.g. a broken frame, raises right away.
+"""
+
+from collections.abc import Mapping
+import dataclasses
+import logging
+import struct
+import typing
+
+from construct import (
+    Adapter,
+    Array,
+    BitsInteger,
+    Bytes,
+    Computed,
+    Const,
+    Container,
+    Default,
+    Flag,
+    FormatField,
+    HexDisplayedBytes,
+    HexDumpDisplayedBytes,
+    IntegerError,
+    ListContainer,
+    Rebuild,
+    StringEncoded,
+    Transformed,
+)
+from construct_typed import DataclassStruct, TEnum
+
+from .protocol import (
+    CLIENT_MESSAGE_TAG,
+    MESSAGE_CLASSES,
+    DataclassBitMixin,
+    LimitOrResetResult,
+    Message,
+    MessageType,
+    MessageTypeMap,
+    OperationResult,
+    Payload,
+    message_format,
+    xor_checksum,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+_FlagType = type(Flag)
+
+HEADER = 0x9A
+FOOTER_SUCCESS = b"\x31"
+FOOTER_FAILURE = b"\xCE"
+FOOTERS = (FOOTER_SUCCESS[0], FOOTER_FAILURE[0])
+
+# Messages closed with a fixed success/failure footer instead of the checksum
+RESULT_MESSAGE_CLASSES = (OperationResult, LimitOrResetResult)
+
+# (message_type, is_device_response) closed with a success/failure footer
+RESULT_MESSAGE_TYPES = frozenset(
+    key
+    for key, message_classes in MESSAGE_CLASSES.items()
+    if any(c in RESULT_MESSAGE_CLASSES for c in message_classes.allowed)
+)
+
+
+class NotCompilableError(Exception):
+    pass
+
+
+@dataclasses.dataclass
+class _Field:
+    name: str
+    # Slot kind: "int", "flag", "bytes", "const", "struct", "array", "string"
+    # or None for computed fields which take no space in the stream
+    kind: typing.Optional[str]
+    width: int = 0
+    # (decode, encode) pairs of the adapters, outermost first
+    adapters: list = dataclasses.field(default_factory=list)
+    default: typing.Any = None
+    has_default: bool = False
+    rebuild: typing.Optional[typing.Callable] = None
+    computed: typing.Optional[typing.Callable] = None
+    const: typing.Optional[bytes] = None
+    codec: typing.Optional["DataclassCodec"] = None
+    encoding: typing.Optional[str] = None
+    fmt: typing.Optional[str] = None
+
+
+def _adapter_functions(adapter: Adapter) -> tuple:
+    if isinstance(adapter, TEnum):
+        enum_type = adapter.enum_type
+
+        def encode(obj, ctx):
+            if isinstance(obj, enum_type):
+                return int(obj)
+            raise TypeError(f"'{obj!r}' has to be of type {enum_type!r}")
+
+        return (lambda obj, ctx: enum_type(obj)), encode
+
+    return (
+        lambda obj, ctx: adapter._decode(obj, ctx, "(compiled)"),
+        lambda obj, ctx: adapter._encode(obj, ctx, "(compiled)"),
+    )
+
+
+def _compile_field(name: str, subcon, bitwise: bool) -> _Field:
+    field = _Field(name, None)
+
+    while True:
+        if isinstance(subcon, Computed):
+            field.computed = subcon.func
+            return field
+        elif isinstance(subcon, Rebuild):
+            field.rebuild = subcon.func
+        elif isinstance(subcon, Default):
+            field.default = subcon.value
+            field.has_default = True
+        elif isinstance(subcon, Const):
+            field.const = subcon.value
+            field.kind = "const"
+            field.width = len(subcon.value)
+            if bitwise:
+                raise NotCompilableError(f"{name}: Const is not supported in bits")
+            return field
+        elif isinstance(subcon, DataclassStruct):
+            if bitwise:
+                raise NotCompilableError(f"{name}: nested struct in bits")
+            field.kind = "struct"
+            field.codec = compile_dataclass(subcon.dc_type)
+            field.width = field.codec.size
+            return field
+        elif isinstance(subcon, Transformed) and isinstance(
+            subcon.subcon, DataclassStruct
+        ):
+            if bitwise:
+                raise NotCompilableError(f"{name}: nested struct in bits")
+            field.kind = "struct"
+            field.codec = compile_dataclass(subcon.subcon.dc_type, bitwise=True)
+            field.width = field.codec.size
+            return field
+        elif isinstance(subcon, Array):
+            # The only arrays in the protocol span the rest of the message
+            field.kind = "array"
+            field.codec = _compile_item(subcon.subcon)
+            return field
+        elif isinstance(subcon, StringEncoded):
+            # PaddedString sized by the message, i.e. spanning the rest of it
+            field.kind = "string"
+            field.encoding = subcon.encoding
+            return field
+        elif isinstance(subcon, Adapter):
+            field.adapters.append(_adapter_functions(subcon))
+        elif isinstance(subcon, _FlagType):
+            field.kind = "flag"
+            field.width = 1
+            return field
+        elif isinstance(subcon, BitsInteger):
+            if not bitwise or callable(subcon.length) or subcon.signed:
+                raise NotCompilableError(f"{name}: unsupported BitsInteger")
+            field.kind = "int"
+            field.width = subcon.length
+            return field
+        elif isinstance(subcon, FormatField):
+            if bitwise or subcon.fmtstr not in (">B", ">H"):
+                raise NotCompilableError(f"{name}: unsupported {subcon.fmtstr}")
+            field.kind = "int"
+            field.fmt = subcon.fmtstr[1:]
+            field.width = struct.calcsize(subcon.fmtstr)
+            return field
+        elif isinstance(subcon, Bytes) and isinstance(subcon.length, int):
+            if bitwise:
+                raise NotCompilableError(f"{name}: Bytes is not supported in bits")
+            field.kind = "bytes"
+            field.width = subcon.length
+            return field
+        else:
+            raise NotCompilableError(f"{name}: unsupported {subcon!r}")
+
+        subcon = subcon.subcon
+
+
+def _compile_item(subcon) -> "DataclassCodec":
+    if isinstance(subcon, DataclassStruct):
+        return compile_dataclass(subcon.dc_type)
+    if isinstance(subcon, Transformed) and isinstance(subcon.subcon, DataclassStruct):
+        return compile_dataclass(subcon.subcon.dc_type, bitwise=True)
+    raise NotCompilableError(f"unsupported array item {subcon!r}")
+
+
+def _struct_code(field: _Field) -> str:
+    if field.kind == "int":
+        return field.fmt
+    if field.kind == "flag":
+        return "B"
+    return f"{field.width}s"
+
+
+class DataclassCodec:
+    def __init__(self, dc_type: type, bitwise: bool = False):
+        self.dc_type = dc_type
+        self.bitwise = bitwise
+        self.fields = [
+            _compile_field(f.name, f.metadata["subcon"], bitwise)
+            for f in dataclasses.fields(dc_type)
+        ]
+
+        stream_fields = [f for f in self.fields if f.kind is not None]
+        greedy = [f for f in stream_fields if f.kind in ("array", "string")]
+        if greedy and (len(greedy) > 1 or stream_fields[-1] is not greedy[0]):
+            raise NotCompilableError(f"{dc_type.__name__}: unsupported layout")
+        self.greedy = greedy[0] if greedy else None
+
+        fixed = [f for f in stream_fields if f is not self.greedy]
+        if bitwise:
+            bits = sum(f.width for f in fixed)
+            if bits % 8:
+                raise NotCompilableError(f"{dc_type.__name__}: not byte-aligned")
+            self.fixed_size = bits // 8
+            self._struct = None
+        else:
+            self._struct = struct.Struct(">" + "".join(_struct_code(f) for f in fixed))
+            self.fixed_size = self._struct.size
+
+        # Size of the encoded message, or None when it depends on the content
+        self.size = None if self.greedy else self.fixed_size
+
+    def decode(self, data: bytes):
+        if self.greedy is None:
+            if len(data) != self.fixed_size:
+                raise ValueError(
+                    f"{self.dc_type.__name__} expects {self.fixed_size} bytes, "
+                    f"got {len(data)}"
+                )
+        elif len(data) < self.fixed_size:
+            raise ValueError(f"{self.dc_type.__name__}: not enough data")
+
+        if self.bitwise:
+            raw = iter(self._unpack_bits(data[: self.fixed_size]))
+        else:
+            raw = iter(self._struct.unpack_from(data))
+
+        obj = self.dc_type.__new__(self.dc_type)
+        values = obj.__dict__
+        for field in self.fields:
+            kind = field.kind
+            if kind is None:
+                values[field.name] = field.computed(obj)
+                continue
+            elif kind == "array":
+                value = self._decode_array(field, data[self.fixed_size :])
+            elif kind == "string":
+                value = data[self.fixed_size :].rstrip(b"\x00").decode(field.encoding)
+            else:
+                value = next(raw)
+                if kind == "flag":
+                    value = value != 0
+                elif kind == "const":
+                    if value != field.const:
+                        raise ValueError(
+                            f"{field.name}: expected {field.const!r}, got {value!r}"
+                        )
+                elif kind == "struct":
+                    value = field.codec.decode(value)
+
+            for decode, _ in reversed(field.adapters):
+                value = decode(value, obj)
+            values[field.name] = value
+
+        return obj
+
+    def _unpack_bits(self, data: bytes) -> list:
+        value = int.from_bytes(data, "big")
+        shift = self.fixed_size * 8
+        ret = []
+        for field in self.fields:
+            if field.kind is None:
+                continue
+            shift -= field.width
+            ret.append((value >> shift) & ((1 << field.width) - 1))
+        return ret
+
+    @staticmethod
+    def _decode_array(field: _Field, data: bytes) -> ListContainer:
+        item_size = field.codec.size
+        if item_size is None or len(data) % item_size:
+            raise ValueError(f"{field.name}: unexpected array size")
+
+        return ListContainer(
+            field.codec.decode(data[i : i + item_size])
+            for i in range(0, len(data), item_size)
+        )
+
+    def encode(self, obj) -> bytes:
+        if not isinstance(obj, self.dc_type):
+            raise TypeError(f"'{obj!r}' has to be of type {self.dc_type!r}")
+
+        ctx = Container((f.name, getattr(obj, f.name)) for f in self.fields)
+        raw = []
+        tail = b""
+        for field in self.fields:
+            kind = field.kind
+            if kind is None:
+                continue
+
+            value = ctx[field.name]
+            if field.rebuild is not None:
+                value = field.rebuild(ctx)
+            elif field.has_default and value is None:
+                value = field.default(ctx) if callable(field.default) else field.default
+            ctx[field.name] = value
+
+            for _, encode in field.adapters:
+                value = encode(value, ctx)
+
+            if kind == "int":
+                if self.bitwise and not isinstance(value, int):
+                    raise IntegerError(f"value {value} is not an integer")
+            elif kind == "flag":
+                value = 1 if value else 0
+            elif kind == "const":
+                if value != field.const:
+                    raise ValueError(f"{field.name}: expected {field.const!r}")
+            elif kind == "bytes":
+                if isinstance(value, int):
+                    value = value.to_bytes(field.width, "big")
+                if len(value) != field.width:
+                    raise ValueError(f"{field.name}: expected {field.width} bytes")
+            elif kind == "struct":
+                value = field.codec.encode(value)
+            elif kind == "array":
+                tail = b"".join(field.codec.encode(item) for item in value)
+                continue
+            elif kind == "string":
+                if not isinstance(value, str):
+                    raise TypeError(f"{field.name}: expected a str")
+                tail = value.encode(field.encoding)
+                continue
+
+            raw.append(value)
+
+        if self.bitwise:
+            return self._pack_bits(raw) + tail
+
+        return self._struct.pack(*raw) + tail
+
+    def _pack_bits(self, raw: list) -> bytes:
+        ret = 0
+        values = iter(raw)
+        for field in self.fields:
+            if field.kind is None:
+                continue
+            value = next(values)
+            if not 0 <= value < (1 << field.width):
+                raise IntegerError(f"value {value} does not fit {field.width} bits")
+            ret = (ret << field.width) | value
+
+        return ret.to_bytes(self.fixed_size, "big")
+
+
+_compiled_dataclasses: dict = {}
+
+
+def compile_dataclass(dc_type: type, bitwise: bool = False) -> DataclassCodec:
+    key = (dc_type, bitwise)
+    if key not in _compiled_dataclasses:
+        _compiled_dataclasses[key] = DataclassCodec(dc_type, bitwise)
+
+    return _compiled_dataclasses[key]
+
+
+class MessageCodecMap(Mapping):
+    """Message type -> codecs of the allowed message classes, compiled on first use.
+
+    A message type is None if any of its classes can't be compiled; such
+    messages are built and parsed by `message_format`.
+    """
+
+    def __init__(self, message_type_map: MessageTypeMap):
+        self.message_type_map = message_type_map
+        self._codecs = {}
+
+    def __getitem__(self, message_type: int) -> typing.Optional[tuple]:
+        if message_type in self._codecs:
+            return self._codecs[message_type]
+
+        message_classes = self.message_type_map.message_classes[message_type]
+        try:
+            codecs = tuple(
+                compile_dataclass(c, issubclass(c, DataclassBitMixin))
+                for c in message_classes
+            )
+        except NotCompilableError as exc:
+            _LOGGER.debug("%r is parsed by construct: %s", message_type, exc)
+            codecs = None
+        self._codecs[message_type] = codecs
+
+        return codecs
+
+    def __contains__(self, message_type: object) -> bool:
+        return message_type in self.message_type_map.message_classes
+
+    def has_raw_fallback(self, message_type: int) -> bool:
+        """Whether messages of unexpected sizes are kept as raw bytes"""
+        return message_type in self.message_type_map.raw_fallback
+
+    def __iter__(self) -> typing.Iterator[int]:
+        return (int(message_type) for message_type in self.message_type_map)
+
+    def __len__(self) -> int:
+        return len(self.message_type_map)
+
+
+_MESSAGE_TYPE_SUBCON = next(
+    f.metadata["subcon"]
+    for f in dataclasses.fields(Payload)
+    if f.name == "message_type"
+)
+
+
+def _parsed_message_types() -> dict:
+    # `Payload.message_type` is wrapped into `Hex`, which turns the parsed enum
+    # into a displayed integer; decode every known type the same way once
+    field = _compile_field("message_type", _MESSAGE_TYPE_SUBCON, False)
+
+    ret = {}
+    for message_type in MessageType:
+        value = int(message_type)
+        for decode, _ in reversed(field.adapters):
+            value = decode(value, None)
+        ret[int(message_type)] = value
+
+    return ret
+
+
+_PARSED_MESSAGE_TYPES = _parsed_message_types()
+
+
+def _parsed_message_type(value: int) -> typing.Any:
+    ret = _PARSED_MESSAGE_TYPES.get(value)
+    if ret is None:
+        # Not a `MessageType`
+        ret = _MESSAGE_TYPE_SUBCON.parse(bytes((value,)))
+    return ret
+
+
+class MessageCodec:
+    """Drop-in replacement for `message_format.build()`/`message_format.parse()`"""
+
+    def __init__(self):
+        # is_device_response -> message type -> codecs in the `Select` order
+        self.codecs = {
+            False: MessageCodecMap(Payload.REQUEST_MESSAGE_TYPE_MAP),
+            True: MessageCodecMap(Payload.RESPONSE_MESSAGE_TYPE_MAP),
+        }
+
+    def build(self, message: Message) -> bytes:
+        is_device_response = bool(message.is_device_response)
+        payload = message._payload
+
+        if "data" in payload:
+            # RawCopy re-emits the original bytes of a parsed payload
+            data = bytes(payload["data"])
+        else:
+            value = payload["value"]
+            if not isinstance(value.message_type, MessageType):
+                raise TypeError("message_type must be a MessageType")
+
+            codecs = self.codecs[is_device_response]
+            if isinstance(value.message, bytes) and (
+                value.message_type not in codecs
+                or codecs.has_raw_fallback(value.message_type)
+            ):
+                body = bytes(value.message)
+            elif codecs.get(value.message_type, ()) is None:
+                return message_format.build(message)
+            else:
+                codec = self._find_codec(
+                    is_device_response, value.message_type, value.message.__class__
+                )
+                # The message is serialised once, its length is prefixed afterwards
+                body = codec.encode(value.message)
+            data = bytes((HEADER, value.message_type, len(body))) + body
+
+        message = payload["value"].message
+        if isinstance(message, RESULT_MESSAGE_CLASSES):
+            if message.is_success is True:
+                footer = FOOTER_SUCCESS
+            elif message.is_success is False:
+                footer = FOOTER_FAILURE
+            else:
+                raise ValueError("is_success must be set")
+        else:
+            footer = bytes((xor_checksum(data),))
+
+        if is_device_response:
+            return data + footer
+
+        return CLIENT_MESSAGE_TAG + data + footer
+
+    def _find_codec(
+        self, is_device_response: bool, message_type: int, message_class: type
+    ) -> DataclassCodec:
+        for codec in self.codecs[is_device_response].get(message_type) or ():
+            if codec.dc_type is message_class:
+                return codec
+
+        raise TypeError(f"{message_class!r} is not allowed for {message_type!r}")
+
+    def decode_frame(self, data: bytes) -> tuple:
+        """Verifies the framing and the checksum/footer of a frame, and decodes
+        its message with the compiled codecs.
+
+        Returns (offset, message_type, message, payload_data), `offset` being
+        the size of the client tag, if any. Raises `ValueError` if the frame
+        is broken or no codec matches. Messages of unknown types are kept as
+        raw bytes, like `message_format` does.
+        """
+        offset = len(CLIENT_MESSAGE_TAG) if data.startswith(CLIENT_MESSAGE_TAG) else 0
+        is_device_response = offset == 0
+
+        header, message_type, size = data[offset : offset + 3]
+        end = offset + 3 + size
+        if header != HEADER or len(data) != end + 1:
+            raise ValueError("Malformed frame")
+
+        body = data[offset + 3 : end]
+        codecs = self.codecs[is_device_response]
+        if message_type not in codecs:
+            message = HexDumpDisplayedBytes(body)
+        elif codecs[message_type] is None:
+            message = message_format.parse(data).payload.message
+        else:
+            for codec in codecs[message_type]:
+                try:
+                    message = codec.decode(body)
+                    break
+                except Exception:
+                    continue
+            else:
+                if not codecs.has_raw_fallback(message_type):
+                    raise ValueError("No message class matched")
+                message = HexDumpDisplayedBytes(body)
+
+        payload_data = data[offset:end]
+        if isinstance(message, RESULT_MESSAGE_CLASSES):
+            footer = FOOTER_SUCCESS if message.is_success else FOOTER_FAILURE
+            if data[end:] != footer:
+                raise ValueError("Unexpected footer")
+        elif data[end] != xor_checksum(payload_data):
+            raise ValueError("Wrong checksum")
+
+        return offset, message_type, message, payload_data
+
+    def parse(self, data: bytes) -> Message:
+        data = bytes(data)
+        offset, message_type, message, payload_data = self.decode_frame(data)
+        is_device_response = offset == 0
+        end = offset + len(payload_data)
+        footer = (
+            HexDisplayedBytes(data[end:])
+            if isinstance(message, RESULT_MESSAGE_CLASSES)
+            else data[end]
+        )
+
+        payload = Payload.__new__(Payload)
+        payload.__dict__.update(
+            _header=HexDisplayedBytes(payload_data[:1]),
+            message_type=_parsed_message_type(message_type),
+            _message_size=len(payload_data) - 3,
+            message=message,
+        )
+
+        ret = Message.__new__(Message)
+        ret.__dict__.update(
+            _tag=None if is_device_response else HexDisplayedBytes(CLIENT_MESSAGE_TAG),
+            is_device_response=is_device_response,
+            _payload=Container(
+                data=payload_data,
+                value=payload,
+                offset1=offset,
+                offset2=end,
+                length=end - offset,
+            ),
+            payload=payload,
+            _footer=footer,
+        )
+        return ret
+
+
+compiled_message_format = MessageCodec()
@@ -0,0 +1,274 @@
+"""Latest-wins queue of the movement commands of a device.
+
+Sliders and automations send bursts of positions, while the motor only
+cares about the last one. Commands submitted to a `CommandQueue` are
+gathered for `debounce` seconds, and while the previous one is in flight;
+only the latest of them is sent, the others are reported as coalesced.
+
+A STOP is sent right away: it preempts the commands waiting, and the one in
+flight is no longer waited for. It's never coalesced with the commands
+submitted after it.
+
+    queue = CommandQueue(client)
+    for position in (10, 20, 30):
+        futures.append(queue.set_position(position))
+    # [COALESCED, COALESCED, SENT]
+    results = await asyncio.gather(*futures)
+"""
+
+import asyncio
+from contextlib import AbstractAsyncContextManager, nullcontext
+import enum
+import logging
+import typing
+
+from bleak.backends.device import BLEDevice
+
+from .client import AM43Client
+from .const import DEFAULT_COMMAND_DEBOUNCE
+from .protocol import ContentControlDirect, MessageType
+
+_LOGGER = logging.getLogger(__name__)
+
+Connect = typing.Callable[[BLEDevice], AbstractAsyncContextManager[AM43Client]]
+
+
+class Command(typing.NamedTuple):
+    message_type: MessageType
+    # `ContentControlDirect` action, or the position
+    value: int
+
+    @property
+    def is_stop(self) -> bool:
+        return (
+            self.message_type == MessageType.CONTROL_DIRECT
+            and self.value == ContentControlDirect.STOP
+        )
+
+    async def send(self, client: AM43Client):
+        if self.message_type == MessageType.CONTROL_POSITION:
+            await client.set_position(self.value)
+        elif self.value == ContentControlDirect.OPEN:
+            await client.open()
+        elif self.value == ContentControlDirect.CLOSE:
+            await client.close()
+        elif self.value == ContentControlDirect.STOP:
+            await client.stop()
+        else:
+            raise ValueError(f"Unknown action {self.value!r}")
+
+
+class CommandStatus(enum.Enum):
+    SENT = "sent"
+    # Replaced by a later command before being sent
+    COALESCED = "coalesced"
+    # Dropped, or no longer waited for, because of a STOP
+    PREEMPTED = "preempted"
+    # Sent, and the request failed
+    FAILED = "failed"
+
+
+class CommandResult(typing.NamedTuple):
+    command: Command
+    status: CommandStatus
+    # Command sent in its place, None if sent itself
+    superseded_by: typing.Optional[Command] = None
+    # Exception of the request, if FAILED
+    error: typing.Optional[BaseException] = None
+
+
+class CommandQueue:
+    """Movement commands of a single device.
+
+    Every submission returns a future of its `CommandResult`; it fails with
+    the exception of the request, if the command itself was sent and failed.
+    Listeners are called with the results of all commands, failures included.
+    `client` is either a connected client, or a callable returning a context
+    manager of one (e.g. `lambda: pool.acquire(device)`), entered for every
+    command sent.
+    """
+
+    def __init__(
+        self,
+        client: typing.Union[
+            AM43Client, typing.Callable[[], AbstractAsyncContextManager[AM43Client]]
+        ],
+        debounce: float = DEFAULT_COMMAND_DEBOUNCE,
+    ):
+        if isinstance(client, AM43Client):
+            self._connect = lambda: nullcontext(client)
+        else:
+            self._connect = client
+        self.debounce = debounce
+        # Submitted and not sent yet, the last one wins
+        self._waiting: list[tuple[Command, asyncio.Future]] = []
+        self._in_flight: typing.Optional[asyncio.Task] = None
+        self._in_flight_command: typing.Optional[Command] = None
+        self._in_flight_future: typing.Optional[asyncio.Future] = None
+        # Set by a STOP, cuts the debounce short
+        self._preempt: typing.Optional[asyncio.Future] = None
+        self._preempted_by: typing.Optional[Command] = None
+        self._worker: typing.Optional[asyncio.Task] = None
+        self._listeners: list[typing.Callable[[CommandResult], None]] = []
+
+    def subscribe(
+        self, callback: typing.Callable[[CommandResult], None]
+    ) -> typing.Callable[[], None]:
+        """Calls `callback` with the result of every command, returns the
+        unsubscribe"""
+        self._listeners.append(callback)
+        return lambda: self._listeners.remove(callback)
+
+    def _resolve(
+        self,
+        future: asyncio.Future,
+        command: Command,
+        status: CommandStatus,
+        superseded_by: typing.Optional[Command] = None,
+        error: typing.Optional[BaseException] = None,
+    ):
+        result = CommandResult(command, status, superseded_by, error)
+        if not future.done():
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+        for listener in list(self._listeners):
+            try:
+                listener(result)
+            except Exception:
+                _LOGGER.exception("Error in a command listener")
+
+    def submit(self, command: Command) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        if command.is_stop:
+            waiting, self._waiting = self._waiting, []
+            for waiting_command, waiting_future in waiting:
+                self._resolve(
+                    waiting_future, waiting_command, CommandStatus.PREEMPTED, command
+                )
+            if (
+                self._in_flight is not None
+                and not self._in_flight.done()
+                and not self._in_flight_command.is_stop
+            ):
+                self._preempted_by = command
+                self._in_flight.cancel()
+            if self._preempt is not None and not self._preempt.done():
+                self._preempt.set_result(None)
+
+        self._waiting.append((command, future))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._run())
+        return future
+
+    def set_position(self, position: int) -> asyncio.Future:
+        return self.submit(Command(MessageType.CONTROL_POSITION, position))
+
+    def open(self) -> asyncio.Future:
+        return self.submit(
+            Command(MessageType.CONTROL_DIRECT, ContentControlDirect.OPEN)
+        )
+
+    def close(self) -> asyncio.Future:
+        return self.submit(
+            Command(MessageType.CONTROL_DIRECT, ContentControlDirect.CLOSE)
+        )
+
+    def stop(self) -> asyncio.Future:
+        return self.submit(
+            Command(MessageType.CONTROL_DIRECT, ContentControlDirect.STOP)
+        )
+
+    @property
+    def pending(self) -> int:
+        """Commands not sent yet"""
+        return len(self._waiting)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._waiting:
+            if self._waiting[0][0].is_stop:
+                # Never coalesced, the commands submitted after it follow
+                command, future = self._waiting.pop(0)
+            else:
+                # Gather the rest of the burst
+                self._preempt = loop.create_future()
+                await asyncio.wait([self._preempt], timeout=self.debounce)
+                self._preempt = None
+                if not self._waiting or self._waiting[0][0].is_stop:
+                    continue
+
+                *coalesced, (command, future) = self._waiting
+                self._waiting = []
+                for coalesced_command, coalesced_future in coalesced:
+                    self._resolve(
+                        coalesced_future,
+                        coalesced_command,
+                        CommandStatus.COALESCED,
+                        command,
+                    )
+
+            self._preempted_by = None
+            self._in_flight_command = command
+            self._in_flight_future = future
+            self._in_flight = asyncio.ensure_future(self._send(command))
+            # Doesn't raise if the command is cancelled by a STOP
+            await asyncio.wait([self._in_flight])
+
+            task, self._in_flight = self._in_flight, None
+            if task.cancelled():
+                self._resolve(
+                    future, command, CommandStatus.PREEMPTED, self._preempted_by
+                )
+            elif task.exception() is not None:
+                self._resolve(
+                    future, command, CommandStatus.FAILED, error=task.exception()
+                )
+            else:
+                self._resolve(future, command, CommandStatus.SENT)
+
+    async def _send(self, command: Command):
+        async with self._connect() as client:
+            await command.send(client)
+
+    async def aclose(self):
+        """Cancels the commands not sent yet, and the one in flight"""
+        waiting, self._waiting = self._waiting, []
+        for _, future in waiting:
+            future.cancel()
+        if self._in_flight_future is not None:
+            self._in_flight_future.cancel()
+
+        for task in (self._worker, self._in_flight):
+            if task is not None:
+                task.cancel()
+        if self._worker is not None:
+            await asyncio.wait([self._worker])
+
+
+class CommandQueues:
+    """Address -> `CommandQueue`, the devices connected through `connect`
+    (e.g. `ConnectionPool.acquire`) for every command sent"""
+
+    def __init__(self, connect: Connect, debounce: float = DEFAULT_COMMAND_DEBOUNCE):
+        self.connect = connect
+        self.debounce = debounce
+        self._queues: dict[str, CommandQueue] = {}
+
+    def __getitem__(self, device: BLEDevice) -> CommandQueue:
+        queue = self._queues.get(device.address)
+        if queue is None:
+            queue = self._queues[device.address] = CommandQueue(
+                lambda: self.connect(device), self.debounce
+            )
+        return queue
+
+    def __len__(self) -> int:
+        return len(self._queues)
+
+    async def aclose(self):
+        await asyncio.gather(*(q.aclose() for q in self._queues.values()))
@@ -4,3 +4,17 @@ CHARACTERISTIC_UUID = "0000fe51-0000-1000-8000-00805f9b34fb"
 DEFAULT_RETRY_COUNT = 3
 DEFAULT_RETRY_TIMEOUT = 1
 DEFAULT_SCAN_TIMEOUT = 5
+
+# Simultaneous connections per adapter, and seconds an unused one is kept
+DEFAULT_MAX_CONNECTIONS = 5
+DEFAULT_IDLE_TIMEOUT = 60
+
+# Bounds of the adaptive timeouts, and the circuit breaker: failures in a row
+# before a device is failed fast, and seconds until it's probed again
+DEFAULT_MIN_RETRY_TIMEOUT = 0.05
+DEFAULT_MAX_RETRY_TIMEOUT = 10
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_CIRCUIT_RESET_TIMEOUT = 30
+
+# Seconds movement commands are gathered for, only the latest one is sent
+DEFAULT_COMMAND_DEBOUNCE = 0.1
@@ -0,0 +1,264 @@
+"""Long-lived process keeping the devices discovered and connected.
+
+Requests come over a Unix socket, one JSON object per line, e.g.
+`{"command": "position", "address": "02:...", "position": 30}`, and are
+answered with `{"result": ...}` or `{"error": "..."}`. The socket is only
+accessible by the user running the daemon.
+
+Movement commands go through `CommandQueues`, reads through a `StateCache`,
+both on top of a `ConnectionPool` of authenticated connections, so a call
+usually costs a single request to a device which is already connected.
+"""
+
+import asyncio
+import inspect
+import json
+import logging
+import os
+import signal
+import typing
+
+from bleak import BleakScanner
+from bleak.backends.device import BLEDevice
+
+from .advertisement import AdvertisementMonitor
+from .cache import StateCache
+from .commands import CommandQueues, CommandResult, CommandStatus
+from .const import DEFAULT_SCAN_TIMEOUT
+from .pool import ConnectionPool
+from .protocol import MessageType
+
+_LOGGER = logging.getLogger(__name__)
+
+# Longest request line accepted
+MAX_REQUEST_SIZE = 64 * 1024
+
+
+class RequestError(Exception):
+    """Invalid request, reported to the client as is"""
+
+
+def _command_result(result: CommandResult) -> dict:
+    return {
+        "status": result.status.value,
+        "superseded_by": (
+            result.superseded_by.message_type.name
+            if result.superseded_by is not None
+            else None
+        ),
+    }
+
+
+class AM43Daemon:
+    def __init__(
+        self,
+        socket_path: str,
+        pool: typing.Optional[ConnectionPool] = None,
+        devices: typing.Optional[typing.Mapping[str, BLEDevice]] = None,
+        scan: bool = True,
+        scan_timeout: float = DEFAULT_SCAN_TIMEOUT,
+        adapters: typing.Sequence[str] = (),
+    ):
+        self.socket_path = socket_path
+        self.pool = ConnectionPool(warm_up=True) if pool is None else pool
+        # Whether to keep scanning in the background, devices not seen yet
+        # are looked for on demand either way
+        self.scan = scan
+        self.scan_timeout = scan_timeout
+        # Scanned through by the balancer of the pool, if it has one; a single
+        # adapter is used for finding the devices as well
+        self.adapters = tuple(adapters)
+        self._scanner_kwargs = (
+            {"adapter": self.adapters[0]} if len(self.adapters) == 1 else {}
+        )
+        self.monitor = AdvertisementMonitor(**self._scanner_kwargs)
+        self.monitor.ble_devices.update(devices or {})
+        self.cache = StateCache(self.pool.acquire)
+        self.queues = CommandQueues(self.pool.acquire)
+        self._server: typing.Optional[asyncio.AbstractServer] = None
+        # Addresses of the queues invalidating the cached state
+        self._subscribed: set[str] = set()
+
+        self.commands: dict[str, typing.Callable[..., typing.Awaitable]] = {
+            "devices": self.devices,
+            "open": self.open,
+            "close": self.close,
+            "stop": self.stop,
+            "position": self.position,
+            "battery": self.battery,
+            "illuminance": self.illuminance,
+        }
+
+    async def _get_device(self, address: typing.Optional[str]) -> BLEDevice:
+        if not address:
+            raise RequestError("No address given")
+
+        address = address.upper()
+        device = self.monitor.ble_devices.get(address)
+        if device is None:
+            device = await BleakScanner.find_device_by_address(
+                address, timeout=self.scan_timeout, **self._scanner_kwargs
+            )
+            if device is None:
+                raise RequestError(f"Device {address} not found")
+            self.monitor.ble_devices[address] = device
+
+        return device
+
+    async def _move(self, address: str, submit: typing.Callable) -> dict:
+        device = await self._get_device(address)
+        queue = self.queues[device]
+        if device.address not in self._subscribed:
+            self._subscribed.add(device.address)
+            queue.subscribe(
+                lambda result: self._on_command_result(device.address, result)
+            )
+        return _command_result(await submit(queue))
+
+    def _on_command_result(self, address: str, result: CommandResult):
+        # A preempted command may have been sent already, and moved the blind
+        if result.status != CommandStatus.COALESCED:
+            self.cache.invalidate(address, MessageType.REQUEST_SETTINGS)
+
+    async def devices(self) -> list:
+        return [
+            {
+                "address": address,
+                "name": device.name,
+                "connected": address in self.pool,
+            }
+            for address, device in sorted(self.monitor.ble_devices.items())
+        ]
+
+    async def open(self, address: str = None) -> dict:
+        return await self._move(address, lambda queue: queue.open())
+
+    async def close(self, address: str = None) -> dict:
+        return await self._move(address, lambda queue: queue.close())
+
+    async def stop(self, address: str = None) -> dict:
+        return await self._move(address, lambda queue: queue.stop())
+
+    async def position(
+        self, address: str = None, position: typing.Optional[int] = None
+    ) -> typing.Union[int, dict]:
+        """Sets the position if given, returns the current one otherwise"""
+        if position is None:
+            device = await self._get_device(address)
+            settings = await self.cache.get(device, MessageType.REQUEST_SETTINGS)
+            return settings.current_position
+
+        if not isinstance(position, int) or not 0 <= position <= 100:
+            raise RequestError("The position must be within 0..100")
+        return await self._move(address, lambda queue: queue.set_position(position))
+
+    async def battery(self, address: str = None) -> int:
+        device = await self._get_device(address)
+        status = await self.cache.get(device, MessageType.REQUEST_BATTERY_STATUS)
+        return status.level
+
+    async def illuminance(self, address: str = None) -> int:
+        device = await self._get_device(address)
+        illuminance = await self.cache.get(device, MessageType.REQUEST_ILLUMINANCE)
+        return illuminance.level
+
+    async def handle_request(self, request: typing.Any) -> dict:
+        try:
+            if not isinstance(request, dict):
+                raise RequestError("A request must be an object")
+            arguments = dict(request)
+            name = arguments.pop("command", None)
+            command = self.commands.get(name)
+            if command is None:
+                raise RequestError(f"Unknown command {name!r}")
+
+            try:
+                inspect.signature(command).bind(**arguments)
+            except TypeError as exc:
+                raise RequestError(f"Invalid arguments of {name}: {exc}") from exc
+
+            return {"result": await command(**arguments)}
+        except RequestError as exc:
+            return {"error": str(exc)}
+        except Exception as exc:
+            _LOGGER.debug("Request %r failed", request, exc_info=True)
+            return {"error": f"{type(exc).__name__}: {exc}"}
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = {"error": "Invalid JSON"}
+                else:
+                    response = await self.handle_request(request)
+
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError) as exc:
+            # ValueError: the line exceeds the limit
+            _LOGGER.debug("Connection dropped: %s", exc)
+        finally:
+            writer.close()
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            try:
+                _, writer = await asyncio.open_unix_connection(self.socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left by a daemon that didn't exit cleanly
+                os.unlink(self.socket_path)
+            else:
+                writer.close()
+                raise RuntimeError(f"Already running at {self.socket_path}")
+
+        # Created with no permissions for anyone but the owner
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(
+                self._handle_connection, self.socket_path, limit=MAX_REQUEST_SIZE
+            )
+        finally:
+            os.umask(umask)
+
+        if self.scan:
+            await self.monitor.start()
+            if self.pool.balancer is not None and self.adapters:
+                await self.pool.balancer.start(self.adapters)
+        _LOGGER.info("Listening at %s", self.socket_path)
+
+    async def stop_serving(self):
+        server, self._server = self._server, None
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+        await self.monitor.stop()
+        if self.pool.balancer is not None:
+            await self.pool.balancer.stop()
+        await self.queues.aclose()
+        await self.pool.close()
+
+    async def run(self):
+        """Serves until cancelled, or terminated by a signal"""
+        await self.start()
+        loop = asyncio.get_running_loop()
+        stopped = loop.create_future()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(
+                signum, lambda: stopped.done() or stopped.set_result(None)
+            )
+
+        try:
+            await stopped
+        finally:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(signum)
+            await self.stop_serving()
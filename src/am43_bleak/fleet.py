@@ -0,0 +1,110 @@
+import asyncio
+from dataclasses import dataclass
+import time
+import typing
+
+from bleak.backends.device import BLEDevice
+
+from .pool import ConnectionPool
+from .protocol import (
+    ContentControlDirect,
+    MessageType,
+    OperationResult,
+    PositionControl,
+)
+
+Target = typing.Union[PositionControl, ContentControlDirect]
+
+
+@dataclass
+class CommandOutcome:
+    device: BLEDevice
+    # Device confirmation, unless the command failed before it was received
+    result: typing.Optional[OperationResult] = None
+    error: typing.Optional[BaseException] = None
+    # time.monotonic() timestamps
+    scheduled_at: float = 0.0
+    connected_at: typing.Optional[float] = None
+    finished_at: typing.Optional[float] = None
+
+    @property
+    def is_success(self) -> bool:
+        return self.result is not None and bool(self.result.is_success)
+
+    @property
+    def connect_time(self) -> typing.Optional[float]:
+        """Seconds spent waiting for the connection, incl. queueing"""
+        if self.connected_at is None:
+            return None
+        return self.connected_at - self.scheduled_at
+
+    @property
+    def command_time(self) -> typing.Optional[float]:
+        if self.connected_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.connected_at
+
+    @property
+    def total_time(self) -> typing.Optional[float]:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.scheduled_at
+
+
+def _get_request(target: Target) -> tuple:
+    if isinstance(target, PositionControl):
+        return MessageType.CONTROL_POSITION, {"message": target}
+    if isinstance(target, ContentControlDirect):
+        return MessageType.CONTROL_DIRECT, {"action": target}
+
+    raise TypeError(f"Unsupported target {target!r}")
+
+
+async def _send(
+    pool: ConnectionPool,
+    outcome: CommandOutcome,
+    message_type: MessageType,
+    kwargs: dict,
+    delay: float,
+):
+    if delay:
+        await asyncio.sleep(delay)
+
+    outcome.scheduled_at = time.monotonic()
+    try:
+        async with pool.acquire(outcome.device) as client:
+            outcome.connected_at = time.monotonic()
+            response = await client.request(message_type, **kwargs)
+            outcome.result = response.payload.message
+    except Exception as exc:
+        outcome.error = exc
+    finally:
+        outcome.finished_at = time.monotonic()
+
+
+async def send_group_command(
+    pool: ConnectionPool,
+    devices: typing.Iterable[BLEDevice],
+    target: Target,
+    stagger: float = 0.0,
+) -> list[CommandOutcome]:
+    """Sends the same position or direct control to all the devices.
+
+    All the commands are issued at once (or `stagger` seconds apart), the pool
+    limits how many devices are connected at the same time. Devices already
+    connected go first, as they don't need a free connection slot. Failures
+    don't stop the other devices, they are reported in the outcomes, which
+    are returned in the order of `devices`.
+    """
+    message_type, kwargs = _get_request(target)
+    outcomes = [CommandOutcome(device) for device in devices]
+
+    order = sorted(outcomes, key=lambda o: o.device.address not in pool)
+    await asyncio.gather(
+        *(
+            _send(pool, outcome, message_type, kwargs, i * stagger)
+            for i, outcome in enumerate(order)
+        )
+    )
+
+    return outcomes
@@ -0,0 +1,139 @@
+from collections import OrderedDict
+import typing
+
+from .codec import compiled_message_format
+from .protocol import (
+    MESSAGE_CLASSES,
+    ContentControlDirect,
+    Message,
+    MessageType,
+    OperationResult,
+)
+
+# Frames which are always kept, no matter how many others are requested:
+# parameter-free requests and the direct controls
+CONSTANT_REQUESTS = (
+    (MessageType.REQUEST_SETTINGS, {}),
+    (MessageType.REQUEST_BATTERY_STATUS, {}),
+    (MessageType.REQUEST_ILLUMINANCE, {}),
+    *(
+        (MessageType.CONTROL_DIRECT, {"action": action})
+        for action in ContentControlDirect
+    ),
+)
+
+DEFAULT_FRAME_CACHE_SIZE = 128
+
+
+class FrameCache:
+    """Prebuilt frames for the frequently sent messages.
+
+    Constant frames, i.e. parameter-free requests, direct controls and
+    confirmations, are built once. Any other frame built through the cache,
+    e.g. `CONTROL_POSITION` with a specific position, is kept until
+    `maxsize` more recently used frames push it out.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_FRAME_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._frames = OrderedDict()
+        self._constant_frames = {}
+
+        for message_type, kwargs in CONSTANT_REQUESTS:
+            key = self._key(message_type, False, None, kwargs)
+            self._constant_frames[key] = self._build(message_type, False, None, kwargs)
+
+        # Confirmations in both directions
+        for key, message_classes in MESSAGE_CLASSES.items():
+            if OperationResult not in message_classes.allowed:
+                continue
+            message_type, is_device_response = key
+            for operation_result in (True, False):
+                key = self._key(message_type, is_device_response, operation_result, {})
+                self._constant_frames[key] = self._build(
+                    message_type, is_device_response, operation_result, {}
+                )
+
+    @staticmethod
+    def _key(
+        message_type: MessageType,
+        is_device_response: bool,
+        operation_result: typing.Optional[bool],
+        kwargs: dict,
+    ) -> tuple:
+        # Enums are equal to their values, but only the enums are accepted by
+        # the codec: `action=0xDD` must not be served the frame of
+        # `action=ContentControlDirect.OPEN`
+        return (
+            message_type,
+            is_device_response,
+            operation_result,
+            tuple(sorted((name, type(value), value) for name, value in kwargs.items())),
+        )
+
+    @staticmethod
+    def _build(
+        message_type: MessageType,
+        is_device_response: bool,
+        operation_result: typing.Optional[bool],
+        kwargs: dict,
+    ) -> bytes:
+        return compiled_message_format.build(
+            Message.prepare(
+                message_type=message_type,
+                is_device_response=is_device_response,
+                operation_result=operation_result,
+                **kwargs,
+            )
+        )
+
+    def build(
+        self,
+        message_type: MessageType,
+        is_device_response: bool = False,
+        operation_result: typing.Optional[bool] = None,
+        **kwargs,
+    ) -> bytes:
+        """Same as `Message.prepare()` followed by a build, but cached"""
+        key = self._key(message_type, is_device_response, operation_result, kwargs)
+
+        try:
+            frame = self._constant_frames.get(key)
+            if frame is None:
+                frame = self._frames[key]
+                self._frames.move_to_end(key)
+            return frame
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable arguments, e.g. nested messages, are never cached
+            return self._build(
+                message_type, is_device_response, operation_result, kwargs
+            )
+
+        frame = self._build(message_type, is_device_response, operation_result, kwargs)
+        self._frames[key] = frame
+        if len(self._frames) > self.maxsize:
+            self._frames.popitem(last=False)
+
+        return frame
+
+    def build_confirmation(self, message: Message, is_success: bool) -> bytes:
+        """Same as `Message.prepare_confirmation()` followed by a build"""
+        if not message.is_confirmation_expected:
+            raise ValueError("Current message doesn't expect a confirmation")
+
+        return self.build(
+            MessageType(message.payload.message_type),
+            is_device_response=not message.is_device_response,
+            operation_result=is_success,
+        )
+
+    def clear(self):
+        self._frames.clear()
+
+    def __len__(self) -> int:
+        return len(self._constant_frames) + len(self._frames)
+
+
+frame_cache = FrameCache()
@@ -0,0 +1,250 @@
+"""Optional instrumentation of the clients.
+
+Given to `AM43Client(instrumentation=...)`, an `Instrumentation` collects:
+
+* time spent encoding and decoding frames, per message type;
+* round-trip time histograms of the requests, per device;
+* requests, retries and timeouts, along with the retry settings;
+* frames dropped for a wrong checksum or footer, and confirmations sent.
+
+Everything is kept in plain dicts, rendered in the Prometheus text format by
+`render()`, and passed to the hooks as `Event`s as it happens. Clients
+without an instrumentation only pay for an `is None` check.
+
+    instrumentation = Instrumentation()
+    instrumentation.subscribe(print)
+    client = AM43Client(device, instrumentation=instrumentation)
+"""
+
+from bisect import bisect_left
+import logging
+import time
+import typing
+
+from .protocol import Message, MessageType
+
+_LOGGER = logging.getLogger(__name__)
+
+# Upper bounds of the round-trip time buckets, in seconds
+DEFAULT_RTT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Event(typing.NamedTuple):
+    # Name of the metric, e.g. "rtt_seconds"
+    name: str
+    address: typing.Optional[str]
+    message_type: typing.Optional[MessageType]
+    value: float
+
+
+class Histogram:
+    def __init__(self, buckets: typing.Sequence[float]):
+        self.buckets = tuple(buckets)
+        # Observations per bucket, the last one is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> typing.Iterator[tuple[str, int]]:
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            yield (bound if isinstance(bound, str) else repr(float(bound))), total
+
+
+class TimedFormat:
+    """Wraps a message format, timing `build()` and `parse()`"""
+
+    def __init__(self, instrumentation: "Instrumentation", message_format):
+        self.instrumentation = instrumentation
+        self.message_format = message_format
+
+    def parse(self, data: bytes) -> Message:
+        started = time.perf_counter()
+        message = self.message_format.parse(data)
+        self.instrumentation.record_decode(
+            message.payload.message_type, time.perf_counter() - started
+        )
+        return message
+
+    def build(self, message: Message) -> bytes:
+        started = time.perf_counter()
+        frame = self.message_format.build(message)
+        self.instrumentation.record_encode(
+            message.payload.message_type, time.perf_counter() - started
+        )
+        return frame
+
+
+def _message_type_name(message_type: int) -> str:
+    try:
+        return MessageType(message_type).name
+    except ValueError:
+        return f"0x{message_type:02X}"
+
+
+def _labels(**labels) -> str:
+    return ",".join(
+        f'{name}="{value}"' for name, value in labels.items() if value is not None
+    )
+
+
+class Instrumentation:
+    # name -> (type, help) of the exported metrics
+    METRICS = {
+        "encode_seconds": ("summary", "Time spent building frames"),
+        "decode_seconds": ("summary", "Time spent parsing frames"),
+        "rtt_seconds": ("histogram", "Time from the last write to the responses"),
+        "requests_total": ("counter", "Requests answered"),
+        "retries_total": ("counter", "Requests re-sent for the lack of a response"),
+        "timeouts_total": ("counter", "Requests left unanswered after all retries"),
+        "malformed_frames_total": (
+            "counter",
+            "Frames dropped for a wrong checksum or footer",
+        ),
+        "confirmations_total": ("counter", "Confirmations sent to the device"),
+        "retry_timeout_seconds": ("gauge", "Time to wait before re-sending"),
+        "retry_count": ("gauge", "Attempts per request"),
+    }
+
+    def __init__(
+        self, prefix: str = "am43", rtt_buckets: typing.Sequence[float] = None
+    ):
+        self.prefix = prefix
+        self.rtt_buckets = tuple(rtt_buckets or DEFAULT_RTT_BUCKETS)
+        # message type -> [count, sum]
+        self.encode_time: dict[int, list] = {}
+        self.decode_time: dict[int, list] = {}
+        # address -> Histogram
+        self.rtt: dict[str, Histogram] = {}
+        # (name, address) -> value
+        self.counters: dict[tuple, float] = {}
+        self.gauges: dict[tuple, float] = {}
+        self._hooks: list[typing.Callable[[Event], None]] = []
+
+    def subscribe(
+        self, callback: typing.Callable[[Event], None]
+    ) -> typing.Callable[[], None]:
+        """Calls `callback` with every recorded `Event`, returns the unsubscribe"""
+        self._hooks.append(callback)
+        return lambda: self._hooks.remove(callback)
+
+    def _emit(
+        self,
+        name: str,
+        address: typing.Optional[str],
+        message_type: typing.Optional[int],
+        value: float,
+    ):
+        if not self._hooks:
+            return
+
+        event = Event(name, address, message_type, value)
+        for hook in list(self._hooks):
+            try:
+                hook(event)
+            except Exception:
+                _LOGGER.exception("Error in an instrumentation hook")
+
+    def _count(self, name: str, address: str, value: float = 1):
+        key = (name, address)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def wrap_format(self, message_format) -> TimedFormat:
+        return TimedFormat(self, message_format)
+
+    def record_encode(self, message_type: int, elapsed: float):
+        summary = self.encode_time.setdefault(int(message_type), [0, 0.0])
+        summary[0] += 1
+        summary[1] += elapsed
+        self._emit("encode_seconds", None, message_type, elapsed)
+
+    def record_decode(self, message_type: int, elapsed: float):
+        summary = self.decode_time.setdefault(int(message_type), [0, 0.0])
+        summary[0] += 1
+        summary[1] += elapsed
+        self._emit("decode_seconds", None, message_type, elapsed)
+
+    def record_client(self, address: str, retry_timeout: float, retry_count: int):
+        self.gauges[("retry_timeout_seconds", address)] = retry_timeout
+        self.gauges[("retry_count", address)] = retry_count
+
+    def record_request(
+        self, address: str, message_type: int, rtt: float, attempts: int
+    ):
+        histogram = self.rtt.get(address)
+        if histogram is None:
+            histogram = self.rtt[address] = Histogram(self.rtt_buckets)
+        histogram.observe(rtt)
+        self._count("requests_total", address)
+        self._emit("rtt_seconds", address, message_type, rtt)
+        if attempts > 1:
+            self._count("retries_total", address, attempts - 1)
+            self._emit("retries_total", address, message_type, attempts - 1)
+
+    def record_timeout(self, address: str, message_type: int, attempts: int):
+        self._count("timeouts_total", address)
+        self._count("retries_total", address, attempts - 1)
+        self._emit("timeouts_total", address, message_type, 1)
+
+    def record_malformed_frames(self, address: str, count: int):
+        self._count("malformed_frames_total", address, count)
+        self._emit("malformed_frames_total", address, None, count)
+
+    def record_confirmation(self, address: str, message_type: int):
+        self._count("confirmations_total", address)
+        self._emit("confirmations_total", address, message_type, 1)
+
+    def render(self) -> str:
+        """Snapshot in the Prometheus text exposition format"""
+        lines = []
+
+        def header(name: str):
+            kind, description = self.METRICS[name]
+            lines.append(f"# HELP {self.prefix}_{name} {description}")
+            lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        for name, summaries in (
+            ("encode_seconds", self.encode_time),
+            ("decode_seconds", self.decode_time),
+        ):
+            if not summaries:
+                continue
+            header(name)
+            for message_type, (count, total) in sorted(summaries.items()):
+                labels = _labels(message_type=_message_type_name(message_type))
+                lines.append(f"{self.prefix}_{name}_sum{{{labels}}} {total!r}")
+                lines.append(f"{self.prefix}_{name}_count{{{labels}}} {count}")
+
+        if self.rtt:
+            header("rtt_seconds")
+            for address, histogram in sorted(self.rtt.items()):
+                for bound, count in histogram.cumulative():
+                    labels = _labels(address=address, le=bound)
+                    lines.append(
+                        f"{self.prefix}_rtt_seconds_bucket{{{labels}}} {count}"
+                    )
+                labels = _labels(address=address)
+                lines.append(
+                    f"{self.prefix}_rtt_seconds_sum{{{labels}}} {histogram.sum!r}"
+                )
+                lines.append(
+                    f"{self.prefix}_rtt_seconds_count{{{labels}}} {histogram.count}"
+                )
+
+        for values in (self.counters, self.gauges):
+            for name in self.METRICS:
+                samples = sorted((a, v) for (n, a), v in values.items() if n == name)
+                if not samples:
+                    continue
+                header(name)
+                for address, value in samples:
+                    labels = _labels(address=address)
+                    lines.append(f"{self.prefix}_{name}{{{labels}}} {value}")
+
+        return "\n".join(lines) + "\n"
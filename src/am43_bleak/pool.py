@@ -0,0 +1,315 @@
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+import logging
+import time
+import typing
+
+from bleak.backends.device import BLEDevice
+from bleak_retry_connector import device_source
+
+from .balancer import AdapterBalancer
+from .client import AM43Client, CircuitOpenError, DisconnectedError
+from .const import DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_CONNECTIONS
+from .retry import CircuitState, RetryPolicies
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_ADAPTER = "default"
+
+
+def get_adapter(device: BLEDevice) -> str:
+    """Name of the adapter the device is seen by, as far as it's known"""
+    source = device_source(device)
+    if source:
+        return source
+
+    if isinstance(device.details, dict):
+        # BlueZ: {"path": ..., "props": {"Adapter": "/org/bluez/hci0", ...}}
+        adapter = device.details.get("props", {}).get("Adapter")
+        if adapter:
+            return adapter.rsplit("/", 1)[-1]
+
+    return DEFAULT_ADAPTER
+
+
+@dataclass(eq=False)
+class _Session:
+    client: AM43Client
+    adapter: str
+    # Connected and authenticated
+    ready: asyncio.Future
+    users: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+    expire_handle: typing.Optional[asyncio.TimerHandle] = None
+
+    @property
+    def is_alive(self) -> bool:
+        if not self.ready.done():
+            return True
+        return self.ready.exception() is None and self.client.is_connected
+
+
+class ConnectionPool:
+    """Authenticated connections to many devices, kept for reuse.
+
+    At most `max_connections` devices are connected through every adapter.
+    When a device has to be connected while its adapter is full, the least
+    recently used idle connection is closed to make room; if all of them are
+    in use, the request waits until one is released. Connections unused for
+    `idle_timeout` seconds are closed as well.
+
+    With `retry_policies`, devices with an open circuit aren't connected to,
+    and failed connections count as their failures.
+
+    With `warm_up`, new connections are set up by `AM43Client.warm_up()`:
+    the authentication, time sync and state fetch are pipelined, and the
+    state is available as `client.snapshot` right away.
+
+    With a `balancer`, new connections are placed on the adapter it picks
+    among the ones the device was seen by, and the outcome of every
+    connection is reported back to it.
+    """
+
+    def __init__(
+        self,
+        pins: typing.Optional[typing.Mapping[str, int]] = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        client_factory: typing.Callable[[BLEDevice], AM43Client] = AM43Client,
+        retry_policies: typing.Optional[RetryPolicies] = None,
+        warm_up: bool = False,
+        balancer: typing.Optional[AdapterBalancer] = None,
+    ):
+        # address -> PIN, devices without one aren't authenticated
+        self.pins = pins or {}
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.client_factory = client_factory
+        self.retry_policies = retry_policies
+        self.warm_up = warm_up
+        self.balancer = balancer
+        # address -> session, least recently used first
+        self._sessions: dict[str, _Session] = {}
+        # adapter -> removed sessions still being disconnected, their slots
+        # aren't free yet
+        self._closing: dict[str, int] = {}
+        self._condition = asyncio.Condition()
+        self._background_tasks = set()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, address: str) -> bool:
+        session = self._sessions.get(address)
+        return session is not None and session.is_alive
+
+    def _count(self, adapter: str) -> int:
+        return self._closing.get(adapter, 0) + sum(
+            1 for s in self._sessions.values() if s.adapter == adapter
+        )
+
+    def _loads(self) -> dict[str, int]:
+        """adapter -> open connections"""
+        ret = dict(self._closing)
+        for session in self._sessions.values():
+            ret[session.adapter] = ret.get(session.adapter, 0) + 1
+        return ret
+
+    def _find_idle(self, adapter: str) -> typing.Optional[str]:
+        for address, session in self._sessions.items():
+            if session.adapter == adapter and session.users == 0:
+                return address
+
+        return None
+
+    def _remove(self, address: str) -> _Session:
+        session = self._sessions.pop(address)
+        if session.expire_handle is not None:
+            session.expire_handle.cancel()
+            session.expire_handle = None
+
+        return session
+
+    @asynccontextmanager
+    async def acquire(self, device: BLEDevice) -> typing.AsyncIterator[AM43Client]:
+        """Connected and authenticated client of the device, for the duration
+        of the context"""
+        session = await self._get_session(device)
+        try:
+            yield session.client
+        finally:
+            await self._release(device.address, session)
+
+    async def _get_session(self, device: BLEDevice) -> _Session:
+        address = device.address
+        seen_device = device
+
+        while True:
+            if (
+                self.retry_policies is not None
+                and address not in self
+                # Half-open circuits are probed by the request itself
+                and self.retry_policies[address].state == CircuitState.OPEN
+            ):
+                raise CircuitOpenError(f"{address} keeps failing")
+
+            evicted = None
+            async with self._condition:
+                session = self._sessions.get(address)
+                if session is not None and not session.is_alive:
+                    self._remove(address)
+                    session = None
+                    self._condition.notify_all()
+
+                if session is None and self.balancer is not None:
+                    # Placed anew every time, the loads may have changed
+                    device = self.balancer.choose(
+                        seen_device, self._loads(), self.max_connections
+                    )
+                adapter = get_adapter(device)
+
+                if session is not None:
+                    is_new = False
+                elif self._count(adapter) < self.max_connections:
+                    session = _Session(
+                        client=self.client_factory(device),
+                        adapter=adapter,
+                        ready=asyncio.get_running_loop().create_future(),
+                    )
+                    self._sessions[address] = session
+                    is_new = True
+                else:
+                    evicted = self._find_idle(adapter)
+                    if evicted is None:
+                        await self._condition.wait()
+                        continue
+
+                    evicted = self._remove_closing(evicted)
+
+                if session is not None:
+                    session.users += 1
+                    if session.expire_handle is not None:
+                        session.expire_handle.cancel()
+                        session.expire_handle = None
+                    # Most recently used go last
+                    self._sessions[address] = self._sessions.pop(address)
+
+            if evicted is not None:
+                # The slot is only free once the device is disconnected
+                _LOGGER.debug("Evicting %s", evicted.client.device.address)
+                await self._close_session(evicted)
+                continue
+
+            break
+
+        try:
+            if is_new:
+                await self._connect(session, device)
+            else:
+                await asyncio.shield(session.ready)
+        except BaseException:
+            await self._release(address, session)
+            raise
+
+        return session
+
+    async def _connect(self, session: _Session, device: BLEDevice):
+        try:
+            await self._connect_client(session)
+            pin = self.pins.get(device.address)
+            if self.warm_up:
+                await session.client.warm_up(pin)
+            elif pin is not None:
+                await session.client.authenticate(pin)
+        except BaseException as exc:
+            session.ready.set_exception(
+                exc
+                if isinstance(exc, Exception)
+                else DisconnectedError("Connection was cancelled")
+            )
+            # Retrieved here, the waiting requests get it from `shield()`
+            session.ready.exception()
+            await self._disconnect(session)
+            raise
+
+        session.ready.set_result(None)
+
+    async def _connect_client(self, session: _Session):
+        address = session.client.device.address
+        try:
+            await session.client.connect()
+        except Exception:
+            # Failures of the requests, incl. authentication, are counted by
+            # the client itself
+            if self.retry_policies is not None:
+                self.retry_policies[address].on_failure()
+            if self.balancer is not None:
+                self.balancer.on_connect_failure(address, session.adapter)
+            raise
+
+        if self.balancer is not None:
+            self.balancer.on_connect_success(address, session.adapter)
+
+    def _remove_closing(self, address: str) -> _Session:
+        """Removes the session, keeping its slot taken until
+        `_close_session()`"""
+        session = self._remove(address)
+        self._closing[session.adapter] = self._closing.get(session.adapter, 0) + 1
+        return session
+
+    async def _close_session(self, session: _Session):
+        try:
+            await self._disconnect(session)
+        finally:
+            async with self._condition:
+                self._closing[session.adapter] -= 1
+                if not self._closing[session.adapter]:
+                    del self._closing[session.adapter]
+                self._condition.notify_all()
+
+    @staticmethod
+    async def _disconnect(session: _Session):
+        try:
+            await session.client.disconnect()
+        except Exception as exc:
+            _LOGGER.debug("Failed to disconnect: %s", exc)
+
+    async def _release(self, address: str, session: _Session):
+        async with self._condition:
+            session.users -= 1
+            session.last_used = time.monotonic()
+
+            if self._sessions.get(address) is session:
+                if not session.is_alive:
+                    self._remove(address)
+                elif session.users == 0:
+                    session.expire_handle = asyncio.get_running_loop().call_later(
+                        self.idle_timeout,
+                        self._on_idle_timeout,
+                        address,
+                        session,
+                    )
+
+            self._condition.notify_all()
+
+    def _on_idle_timeout(self, address: str, session: _Session):
+        task = asyncio.ensure_future(self._expire(address, session))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _expire(self, address: str, session: _Session):
+        async with self._condition:
+            if self._sessions.get(address) is not session or session.users:
+                return
+            self._remove_closing(address)
+
+        _LOGGER.debug("Closing idle connection to %s", address)
+        await self._close_session(session)
+
+    async def close(self):
+        async with self._condition:
+            sessions = [self._remove(address) for address in list(self._sessions)]
+            self._condition.notify_all()
+
+        await asyncio.gather(*(self._disconnect(s) for s in sessions))
@@ -1,5 +1,7 @@
+from collections.abc import Mapping
 from dataclasses import dataclass
 from datetime import datetime, tzinfo
+from types import MappingProxyType
 import typing
 
 from construct import (
@@ -9,19 +11,23 @@ from construct import (
     Checksum,
     Computed,
     Const,
+    Construct,
     Default,
     Error,
     ExprValidator,
     Flag,
     Hex,
     HexDump,
+    IfThenElse,
     Int8ub,
     Int16ub,
     Optional,
     PaddedString,
+    Pass,
     RawCopy,
     Rebuild,
     Select,
+    SizeofError,
     Switch,
     obj_,
     this,
@@ -57,13 +63,14 @@ class MessageType(EnumBase):
     UPDATE_LIMIT_OR_RESET = 0x22
 
     # Device notifications
-    FAULT = 0xA6  # TODO: not implemented
+    FAULT = 0xA6
     LIST_TIMERS = 0xA8
     LIST_SEASONS = 0xA9
 
-    # The purpose of the two following commands is unclear. Device does not
-    # provide any adequate response for these, apart from `OperationResult`
-    # with `message_type` set to `UNSPECIFIED`.
+    # Device does not provide any adequate response to the two following
+    # requests, apart from `OperationResult` with `message_type` set to
+    # `UNSPECIFIED`. The same message types are used by the device to notify
+    # about the position and the speed of the motor, while it's moving.
     REQUEST_POSITION = 0xA1
     REQUEST_SPEED = 0xA3
     UNSPECIFIED = 0x00
@@ -161,10 +168,15 @@ class UpdateDeviceTime(DataclassMixin):
     minute: int = csfield(ExprValidator(Int8ub, obj_ >= 0 and obj_ <= 59))
     second: int = csfield(ExprValidator(Int8ub, obj_ >= 0 and obj_ <= 59))
 
+    @staticmethod
     def now(tz: tzinfo = None) -> "UpdateDeviceTime":
         now = datetime.now(tz)
         return UpdateDeviceTime(
-            (now.weekday + 1) % 7, hour=now.hour, minute=now.minute, second=now.second
+            # weekday() starts with Monday as 0, the device with Sunday
+            DayOfWeek((now.weekday() + 1) % 7),
+            hour=now.hour,
+            minute=now.minute,
+            second=now.second,
         )
 
 
@@ -331,6 +343,24 @@ class BatteryStatusResponse(DataclassMixin):
     level: int = csfield(Int8ub)
 
 
+@dataclass
+class PositionNotification(DataclassMixin):
+    # 0 is fully open, 100 fully closed, as in `SettingsResponse`
+    position: int = csfield(Int8ub)
+
+
+@dataclass
+class SpeedNotification(DataclassMixin):
+    # RPM of the motor, 0 once it's stopped
+    speed: int = csfield(Int8ub)
+
+
+@dataclass
+class FaultNotification(DataclassMixin):
+    # Device-specific code, e.g. the motor got stuck
+    code: int = csfield(Hex(Int8ub))
+
+
 @dataclass
 class Password(DataclassMixin):
     pin: int = csfield(ExprValidator(Int16ub, obj_ >= 0 and obj_ <= 9999))
@@ -395,76 +425,175 @@ class UpdateSeason(DataclassMixin):
     season: Season = csfield(DataclassBitStruct(Season))
 
 
+_message_structs = {}
+
+
+def get_message_struct(message_class: type) -> Construct:
+    if message_class not in _message_structs:
+        _message_structs[message_class] = (
+            DataclassBitStruct(message_class)
+            if issubclass(message_class, DataclassBitMixin)
+            else DataclassStruct(message_class)
+        )
+
+    return _message_structs[message_class]
+
+
+_message_sizes = {}
+
+# Message classes whose fields take the rest of the payload, so the size
+# can't be taken from construct without knowing it in advance
+_variable_message_sizes = {
+    ListTimersResponse: lambda message: (
+        len(message.timers) * get_message_struct(Timer).sizeof()
+    ),
+    UpdateName: lambda message: len(message.new_name.encode("utf8")),
+}
+
+
+def get_message_size(message: typing.Any) -> int:
+    if not isinstance(message, DataclassMixin):
+        return len(message)
+
+    message_class = message.__class__
+    if message_class not in _message_sizes:
+        try:
+            _message_sizes[message_class] = get_message_struct(message_class).sizeof()
+        except SizeofError:
+            # The size depends on the content, e.g. names or lists of timers
+            _message_sizes[message_class] = None
+
+    size = _message_sizes[message_class]
+    if size is None:
+        get_size = _variable_message_sizes.get(message_class)
+        if get_size is None:
+            return len(get_message_struct(message_class).build(message))
+        size = get_size(message)
+
+    return size
+
+
+class MessageTypeMap(Mapping):
+    """Message type -> construct of the allowed message classes.
+
+    Constructs are only built when a message type is parsed or built for the
+    first time, the message classes are known upfront.
+
+    Messages of the `raw_fallback` types, whose layouts are guessed, are only
+    decoded when they have the expected size, and kept as raw bytes otherwise.
+    """
+
+    def __init__(self, message_classes: dict, raw_fallback: typing.Iterable = ()):
+        # message_type -> message classes, in the order they're tried
+        self.message_classes = message_classes
+        self.raw_fallback = frozenset(raw_fallback)
+        self._constructs = {}
+
+    def __getitem__(self, message_type: MessageType) -> Construct:
+        con = self._constructs.get(message_type)
+        if con is None:
+            subcons = [
+                get_message_struct(c) for c in self.message_classes[message_type]
+            ]
+            con = subcons[0] if len(subcons) == 1 else Select(*subcons)
+            if message_type in self.raw_fallback:
+                con = IfThenElse(
+                    this._message_size == con.sizeof(),
+                    con,
+                    HexDump(Bytes(this._message_size)),
+                )
+            self._constructs[message_type] = con
+
+        return con
+
+    def __iter__(self) -> typing.Iterator[MessageType]:
+        return iter(self.message_classes)
+
+    def __len__(self) -> int:
+        return len(self.message_classes)
+
+
+class MessageTypeSwitch(Switch):
+    """`Switch` over a `MessageTypeMap`, which doesn't build all the cases"""
+
+    def __init__(self, keyfunc, cases: MessageTypeMap, default=None):
+        # `Switch.__init__()` walks through all the cases for `flagbuildnone`,
+        # which is always false for messages anyway
+        Construct.__init__(self)
+        self.keyfunc = keyfunc
+        self.cases = cases
+        self.default = Pass if default is None else default
+        self.flagbuildnone = False
+
+
 @dataclass
 class Payload(DataclassMixin):
-    REQUEST_MESSAGE_TYPE_MAP = {
-        MessageType.PASSWORD: DataclassStruct(Password),
-        MessageType.PASSWORD_CHANGE: DataclassStruct(Password),
-        MessageType.UPDATE_NAME: DataclassStruct(UpdateName),
-        MessageType.CONTROL_DIRECT: DataclassStruct(DirectControl),
-        MessageType.UPDATE_DEVICE_TIME: DataclassStruct(UpdateDeviceTime),
-        MessageType.REQUEST_SETTINGS: DataclassStruct(AlwaysOne),
-        MessageType.REQUEST_BATTERY_STATUS: Select(
-            DataclassStruct(AlwaysOne), DataclassStruct(OperationResult)
-        ),
-        MessageType.REQUEST_ILLUMINANCE: DataclassStruct(AlwaysOne),
-        MessageType.REQUEST_POSITION: DataclassStruct(AlwaysOne),
-        MessageType.UPDATE_TIMER: DataclassStruct(UpdateTimer),
-        MessageType.CONTROL_POSITION: DataclassStruct(PositionControl),
-        MessageType.UPDATE_LIMIT_OR_RESET: DataclassStruct(LimitOrReset),
-        MessageType.UPDATE_SEASON: DataclassStruct(UpdateSeason),
-        MessageType.UPDATE_SETTINGS: Select(
-            DataclassBitStruct(UpdateSettings), DataclassBitStruct(UpdateDeviceType)
-        ),
-        MessageType.REQUEST_SPEED: DataclassStruct(AlwaysOne),
-        MessageType.FAULT: DataclassStruct(OperationResult),
-    }
+    REQUEST_MESSAGE_TYPE_MAP = MessageTypeMap(
+        {
+            MessageType.PASSWORD: (Password,),
+            MessageType.PASSWORD_CHANGE: (Password,),
+            MessageType.UPDATE_NAME: (UpdateName,),
+            MessageType.CONTROL_DIRECT: (DirectControl,),
+            MessageType.UPDATE_DEVICE_TIME: (UpdateDeviceTime,),
+            MessageType.REQUEST_SETTINGS: (AlwaysOne,),
+            MessageType.REQUEST_BATTERY_STATUS: (AlwaysOne, OperationResult),
+            MessageType.REQUEST_ILLUMINANCE: (AlwaysOne,),
+            MessageType.REQUEST_POSITION: (AlwaysOne,),
+            MessageType.UPDATE_TIMER: (UpdateTimer,),
+            MessageType.CONTROL_POSITION: (PositionControl,),
+            MessageType.UPDATE_LIMIT_OR_RESET: (LimitOrReset,),
+            MessageType.UPDATE_SEASON: (UpdateSeason,),
+            MessageType.UPDATE_SETTINGS: (UpdateSettings, UpdateDeviceType),
+            MessageType.REQUEST_SPEED: (AlwaysOne,),
+            MessageType.FAULT: (OperationResult,),
+        }
+    )
 
-    RESPONSE_MESSAGE_TYPE_MAP = {
-        MessageType.REQUEST_BATTERY_STATUS: DataclassStruct(BatteryStatusResponse),
-        MessageType.UPDATE_NAME: DataclassStruct(OperationResult),
-        MessageType.PASSWORD_CHANGE: DataclassStruct(OperationResult),
-        MessageType.PASSWORD: DataclassStruct(OperationResult),
-        MessageType.CONTROL_DIRECT: DataclassStruct(OperationResult),
-        MessageType.CONTROL_POSITION: DataclassStruct(OperationResult),
-        MessageType.UPDATE_DEVICE_TIME: DataclassStruct(OperationResult),
-        MessageType.REQUEST_SETTINGS: DataclassBitStruct(SettingsResponse),
-        MessageType.LIST_TIMERS: DataclassStruct(ListTimersResponse),
-        MessageType.UPDATE_TIMER: DataclassStruct(OperationResult),
-        MessageType.REQUEST_ILLUMINANCE: DataclassStruct(IlluminanceLevel),
-        MessageType.UPDATE_LIMIT_OR_RESET: DataclassStruct(LimitOrResetResult),
-        MessageType.LIST_SEASONS: DataclassStruct(ListSeasonsResponse),
-        MessageType.UPDATE_SEASON: DataclassStruct(OperationResult),
-        MessageType.UPDATE_SETTINGS: DataclassStruct(OperationResult),
-        MessageType.UNSPECIFIED: DataclassStruct(OperationResult),
-    }
+    RESPONSE_MESSAGE_TYPE_MAP = MessageTypeMap(
+        {
+            MessageType.REQUEST_BATTERY_STATUS: (BatteryStatusResponse,),
+            MessageType.UPDATE_NAME: (OperationResult,),
+            MessageType.PASSWORD_CHANGE: (OperationResult,),
+            MessageType.PASSWORD: (OperationResult,),
+            MessageType.CONTROL_DIRECT: (OperationResult,),
+            MessageType.CONTROL_POSITION: (OperationResult,),
+            MessageType.UPDATE_DEVICE_TIME: (OperationResult,),
+            MessageType.REQUEST_SETTINGS: (SettingsResponse,),
+            MessageType.LIST_TIMERS: (ListTimersResponse,),
+            MessageType.UPDATE_TIMER: (OperationResult,),
+            MessageType.REQUEST_ILLUMINANCE: (IlluminanceLevel,),
+            MessageType.UPDATE_LIMIT_OR_RESET: (LimitOrResetResult,),
+            MessageType.LIST_SEASONS: (ListSeasonsResponse,),
+            MessageType.UPDATE_SEASON: (OperationResult,),
+            MessageType.UPDATE_SETTINGS: (OperationResult,),
+            MessageType.UNSPECIFIED: (OperationResult,),
+            MessageType.REQUEST_POSITION: (PositionNotification,),
+            MessageType.REQUEST_SPEED: (SpeedNotification,),
+            MessageType.FAULT: (FaultNotification,),
+        },
+        # No public description of the notifications exists
+        raw_fallback=(
+            MessageType.REQUEST_POSITION,
+            MessageType.REQUEST_SPEED,
+            MessageType.FAULT,
+        ),
+    )
 
     _header: bytes = csfield(Hex(Const(b"\x9A")))
     message_type: MessageType = csfield(Hex(TEnum(Int8ub, MessageType)))
     _message_size: int = csfield(
-        Rebuild(
-            Int8ub,
-            lambda ctx: len(
-                DataclassBitStruct(ctx.message.__class__).build(ctx.message)
-                if isinstance(ctx.message, DataclassBitMixin)
-                else (
-                    DataclassStruct(ctx.message.__class__).build(ctx.message)
-                    if isinstance(ctx.message, DataclassMixin)
-                    else ctx.message
-                )
-            ),
-        )
+        Rebuild(Int8ub, lambda ctx: get_message_size(ctx.message))
     )
     message: typing.Any = csfield(
         Switch(
             lambda ctx: ctx._.is_device_response,
             {
-                True: Switch(
+                True: MessageTypeSwitch(
                     this.message_type,
                     RESPONSE_MESSAGE_TYPE_MAP,
                     HexDump(Bytes(this._message_size)),
                 ),
-                False: Switch(
+                False: MessageTypeSwitch(
                     this.message_type,
                     REQUEST_MESSAGE_TYPE_MAP,
                     HexDump(Bytes(this._message_size)),
@@ -474,6 +603,47 @@ class Payload(DataclassMixin):
     )
 
 
+class MessageClasses(typing.NamedTuple):
+    # Message classes allowed in the payload, in the order of preference
+    allowed: tuple
+    # Whether the other side confirms the message with an `OperationResult`
+    is_confirmation_expected: bool
+    # Class used when no message is provided to `Message.prepare()`
+    default: typing.Optional[type]
+
+
+def _build_message_classes() -> typing.Mapping:
+    classes = {
+        (message_type, is_device_response): message_classes
+        for is_device_response, message_type_map in (
+            (False, Payload.REQUEST_MESSAGE_TYPE_MAP),
+            (True, Payload.RESPONSE_MESSAGE_TYPE_MAP),
+        )
+        for message_type, message_classes in message_type_map.message_classes.items()
+    }
+
+    # Some messages are only sent by one side, but still may be confirmed
+    keys = set(classes) | {(m, not is_response) for m, is_response in classes}
+
+    ret = {}
+    for message_type, is_device_response in keys:
+        allowed = classes.get((message_type, is_device_response), ())
+        ret[(message_type, is_device_response)] = MessageClasses(
+            allowed=allowed,
+            is_confirmation_expected=OperationResult
+            in classes.get((message_type, not is_device_response), ()),
+            default=(
+                AlwaysOne if AlwaysOne in allowed else (allowed[0] if allowed else None)
+            ),
+        )
+
+    return MappingProxyType(ret)
+
+
+# (message_type, is_device_response) -> MessageClasses
+MESSAGE_CLASSES = _build_message_classes()
+
+
 # Tag present only in client->device messages
 CLIENT_MESSAGE_TAG = b"\x00\xFF\x00\x00"
 
@@ -521,45 +691,20 @@ class Message(DataclassMixin):
         )
     )
 
-    @classmethod
-    def __get_possible_message_classes(
-        cls,
-        message_type: MessageType = None,
-        is_device_response: bool = False,
-    ) -> list:
-        con = (
-            Payload.RESPONSE_MESSAGE_TYPE_MAP[message_type]
-            if is_device_response
-            else Payload.REQUEST_MESSAGE_TYPE_MAP[message_type]
-        )
-
-        ret = []
-
-        if isinstance(con, DataclassStruct):
-            ret.append(con.dc_type)
-        elif hasattr(con, "subcons"):
-            for subcon in con.subcons:
-                if isinstance(subcon, DataclassStruct):
-                    ret.append(subcon.dc_type)
-                elif hasattr(subcon, "subcon") and isinstance(
-                    subcon.subcon, DataclassStruct
-                ):
-                    ret.append(subcon.subcon.dc_type)
-
-        return ret
-
     @property
     def is_confirmation_expected(self) -> bool:
-        return OperationResult in self.__get_possible_message_classes(
-            self.payload.message_type, not self.is_device_response
+        message_classes = MESSAGE_CLASSES.get(
+            (self.payload.message_type, self.is_device_response)
         )
+        return message_classes is not None and message_classes.is_confirmation_expected
 
     def prepare_confirmation(self, is_success: bool) -> "Message":
         if not self.is_confirmation_expected:
             raise ValueError("Current message doesn't expect a confirmation")
 
         return self.prepare(
-            message_type=self.payload.message_type,
+            # Parsed message types are plain integers, see `Payload.message_type`
+            message_type=MessageType(self.payload.message_type),
             is_device_response=not self.is_device_response,
             operation_result=is_success,
         )
@@ -580,9 +725,10 @@ class Message(DataclassMixin):
                     "You must provide either payload, or message_type and message/kwargs"
                 )
 
-            allowed_message_classes = cls.__get_possible_message_classes(
-                message_type, is_device_response
-            )
+            message_classes = MESSAGE_CLASSES[(message_type, is_device_response)]
+            allowed_message_classes = message_classes.allowed
+            if not allowed_message_classes:
+                raise KeyError(message_type)
 
             if operation_result is not None:
                 if message is not None:
@@ -603,7 +749,7 @@ class Message(DataclassMixin):
                         else ContentOperationResult.FAILURE
                     )
                     message.is_success = operation_result
-                elif AlwaysOne in allowed_message_classes:
+                elif message_classes.default is AlwaysOne:
                     message = AlwaysOne()
 
             if message is not None:
@@ -617,7 +763,7 @@ class Message(DataclassMixin):
             else:
                 payload = Payload(
                     message_type=message_type,
-                    message=allowed_message_classes[0](**kwargs),
+                    message=message_classes.default(**kwargs),
                 )
         elif message_type is not None or message is not None:
             raise ValueError(
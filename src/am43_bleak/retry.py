@@ -0,0 +1,153 @@
+"""Per-device retry policy: adaptive timeouts, backoff and circuit breaking.
+
+The round-trip time of every device is estimated the way TCP does it
+(RFC 6298): a smoothed RTT and its variance, updated from the requests
+answered on the first attempt, give the timeout. Each re-send waits
+`backoff` times longer, plus a random jitter, so devices sharing an adapter
+don't retry in lockstep.
+
+After `failure_threshold` failures in a row the circuit opens, and requests
+to the device fail right away with `CircuitOpenError`, instead of taking
+adapter time from the healthy ones. Once `reset_timeout` passes, a single
+request is let through to probe the device; its success closes the circuit.
+
+    policies = RetryPolicies()
+    pool = ConnectionPool(
+        retry_policies=policies,
+        client_factory=lambda d: AM43Client(d, retry_policy=policies[d.address]),
+    )
+"""
+
+import enum
+import random
+import time
+import typing
+
+from .const import (
+    DEFAULT_CIRCUIT_RESET_TIMEOUT,
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_MAX_RETRY_TIMEOUT,
+    DEFAULT_MIN_RETRY_TIMEOUT,
+    DEFAULT_RETRY_COUNT,
+    DEFAULT_RETRY_TIMEOUT,
+)
+
+# Gains of the smoothed RTT and its variance, and the variance multiplier
+RTT_ALPHA = 1 / 8
+RTT_BETA = 1 / 4
+RTT_K = 4
+
+
+class CircuitState(enum.Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    # Open, but the next request is let through to probe the device
+    HALF_OPEN = "half_open"
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        retry_count: int = DEFAULT_RETRY_COUNT,
+        initial_timeout: float = DEFAULT_RETRY_TIMEOUT,
+        min_timeout: float = DEFAULT_MIN_RETRY_TIMEOUT,
+        max_timeout: float = DEFAULT_MAX_RETRY_TIMEOUT,
+        backoff: float = 2.0,
+        jitter: float = 0.1,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_CIRCUIT_RESET_TIMEOUT,
+        rng: typing.Optional[random.Random] = None,
+    ):
+        self.retry_count = retry_count
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.backoff = backoff
+        # Random part of every timeout, as a fraction of it
+        self.jitter = jitter
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._random = rng or random.Random()
+
+        self.srtt: typing.Optional[float] = None
+        self.rttvar: typing.Optional[float] = None
+        # Timeout of the first attempt
+        self.rto = initial_timeout
+        self.failures = 0
+        # time.monotonic() the circuit was opened, or last probed, at
+        self.opened_at: typing.Optional[float] = None
+
+    def get_timeout(self, attempt: int) -> float:
+        """Seconds to wait for the responses to the attempt, starting from 0"""
+        timeout = min(self.rto * self.backoff**attempt, self.max_timeout)
+        return timeout + self._random.uniform(0, self.jitter * timeout)
+
+    def add_rtt_sample(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * rtt
+
+        self.rto = min(
+            max(self.srtt + RTT_K * self.rttvar, self.min_timeout), self.max_timeout
+        )
+
+    @property
+    def state(self) -> CircuitState:
+        if self.opened_at is None:
+            return CircuitState.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return CircuitState.HALF_OPEN
+        return CircuitState.OPEN
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == CircuitState.HALF_OPEN:
+            # One probe per reset timeout, the rest keep failing fast
+            self.opened_at = time.monotonic()
+            return True
+
+        return state == CircuitState.CLOSED
+
+    def on_success(self, rtt: typing.Optional[float] = None):
+        """`rtt` only if answered on the first attempt (Karn's algorithm),
+        a response to a re-sent request may belong to any of the attempts"""
+        if rtt is not None:
+            self.add_rtt_sample(rtt)
+        self.failures = 0
+        self.opened_at = None
+
+    def on_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class RetryPolicies:
+    """Address -> `RetryPolicy`, created on first use"""
+
+    def __init__(self, **kwargs):
+        # Arguments of every new `RetryPolicy`
+        self.kwargs = kwargs
+        self._policies: dict[str, RetryPolicy] = {}
+
+    def __getitem__(self, address: str) -> RetryPolicy:
+        policy = self._policies.get(address)
+        if policy is None:
+            policy = self._policies[address] = RetryPolicy(**self.kwargs)
+        return policy
+
+    def __contains__(self, address: str) -> bool:
+        return address in self._policies
+
+    def __len__(self) -> int:
+        return len(self._policies)
+
+    def open_circuits(self) -> list[str]:
+        """Addresses of the devices failing fast"""
+        return [
+            address
+            for address, policy in self._policies.items()
+            if policy.state != CircuitState.CLOSED
+        ]
@@ -0,0 +1,432 @@
+"""Simulated AM43 device, for testing and benchmarking without hardware.
+
+`SimulatedDevice` keeps the device state and answers parsed client messages
+the way the device does. `SimulatedBleakClient` stands in for a connected
+`BleakClient`: written frames are decoded and the replies are delivered as
+notifications, after a configurable latency and jitter, split into
+fragments, or lost. Clients sharing a `SimulatedAdapter` take turns on its
+radio, and fail to connect while the adapter is failing.
+
+    device = SimulatedDevice("02:00:00:00:00:01", pin=1234)
+    client = AM43Client(
+        device.ble_device(), client=SimulatedBleakClient(device, latency=0.03)
+    )
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+import random
+import typing
+
+from bleak.backends.device import BLEDevice
+from bleak.exc import BleakError
+
+from .codec import compiled_message_format
+from .const import CHARACTERISTIC_UUID
+from .protocol import (
+    MESSAGE_CLASSES,
+    BatteryStatusResponse,
+    ButtonsMode,
+    ContentControlDirect,
+    ContentLimitSetOrReset,
+    DeviceType,
+    Direction,
+    IlluminanceLevel,
+    LimitCommand,
+    LimitOrReset,
+    LimitOrResetResult,
+    ListSeasonsResponse,
+    ListTimersResponse,
+    Message,
+    MessageType,
+    OperationResult,
+    PositionNotification,
+    Season,
+    SeasonLightLevel,
+    SeasonLightSwitchState,
+    SettingsResponse,
+    SpeedNotification,
+    Timer,
+    UpdateDeviceTime,
+    UpdateDeviceType,
+    UpdateSettings,
+    UpdateTimerAction,
+    WheelGearDiameter,
+)
+
+MAX_TIMERS = 4
+SUMMER_SEASON_ID = 1
+WINTER_SEASON_ID = 2
+# Position change between the notifications of a movement
+MOVEMENT_STEP = 10
+
+# Accepted before the PIN is checked
+_UNAUTHENTICATED_MESSAGE_TYPES = (MessageType.PASSWORD,)
+
+
+def _default_season(season_id: int) -> Season:
+    return Season(
+        season_id=season_id,
+        is_enabled=False,
+        light_switch_state=SeasonLightSwitchState.ALL_CLOSE,
+        light_value_to_open=SeasonLightLevel.LUX_20,
+        light_value_to_close=SeasonLightLevel.LUX_20,
+        start_hour=0,
+        start_minute=0,
+        end_hour=0,
+        end_minute=0,
+    )
+
+
+@dataclass
+class SimulatedDeviceState:
+    pin: int = 8888
+    name: str = "AM43"
+    # 0 is fully open, 100 fully closed
+    position: int = 0
+    battery_level: int = 100
+    illuminance_level: int = 0
+    has_light_device: bool = False
+    device_type: DeviceType = DeviceType.ROLLER_SHADE
+    buttons_mode: ButtonsMode = ButtonsMode.CONTINUOUS
+    direction: Direction = Direction.FORWARD
+    speed: int = 30
+    length: int = 1000
+    wheel_gear_diameter: WheelGearDiameter = WheelGearDiameter.DIAMETER_18MM
+    top_limit_is_ok: bool = True
+    bottom_limit_is_ok: bool = True
+    timers: list = field(default_factory=lambda: [None] * MAX_TIMERS)
+    summer: Season = field(default_factory=lambda: _default_season(SUMMER_SEASON_ID))
+    winter: Season = field(default_factory=lambda: _default_season(WINTER_SEASON_ID))
+    time: typing.Optional[UpdateDeviceTime] = None
+
+
+class SimulatedDevice:
+    """Protocol logic of a single device, independent of any transport"""
+
+    def __init__(
+        self,
+        address: str,
+        pin: int = 8888,
+        state: typing.Optional[SimulatedDeviceState] = None,
+        require_authentication: bool = True,
+        report_movement: bool = False,
+    ):
+        self.address = address
+        self.state = state or SimulatedDeviceState(pin=pin)
+        self.require_authentication = require_authentication
+        # Whether movements are followed by speed and position notifications
+        self.report_movement = report_movement
+        self.is_authenticated = False
+        # Every client message handled, for the assertions in tests
+        self.received: list[Message] = []
+
+    def ble_device(self, adapter: str = "hci0", rssi: int = -60) -> BLEDevice:
+        return BLEDevice(
+            self.address,
+            self.state.name,
+            {"source": adapter, "props": {"Adapter": f"/org/bluez/{adapter}"}},
+            rssi,
+        )
+
+    def on_disconnected(self):
+        self.is_authenticated = False
+
+    def handle(self, message: Message) -> list[Message]:
+        """Returns the messages the device replies with"""
+        self.received.append(message)
+        message_type = MessageType(message.payload.message_type)
+        content = message.payload.message
+
+        if isinstance(content, OperationResult):
+            # Confirmation of an earlier device message
+            return []
+
+        if (
+            self.require_authentication
+            and not self.is_authenticated
+            and message_type not in _UNAUTHENTICATED_MESSAGE_TYPES
+        ):
+            return self._result(message_type, False)
+
+        handler = getattr(self, f"_handle_{message_type.name.lower()}", None)
+        if handler is None:
+            return []
+
+        return handler(content)
+
+    @staticmethod
+    def _reply(message_type: MessageType, content: typing.Any) -> Message:
+        return Message.prepare(message_type, is_device_response=True, message=content)
+
+    @staticmethod
+    def _result(message_type: MessageType, is_success: bool) -> list[Message]:
+        message_classes = MESSAGE_CLASSES.get((message_type, True))
+        if message_classes is None or OperationResult not in message_classes.allowed:
+            return []
+
+        return [
+            Message.prepare(
+                message_type, is_device_response=True, operation_result=is_success
+            )
+        ]
+
+    def _handle_password(self, content) -> list[Message]:
+        self.is_authenticated = content.pin == self.state.pin
+        return self._result(MessageType.PASSWORD, self.is_authenticated)
+
+    def _handle_password_change(self, content) -> list[Message]:
+        self.state.pin = content.pin
+        return self._result(MessageType.PASSWORD_CHANGE, True)
+
+    def _handle_update_name(self, content) -> list[Message]:
+        self.state.name = content.new_name
+        return self._result(MessageType.UPDATE_NAME, True)
+
+    def _move(self, position: int) -> list[Message]:
+        start, self.state.position = self.state.position, position
+        if not self.report_movement or position == start:
+            return []
+
+        step = MOVEMENT_STEP if position > start else -MOVEMENT_STEP
+        return [
+            self._reply(MessageType.REQUEST_SPEED, SpeedNotification(self.state.speed)),
+            *(
+                self._reply(MessageType.REQUEST_POSITION, PositionNotification(p))
+                for p in [*range(start + step, position, step), position]
+            ),
+            self._reply(MessageType.REQUEST_SPEED, SpeedNotification(0)),
+        ]
+
+    def _handle_control_direct(self, content) -> list[Message]:
+        position = self.state.position
+        if content.action == ContentControlDirect.OPEN:
+            position = 0
+        elif content.action == ContentControlDirect.CLOSE:
+            position = 100
+        return self._result(MessageType.CONTROL_DIRECT, True) + self._move(position)
+
+    def _handle_control_position(self, content) -> list[Message]:
+        return self._result(MessageType.CONTROL_POSITION, True) + self._move(
+            content.position
+        )
+
+    def _handle_update_device_time(self, content) -> list[Message]:
+        self.state.time = content
+        return self._result(MessageType.UPDATE_DEVICE_TIME, True)
+
+    def _handle_request_settings(self, _content) -> list[Message]:
+        state = self.state
+        settings = SettingsResponse(
+            has_light_device=state.has_light_device,
+            bottom_limit_is_ok=state.bottom_limit_is_ok,
+            top_limit_is_ok=state.top_limit_is_ok,
+            buttons_mode=state.buttons_mode,
+            direction=state.direction,
+            speed=state.speed,
+            current_position=state.position,
+            length=state.length,
+            wheel_gear_diameter=state.wheel_gear_diameter,
+            device_type=state.device_type,
+        )
+        timers = ListTimersResponse(timers=[t for t in state.timers if t is not None])
+        seasons = ListSeasonsResponse(summer=state.summer, winter=state.winter)
+        return [
+            self._reply(MessageType.REQUEST_SETTINGS, settings),
+            self._reply(MessageType.LIST_TIMERS, timers),
+            self._reply(MessageType.LIST_SEASONS, seasons),
+        ]
+
+    def _handle_request_battery_status(self, _content) -> list[Message]:
+        return [
+            self._reply(
+                MessageType.REQUEST_BATTERY_STATUS,
+                BatteryStatusResponse(level=self.state.battery_level),
+            )
+        ]
+
+    def _handle_request_illuminance(self, _content) -> list[Message]:
+        return [
+            self._reply(
+                MessageType.REQUEST_ILLUMINANCE,
+                IlluminanceLevel(
+                    has_light_device=self.state.has_light_device,
+                    level=self.state.illuminance_level,
+                ),
+            )
+        ]
+
+    def _handle_request_position(self, _content) -> list[Message]:
+        return self._result(MessageType.UNSPECIFIED, True)
+
+    def _handle_request_speed(self, _content) -> list[Message]:
+        return self._result(MessageType.UNSPECIFIED, True)
+
+    def _handle_update_timer(self, content) -> list[Message]:
+        timer: Timer = content.timer
+        if content.action == UpdateTimerAction.DELETE:
+            self.state.timers[content.timer_id] = None
+        else:
+            self.state.timers[content.timer_id] = timer
+        return self._result(MessageType.UPDATE_TIMER, True)
+
+    def _handle_update_season(self, content) -> list[Message]:
+        season: Season = content.season
+        if season.season_id == SUMMER_SEASON_ID:
+            self.state.summer = season
+        elif season.season_id == WINTER_SEASON_ID:
+            self.state.winter = season
+        else:
+            return self._result(MessageType.UPDATE_SEASON, False)
+        return self._result(MessageType.UPDATE_SEASON, True)
+
+    def _handle_update_settings(self, content) -> list[Message]:
+        state = self.state
+        state.device_type = content.device_type
+        state.buttons_mode = content.buttons_mode
+        state.direction = content.direction
+        if isinstance(content, UpdateSettings):
+            state.speed = content.speed
+            state.length = content.length
+            state.wheel_gear_diameter = content.wheel_gear_diameter
+        elif not isinstance(content, UpdateDeviceType):
+            return self._result(MessageType.UPDATE_SETTINGS, False)
+        return self._result(MessageType.UPDATE_SETTINGS, True)
+
+    def _handle_update_limit_or_reset(self, content: LimitOrReset) -> list[Message]:
+        if content.is_reset:
+            self.state = SimulatedDeviceState(pin=self.state.pin)
+            self.state.top_limit_is_ok = self.state.bottom_limit_is_ok = False
+            result = ContentLimitSetOrReset.RESET_SUCCESS
+        elif content.command == LimitCommand.INIT:
+            result = ContentLimitSetOrReset.LIMIT_INIT_SUCCESS
+        elif content.command == LimitCommand.SAVE:
+            self.state.top_limit_is_ok = self.state.bottom_limit_is_ok = True
+            result = ContentLimitSetOrReset.LIMIT_UPDATE_SUCCESS
+        else:
+            result = ContentLimitSetOrReset.EXIT
+
+        message = LimitOrResetResult(result)
+        message.is_success = True
+        return [self._reply(MessageType.UPDATE_LIMIT_OR_RESET, message)]
+
+
+class SimulatedAdapter:
+    """HCI adapter shared by simulated clients.
+
+    The radio handles a single write at a time, each taking `airtime`
+    seconds, so the throughput is limited per adapter, as with the real
+    dongles.
+    """
+
+    def __init__(self, name: str, airtime: float = 0.0):
+        self.name = name
+        self.airtime = airtime
+        # Whether connections through it fail, e.g. an unplugged dongle
+        self.is_failing = False
+        # address -> RSSI the devices are seen with
+        self.rssi: dict[str, int] = {}
+        self.radio = asyncio.Lock()
+
+    def ble_device(self, device: SimulatedDevice) -> BLEDevice:
+        return device.ble_device(self.name, self.rssi.get(device.address, -60))
+
+
+class SimulatedBleakClient:
+    """Drop-in for a connected `BleakClient` talking to a `SimulatedDevice`.
+
+    Replies are delivered `latency` seconds (plus up to `jitter`) after the
+    write, in order. Each written frame and each reply frame is lost with the
+    `loss` probability, and replies are split into notifications of at most
+    `fragment_size` bytes.
+    """
+
+    def __init__(
+        self,
+        device: SimulatedDevice,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        fragment_size: typing.Optional[int] = None,
+        connect_time: float = 0.0,
+        seed: typing.Optional[int] = None,
+        message_format=compiled_message_format,
+        adapter: typing.Optional[SimulatedAdapter] = None,
+    ):
+        self.device = device
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.fragment_size = fragment_size
+        self.connect_time = connect_time
+        self.message_format = message_format
+        self.adapter = adapter
+        self.is_connected = False
+        self._random = random.Random(seed)
+        self._callback = None
+        # Replies are never delivered before the ones sent earlier
+        self._last_delivery = 0.0
+
+    async def connect(self, **kwargs) -> bool:
+        if self.connect_time:
+            await asyncio.sleep(self.connect_time)
+        if self.adapter is not None and self.adapter.is_failing:
+            raise BleakError(f"{self.adapter.name} failed to connect")
+        self.is_connected = True
+        return True
+
+    async def disconnect(self) -> bool:
+        self.is_connected = False
+        self._callback = None
+        self.device.on_disconnected()
+        return True
+
+    async def start_notify(self, char_specifier, callback, **kwargs):
+        if str(char_specifier) != CHARACTERISTIC_UUID:
+            raise ValueError(f"Unknown characteristic {char_specifier}")
+        self._callback = callback
+
+    async def stop_notify(self, char_specifier):
+        self._callback = None
+
+    async def write_gatt_char(self, char_specifier, data, response: bool = None):
+        if not self.is_connected:
+            raise ConnectionError("Not connected")
+        if self.adapter is not None:
+            async with self.adapter.radio:
+                await asyncio.sleep(self.adapter.airtime)
+        if self._is_lost():
+            return
+
+        try:
+            message = self.message_format.parse(bytes(data))
+        except Exception:
+            return  # the device ignores anything it can't decode
+
+        for reply in self.device.handle(message):
+            self.notify(reply)
+
+    def notify(self, message: Message):
+        """Sends a device message, e.g. an unsolicited `FAULT`"""
+        if not self._is_lost():
+            self._send(self.message_format.build(message))
+
+    def _is_lost(self) -> bool:
+        return self.loss > 0 and self._random.random() < self.loss
+
+    def _send(self, frame: bytes):
+        loop = asyncio.get_running_loop()
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        # Strictly later, timers due at the same time may run in any order
+        when = max(loop.time() + delay, self._last_delivery + 1e-6)
+        self._last_delivery = when
+
+        size = self.fragment_size or len(frame)
+        fragments = [bytearray(frame[i : i + size]) for i in range(0, len(frame), size)]
+        loop.call_at(when, self._notify, fragments)
+
+    def _notify(self, fragments: list):
+        for data in fragments:
+            if self._callback is None or not self.is_connected:
+                return
+            self._callback(CHARACTERISTIC_UUID, data)
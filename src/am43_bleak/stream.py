@@ -0,0 +1,127 @@
+import typing
+
+from .codec import FOOTERS, HEADER, RESULT_MESSAGE_TYPES, compiled_message_format
+from .protocol import CLIENT_MESSAGE_TAG, Message, MessageType, xor_checksum
+
+# header, message type and message size
+PREAMBLE_SIZE = 3
+
+
+# (message_type, is_device_response) -> possible message sizes, None if any
+_message_sizes = {}
+
+
+def _get_message_sizes(
+    message_type: int, is_device_response: bool
+) -> typing.Optional[frozenset]:
+    key = (message_type, is_device_response)
+    if key not in _message_sizes:
+        codec_map = compiled_message_format.codecs[is_device_response]
+        codecs = codec_map.get(message_type)
+        if codec_map.has_raw_fallback(message_type):
+            codecs = None
+        sizes = frozenset(codec.size for codec in codecs) if codecs else None
+        _message_sizes[key] = None if sizes is None or None in sizes else sizes
+
+    return _message_sizes[key]
+
+
+_MESSAGE_TYPES = frozenset(int(message_type) for message_type in MessageType)
+
+
+class StreamDecoder:
+    """Decodes messages from arbitrary chunks of a byte stream.
+
+    BLE notifications may carry a part of a message, or several messages at
+    once; noise between them is skipped. Frames are delimited by the header
+    and the message size, and the checksum (or the result footer) is verified
+    before the frame is passed to the decoder. Broken frames are only counted.
+    """
+
+    def __init__(self, message_format=compiled_message_format):
+        self.message_format = message_format
+        self._buffer = bytearray()
+        # Bytes skipped while looking for a header
+        self.skipped_bytes = 0
+        # Frames with a wrong checksum/footer, or which failed to decode
+        self.malformed_frames = 0
+
+    def feed(self, data: typing.Union[bytes, bytearray, memoryview]) -> list[Message]:
+        self._buffer += data
+        ret = []
+
+        with memoryview(self._buffer) as buffer:
+            consumed = self._consume(buffer, ret)
+
+        del self._buffer[:consumed]
+        return ret
+
+    def _consume(self, buffer: memoryview, ret: list) -> int:
+        position = 0
+        size = len(buffer)
+        tag_size = len(CLIENT_MESSAGE_TAG)
+
+        while True:
+            header = self._buffer.find(HEADER, position)
+            if header == -1:
+                # The header may still follow a partially received tag
+                start = max(position, size - tag_size)
+                self.skipped_bytes += start - position
+                return start
+
+            # The tag can't be in the bytes already consumed
+            start = header
+            if buffer[max(position, header - tag_size) : header] == CLIENT_MESSAGE_TAG:
+                start = header - tag_size
+
+            if size - header < PREAMBLE_SIZE:
+                # Wait for the rest of the frame
+                self.skipped_bytes += start - position
+                return start
+
+            if self._is_valid_preamble(buffer, start, header):
+                footer = header + PREAMBLE_SIZE + buffer[header + 2]
+                if footer >= size:
+                    self.skipped_bytes += start - position
+                    return start
+
+                message = self._decode(buffer, start, header, footer)
+                if message is not None:
+                    ret.append(message)
+                    self.skipped_bytes += start - position
+                    position = footer + 1
+                    continue
+
+                self.malformed_frames += 1
+
+            # Not a frame after all, resume the search right after the header
+            self.skipped_bytes += header + 1 - position
+            position = header + 1
+
+    def _decode(
+        self, buffer: memoryview, start: int, header: int, footer: int
+    ) -> typing.Optional[Message]:
+        if buffer[footer] != xor_checksum(buffer[header:footer]) and (
+            buffer[footer] not in FOOTERS
+            or (buffer[header + 1], start == header) not in RESULT_MESSAGE_TYPES
+        ):
+            return None
+
+        try:
+            return self.message_format.parse(bytes(buffer[start : footer + 1]))
+        except Exception:
+            return None
+
+    @staticmethod
+    def _is_valid_preamble(buffer: memoryview, start: int, header: int) -> bool:
+        # A stray header byte in the noise is most likely followed by
+        # something which doesn't look like a message type and its size
+        message_type = buffer[header + 1]
+        if message_type not in _MESSAGE_TYPES:
+            return False
+
+        sizes = _get_message_sizes(message_type, start == header)
+        return sizes is None or buffer[header + 2] in sizes
+
+    def reset(self):
+        self._buffer.clear()
@@ -0,0 +1,213 @@
+"""Declarative configuration of timers, seasons and settings.
+
+The current configuration is read once (a single `REQUEST_SETTINGS`, which
+the device answers along with `LIST_TIMERS` and `LIST_SEASONS`), compared
+with the desired one, and only the differences are sent.
+
+The device lists its timers without their ids; the position in the list is
+taken as the id, which holds as long as the timers are only managed here.
+"""
+
+import asyncio
+from dataclasses import dataclass, field, fields
+import itertools
+import time
+import typing
+
+from bleak.backends.device import BLEDevice
+
+from .client import AM43Client, DeviceSettings, OperationFailedError
+from .pool import ConnectionPool
+from .protocol import (
+    MessageType,
+    Season,
+    Timer,
+    UpdateDeviceType,
+    UpdateSeason,
+    UpdateSettings,
+    UpdateTimer,
+    UpdateTimerAction,
+)
+
+MAX_TIMERS = 4
+
+
+@dataclass
+class DesiredConfig:
+    """Configuration to converge to, anything left as None is not managed"""
+
+    # All the timers of the device, in the order of their ids
+    timers: typing.Optional[typing.Sequence[Timer]] = None
+    # Matched with the current seasons by `season_id`
+    seasons: typing.Optional[typing.Sequence[Season]] = None
+    settings: typing.Optional[typing.Union[UpdateSettings, UpdateDeviceType]] = None
+
+    def __post_init__(self):
+        if self.timers is not None and len(self.timers) > MAX_TIMERS:
+            raise ValueError(f"At most {MAX_TIMERS} timers are supported")
+
+
+class ConfigChange(typing.NamedTuple):
+    message_type: MessageType
+    # Message sent to apply the change
+    message: typing.Any
+    # Current value, None if there's nothing to compare with (e.g. new timer)
+    current: typing.Any = None
+
+
+def _values(obj: typing.Any, names: typing.Iterable[str]) -> tuple:
+    return tuple(getattr(obj, name) for name in names)
+
+
+def _public_fields(message_class: type) -> tuple:
+    return tuple(f.name for f in fields(message_class) if not f.name.startswith("_"))
+
+
+_TIMER_FIELDS = _public_fields(Timer)
+_SEASON_FIELDS = _public_fields(Season)
+
+
+def _diff_timers(current: typing.Sequence[Timer], desired: typing.Sequence[Timer]):
+    for timer_id, (before, after) in enumerate(itertools.zip_longest(current, desired)):
+        if after is not None and (
+            before is None
+            or _values(before, _TIMER_FIELDS) != _values(after, _TIMER_FIELDS)
+        ):
+            yield ConfigChange(
+                MessageType.UPDATE_TIMER,
+                UpdateTimer(timer_id, UpdateTimerAction.UPDATE, after),
+                before,
+            )
+
+    # The highest ids first, so the remaining ones keep their positions
+    for timer_id in reversed(range(len(desired), len(current))):
+        yield ConfigChange(
+            MessageType.UPDATE_TIMER,
+            UpdateTimer(timer_id, UpdateTimerAction.DELETE, current[timer_id]),
+            current[timer_id],
+        )
+
+
+def _diff_seasons(current: typing.Sequence[Season], desired: typing.Sequence[Season]):
+    current = {season.season_id: season for season in current}
+    for season in desired:
+        before = current.get(season.season_id)
+        if before is None or _values(before, _SEASON_FIELDS) != _values(
+            season, _SEASON_FIELDS
+        ):
+            yield ConfigChange(MessageType.UPDATE_SEASON, UpdateSeason(season), before)
+
+
+def diff_config(current: DeviceSettings, desired: DesiredConfig) -> list[ConfigChange]:
+    """Returns the changes bringing the device to the desired configuration"""
+    changes = []
+    if desired.timers is not None:
+        changes.extend(_diff_timers(current.timers.timers, desired.timers))
+
+    if desired.seasons is not None:
+        changes.extend(
+            _diff_seasons(
+                (current.seasons.summer, current.seasons.winter), desired.seasons
+            )
+        )
+
+    if desired.settings is not None:
+        # `SettingsResponse` has all the fields of both update messages
+        names = _public_fields(type(desired.settings))
+        if _values(current.settings, names) != _values(desired.settings, names):
+            changes.append(
+                ConfigChange(
+                    MessageType.UPDATE_SETTINGS, desired.settings, current.settings
+                )
+            )
+
+    return changes
+
+
+async def _apply(client: AM43Client, changes: typing.Sequence[ConfigChange]):
+    for change in changes:
+        response = await client.request(change.message_type, message=change.message)
+        if not response.payload.message.is_success:
+            raise OperationFailedError(f"{change.message!r} failed")
+
+
+async def sync_config(
+    client: AM43Client, desired: DesiredConfig, dry_run: bool = False
+) -> list[ConfigChange]:
+    """Applies the differences from the desired configuration, returns them.
+
+    Changes of different message types are sent without waiting for each
+    other. `OperationFailedError` is raised if any is rejected; the changes
+    are idempotent, so the sync can simply be repeated.
+    """
+    changes = diff_config(await client.get_settings(), desired)
+    if not dry_run:
+        await asyncio.gather(
+            *(
+                _apply(client, list(group))
+                for _, group in itertools.groupby(changes, key=lambda c: c.message_type)
+            )
+        )
+
+    return changes
+
+
+@dataclass
+class SyncOutcome:
+    device: BLEDevice
+    changes: list[ConfigChange] = field(default_factory=list)
+    error: typing.Optional[BaseException] = None
+    # time.monotonic() timestamps
+    started_at: float = 0.0
+    finished_at: typing.Optional[float] = None
+
+    @property
+    def is_success(self) -> bool:
+        return self.error is None and self.finished_at is not None
+
+
+async def _sync(
+    pool: ConnectionPool,
+    outcome: SyncOutcome,
+    desired: DesiredConfig,
+    dry_run: bool,
+):
+    outcome.started_at = time.monotonic()
+    try:
+        async with pool.acquire(outcome.device) as client:
+            outcome.changes = await sync_config(client, desired, dry_run)
+    except Exception as exc:
+        outcome.error = exc
+    finally:
+        outcome.finished_at = time.monotonic()
+
+
+async def sync_group_config(
+    pool: ConnectionPool,
+    devices: typing.Iterable[BLEDevice],
+    desired: typing.Union[DesiredConfig, typing.Mapping[str, DesiredConfig]],
+    dry_run: bool = False,
+) -> list[SyncOutcome]:
+    """Syncs the devices concurrently, within the limits of the pool.
+
+    `desired` is either shared by all the devices, or given per address.
+    Outcomes are returned in the order of `devices`.
+    """
+    outcomes = [SyncOutcome(device) for device in devices]
+    await asyncio.gather(
+        *(
+            _sync(
+                pool,
+                outcome,
+                (
+                    desired
+                    if isinstance(desired, DesiredConfig)
+                    else desired[outcome.device.address]
+                ),
+                dry_run,
+            )
+            for outcome in outcomes
+        )
+    )
+
+    return outcomes
@@ -0,0 +1,287 @@
+"""History of battery level, illuminance and position, in a fixed memory.
+
+Every device and metric has a few tiers of ring buffers: the latest raw
+samples, then the minimum, maximum and last value per minute, and per hour.
+Each tier is a set of `array`s of a fixed capacity, the oldest entries are
+overwritten once it's full, so the memory doesn't grow with the uptime. The
+number of devices is capped too, the least recently updated one is dropped.
+
+    store = TelemetryStore()
+    store.attach(client)
+    series = store.query(address, Metric.POSITION, start=time.time() - 3600)
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+import enum
+import math
+import time
+import typing
+
+from .client import AM43Client
+from .protocol import (
+    BatteryStatusResponse,
+    IlluminanceLevel,
+    Message,
+    PositionNotification,
+    SettingsResponse,
+)
+from .records import (
+    BatteryStatusRecord,
+    IlluminanceRecord,
+    MessageRecord,
+    SettingsRecord,
+)
+
+# (bucket seconds, capacity), 0 seconds for the raw samples
+DEFAULT_TIERS = ((0, 256), (60, 24 * 60), (3600, 31 * 24))
+DEFAULT_MAX_DEVICES = 256
+
+
+class Metric(enum.Enum):
+    BATTERY = "battery"
+    ILLUMINANCE = "illuminance"
+    POSITION = "position"
+
+
+# message class -> (metric, attribute)
+METRIC_SOURCES = {
+    BatteryStatusResponse: (Metric.BATTERY, "level"),
+    BatteryStatusRecord: (Metric.BATTERY, "level"),
+    IlluminanceLevel: (Metric.ILLUMINANCE, "level"),
+    IlluminanceRecord: (Metric.ILLUMINANCE, "level"),
+    SettingsResponse: (Metric.POSITION, "current_position"),
+    SettingsRecord: (Metric.POSITION, "current_position"),
+    PositionNotification: (Metric.POSITION, "position"),
+}
+
+
+class Series(typing.NamedTuple):
+    # Time of the sample, or the start of the bucket
+    timestamps: array
+    min: array
+    max: array
+    last: array
+    # Bucket seconds of the tier the data comes from, 0 for the raw samples
+    resolution: int
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+class _RingView:
+    """Logical, oldest first, view of a ring column, for `bisect`"""
+
+    __slots__ = ("column", "start", "size")
+
+    def __init__(self, column: array, start: int, size: int):
+        self.column = column
+        self.start = start
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index: int) -> float:
+        return self.column[(self.start + index) % len(self.column)]
+
+
+class RingTier:
+    """Fixed-capacity buckets of one resolution"""
+
+    def __init__(self, resolution: int, capacity: int):
+        self.resolution = resolution
+        self.capacity = capacity
+        # Grown up to the capacity, then overwritten starting from the oldest
+        self.timestamps = array("d")
+        self.min = array("d")
+        self.max = array("d")
+        self.last = array("d")
+        # Index of the oldest entry, and the number of entries
+        self.start = 0
+        self.size = 0
+        # Whether anything was overwritten
+        self.is_wrapped = False
+        # Bucket being accumulated, appended once a later one starts
+        self._current: typing.Optional[list] = None
+
+    def _append(self, timestamp: float, low: float, high: float, last: float):
+        if self.size < self.capacity:
+            self.timestamps.append(timestamp)
+            self.min.append(low)
+            self.max.append(high)
+            self.last.append(last)
+            self.size += 1
+            return
+
+        index = self.start
+        self.start = (self.start + 1) % self.capacity
+        self.is_wrapped = True
+        self.timestamps[index] = timestamp
+        self.min[index] = low
+        self.max[index] = high
+        self.last[index] = last
+
+    def add(self, timestamp: float, value: float):
+        if not self.resolution:
+            self._append(timestamp, value, value, value)
+            return
+
+        bucket = timestamp - timestamp % self.resolution
+        current = self._current
+        if current is not None and current[0] == bucket:
+            current[1] = min(current[1], value)
+            current[2] = max(current[2], value)
+            current[3] = value
+            return
+
+        if current is not None:
+            self._append(*current)
+        self._current = [bucket, value, value, value]
+
+    def covers(self, timestamp: float) -> bool:
+        """Whether nothing since `timestamp` was overwritten"""
+        return not self.is_wrapped or self.timestamps[self.start] <= timestamp
+
+    def query(self, start: float, end: float) -> Series:
+        if self.resolution and math.isfinite(start):
+            # Including the bucket `start` falls into
+            start -= start % self.resolution
+
+        timestamps = _RingView(self.timestamps, self.start, self.size)
+        first = bisect_left(timestamps, start)
+        stop = bisect_right(timestamps, end)
+
+        ret = Series(array("d"), array("d"), array("d"), array("d"), self.resolution)
+        for name in ("timestamps", "min", "max", "last"):
+            column = getattr(self, name)
+            # At most two contiguous runs of the ring
+            begin = (self.start + first) % self.capacity
+            count = stop - first
+            head = column[begin : min(begin + count, self.capacity)]
+            getattr(ret, name).extend(head)
+            getattr(ret, name).extend(column[: count - len(head)])
+
+        current = self._current
+        if current is not None and start <= current[0] <= end:
+            for column, value in zip(ret[:4], current):
+                column.append(value)
+
+        return ret
+
+
+class TelemetryStore:
+    """Per device and metric history, fed with the decoded device messages"""
+
+    def __init__(
+        self,
+        tiers: typing.Sequence[tuple[int, int]] = DEFAULT_TIERS,
+        max_devices: int = DEFAULT_MAX_DEVICES,
+    ):
+        self.tiers = tuple(sorted(tiers))
+        self.max_devices = max_devices
+        # address -> metric -> tiers, the least recently updated first
+        self._devices: OrderedDict[str, dict] = OrderedDict()
+        # Latest timestamp per (address, metric), older samples are dropped
+        self._latest: dict[tuple, float] = {}
+
+    def attach(self, client: AM43Client) -> typing.Callable[[], None]:
+        """Records the messages of the client, returns the detach"""
+        address = client.device.address
+        return client.subscribe(lambda message: self.process(address, message))
+
+    def process(
+        self,
+        address: str,
+        message: typing.Union[Message, MessageRecord],
+        timestamp: typing.Optional[float] = None,
+    ) -> bool:
+        """Records the metric carried by the message, if any"""
+        if isinstance(message, Message):
+            content = message.payload.message
+        else:
+            content = message.message
+
+        source = METRIC_SOURCES.get(type(content))
+        if source is None:
+            return False
+
+        metric, attribute = source
+        self.add(address, metric, getattr(content, attribute), timestamp)
+        return True
+
+    def add(
+        self,
+        address: str,
+        metric: Metric,
+        value: float,
+        timestamp: typing.Optional[float] = None,
+    ):
+        if timestamp is None:
+            timestamp = time.time()
+
+        key = (address, metric)
+        if timestamp < self._latest.get(key, -math.inf):
+            return  # out of order
+        self._latest[key] = timestamp
+
+        metrics = self._devices.get(address)
+        if metrics is None:
+            if len(self._devices) >= self.max_devices:
+                evicted, _ = self._devices.popitem(last=False)
+                for m in Metric:
+                    self._latest.pop((evicted, m), None)
+            metrics = self._devices[address] = {}
+        else:
+            self._devices.move_to_end(address)
+
+        tiers = metrics.get(metric)
+        if tiers is None:
+            tiers = metrics[metric] = [RingTier(*t) for t in self.tiers]
+
+        for tier in tiers:
+            tier.add(timestamp, value)
+
+    def query(
+        self,
+        address: str,
+        metric: Metric,
+        start: float = -math.inf,
+        end: float = math.inf,
+        resolution: typing.Optional[int] = None,
+    ) -> Series:
+        """Returns the data within [start, end].
+
+        The finest tier still holding everything since `start` is used,
+        unless the resolution is given explicitly.
+        """
+        tiers = self._devices.get(address, {}).get(metric)
+        if not tiers:
+            return Series(array("d"), array("d"), array("d"), array("d"), 0)
+
+        if resolution is not None:
+            tier = next((t for t in tiers if t.resolution == resolution), None)
+            if tier is None:
+                raise ValueError(f"No tier with the resolution of {resolution}s")
+        else:
+            tier = next((t for t in tiers if t.covers(start)), tiers[-1])
+
+        return tier.query(start, end)
+
+    def latest(self, address: str, metric: Metric) -> typing.Optional[float]:
+        tiers = self._devices.get(address, {}).get(metric)
+        if not tiers:
+            return None
+
+        raw = tiers[0]
+        if raw.resolution:
+            return raw._current[3]
+        return raw.last[(raw.start + raw.size - 1) % raw.capacity]
+
+    @property
+    def devices(self) -> list[str]:
+        return list(self._devices)
+
+    def __len__(self) -> int:
+        return len(self._devices)
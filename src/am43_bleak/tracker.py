@@ -0,0 +1,140 @@
+"""Live position and motion state, from the device notifications alone.
+
+While moving, the device notifies about the position (`REQUEST_POSITION`)
+and the speed of the motor (`REQUEST_SPEED`), and about faults (`FAULT`).
+`StateTracker` follows these, along with any settings received, so the state
+is known without polling `REQUEST_SETTINGS`.
+
+    tracker = StateTracker()
+    tracker.attach(client)
+    unsubscribe = tracker.subscribe(lambda state: print(state.position))
+"""
+
+from dataclasses import dataclass, replace
+import enum
+import logging
+import time
+import typing
+
+from .client import AM43Client
+from .protocol import (
+    FaultNotification,
+    Message,
+    MessageType,
+    PositionNotification,
+    SettingsResponse,
+    SpeedNotification,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+FULLY_OPEN = 0
+FULLY_CLOSED = 100
+
+
+class MotionState(enum.Enum):
+    STOPPED = "stopped"
+    OPENING = "opening"
+    CLOSING = "closing"
+    # The motor runs, but the direction isn't known yet
+    MOVING = "moving"
+
+
+@dataclass(frozen=True)
+class DeviceState:
+    # 0 is fully open, 100 fully closed, None until reported
+    position: typing.Optional[int] = None
+    # RPM of the motor, None until reported
+    speed: typing.Optional[int] = None
+    motion: MotionState = MotionState.STOPPED
+    # Code of the latest fault, cleared once the motor runs again
+    fault: typing.Optional[int] = None
+    # `time.monotonic()` of the latest change
+    updated_at: typing.Optional[float] = None
+
+    @property
+    def is_moving(self) -> bool:
+        return self.motion != MotionState.STOPPED
+
+
+class StateTracker:
+    """Keeps `state` of a single device up to date from its messages.
+
+    Subscribers are called with the new `DeviceState` whenever it changes.
+    """
+
+    def __init__(self, state: typing.Optional[DeviceState] = None):
+        self.state = state or DeviceState()
+        self._subscribers: list[typing.Callable[[DeviceState], None]] = []
+
+    def attach(self, client: AM43Client) -> typing.Callable[[], None]:
+        """Follows the messages of the client, returns the detach"""
+        return client.subscribe(self.process)
+
+    def subscribe(
+        self, callback: typing.Callable[[DeviceState], None]
+    ) -> typing.Callable[[], None]:
+        """Calls `callback` on every change, returns the unsubscribe"""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def process(self, message: Message) -> bool:
+        """Applies a device message, returns whether the state has changed"""
+        if not message.is_device_response:
+            return False
+
+        content = message.payload.message
+        message_type = message.payload.message_type
+        if message_type == MessageType.REQUEST_POSITION and isinstance(
+            content, PositionNotification
+        ):
+            state = self._on_position(content.position)
+        elif message_type == MessageType.REQUEST_SPEED and isinstance(
+            content, SpeedNotification
+        ):
+            state = self._on_speed(content.speed)
+        elif message_type == MessageType.FAULT and isinstance(
+            content, FaultNotification
+        ):
+            state = replace(self.state, motion=MotionState.STOPPED, fault=content.code)
+        elif message_type == MessageType.REQUEST_SETTINGS and isinstance(
+            content, SettingsResponse
+        ):
+            state = replace(self.state, position=content.current_position)
+        else:
+            return False
+
+        if state == self.state:
+            return False
+
+        self.state = replace(state, updated_at=time.monotonic())
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber(self.state)
+            except Exception:
+                _LOGGER.exception("Error in a state subscriber")
+
+        return True
+
+    def _on_position(self, position: int) -> DeviceState:
+        state = self.state
+        motion = state.motion
+        if position in (FULLY_OPEN, FULLY_CLOSED):
+            # The limits stop the motor, no speed notification may follow
+            motion = MotionState.STOPPED
+        elif state.position is not None and position != state.position:
+            motion = (
+                MotionState.CLOSING
+                if position > state.position
+                else MotionState.OPENING
+            )
+
+        return replace(state, position=position, motion=motion)
+
+    def _on_speed(self, speed: int) -> DeviceState:
+        state = self.state
+        if speed == 0:
+            return replace(state, speed=speed, motion=MotionState.STOPPED)
+
+        motion = MotionState.MOVING if not state.is_moving else state.motion
+        return replace(state, speed=speed, motion=motion, fault=None)
@@ -0,0 +1,51 @@
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+from am43_bleak.advertisement import AdvertisementMonitor
+from am43_bleak.const import SERVICE_UUID
+
+DEVICE = BLEDevice("02:00:00:00:00:01", "AM43", {}, -60)
+
+
+def _advertisement(
+    rssi: int, manufacturer_data: bytes = b"\x01", service_uuid: str = SERVICE_UUID
+) -> AdvertisementData:
+    return AdvertisementData(
+        local_name="AM43",
+        manufacturer_data={0x0502: manufacturer_data},
+        service_data={},
+        service_uuids=[service_uuid],
+        tx_power=None,
+        rssi=rssi,
+        platform_data=(),
+    )
+
+
+def test_repeated_advertisements_are_deduplicated():
+    emitted = []
+    monitor = AdvertisementMonitor(emitted.append, rssi_threshold=5)
+
+    assert monitor.process(DEVICE, _advertisement(-60)) is not None
+    # Within the threshold of the last emitted RSSI, even when drifting
+    assert monitor.process(DEVICE, _advertisement(-64)) is None
+    assert monitor.process(DEVICE, _advertisement(-56)) is None
+    assert monitor.process(DEVICE, _advertisement(-65)).rssi == -65
+    # Content changes are emitted regardless of the RSSI
+    assert monitor.process(DEVICE, _advertisement(-65, b"\x02")) is not None
+
+    assert [(a.rssi, a.manufacturer_data[0x0502]) for a in emitted] == [
+        (-60, b"\x01"),
+        (-65, b"\x01"),
+        (-65, b"\x02"),
+    ]
+    assert monitor.devices[DEVICE.address] == emitted[-1]
+
+
+def test_other_devices_are_ignored():
+    emitted = []
+    monitor = AdvertisementMonitor(emitted.append)
+
+    other = "0000180f-0000-1000-8000-00805f9b34fb"
+    assert monitor.process(DEVICE, _advertisement(-60, service_uuid=other)) is None
+    assert emitted == []
+    assert monitor.devices == {}
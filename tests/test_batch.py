@@ -0,0 +1,144 @@
+from array import array
+
+import pytest
+
+from am43_bleak import batch
+from am43_bleak.batch import decode_batch
+from am43_bleak.codec import compiled_message_format
+from am43_bleak.protocol import (
+    BatteryStatusResponse,
+    ContentLimitSetOrReset,
+    ContentOperationResult,
+    IlluminanceLevel,
+    LimitOrResetResult,
+    Message,
+    MessageType,
+    OperationResult,
+    xor_checksum,
+)
+
+
+def _result(message_type: MessageType, message_class: type, result, is_success: bool):
+    message = message_class(result)
+    message.is_success = is_success
+    return compiled_message_format.build(
+        Message.prepare(message_type, is_device_response=True, message=message)
+    )
+
+
+def _response(message_type: MessageType, message) -> bytes:
+    return compiled_message_format.build(
+        Message.prepare(message_type, is_device_response=True, message=message)
+    )
+
+
+def _request(message_type: MessageType) -> bytes:
+    return compiled_message_format.build(Message.prepare(message_type))
+
+
+def _with_checksum(frame: bytes) -> bytes:
+    return frame[:-1] + bytes((xor_checksum(frame[frame.index(0x9A) : -1]),))
+
+
+BATTERY = _response(MessageType.REQUEST_BATTERY_STATUS, BatteryStatusResponse(87))
+ILLUMINANCE = _response(MessageType.REQUEST_ILLUMINANCE, IlluminanceLevel(True, 7))
+SUCCESS = _result(
+    MessageType.CONTROL_POSITION, OperationResult, ContentOperationResult.SUCCESS, True
+)
+FAILURE = _result(
+    MessageType.CONTROL_POSITION, OperationResult, ContentOperationResult.FAILURE, False
+)
+LIMIT_SAVED = _result(
+    MessageType.UPDATE_LIMIT_OR_RESET,
+    LimitOrResetResult,
+    ContentLimitSetOrReset.LIMIT_UPDATE_SUCCESS,
+    True,
+)
+REQUEST_POSITION = _request(MessageType.REQUEST_POSITION)
+
+VALID = [
+    BATTERY,
+    ILLUMINANCE,
+    SUCCESS,
+    FAILURE,
+    LIMIT_SAVED,
+    REQUEST_POSITION,
+    _response(MessageType.REQUEST_BATTERY_STATUS, BatteryStatusResponse(12)),
+]
+CORRUPTED = [
+    # Wrong checksum
+    BATTERY[:-1] + bytes((BATTERY[-1] ^ 0x01,)),
+    # Valid footers, which don't match the results
+    SUCCESS[:-1] + FAILURE[-1:],
+    FAILURE[:-1] + SUCCESS[-1:],
+    LIMIT_SAVED[:-1] + FAILURE[-1:],
+    # A checksum instead of the footer
+    _with_checksum(SUCCESS),
+    # Constant body of a request, with a matching checksum
+    _with_checksum(REQUEST_POSITION[:-2] + b"\x02\x00"),
+]
+MIXED_LENGTHS = [
+    # Fixed-size messages with an extra byte
+    _with_checksum(
+        BATTERY[:2] + bytes((BATTERY[2] + 1,)) + BATTERY[3:-1] + b"\x00\x00"
+    ),
+    _with_checksum(SUCCESS[:2] + b"\x02" + SUCCESS[3:-1] + b"\x5a\x00"),
+]
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "array"])
+def use_numpy(request, monkeypatch):
+    if request.param:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(batch, "numpy", None)
+    return request.param
+
+
+def _parse_each(frames: list) -> tuple:
+    """(message_type, is_device_response) -> [(index, message)], invalid indices"""
+    messages = {}
+    invalid = []
+    for i, frame in enumerate(frames):
+        try:
+            message = compiled_message_format.parse(frame)
+        except ValueError:
+            invalid.append(i)
+            continue
+
+        key = (message.payload.message_type, message.is_device_response)
+        messages.setdefault(key, []).append((i, message.payload.message))
+
+    return messages, invalid
+
+
+@pytest.mark.parametrize(
+    "frames",
+    [
+        VALID,
+        CORRUPTED,
+        VALID + CORRUPTED + MIXED_LENGTHS,
+        MIXED_LENGTHS + VALID[::-1] + CORRUPTED[::-1],
+    ],
+    ids=["valid", "corrupted", "mixed", "mixed-reversed"],
+)
+def test_decode_batch_matches_parse(use_numpy, frames):
+    result = decode_batch(frames)
+    messages, invalid = _parse_each(frames)
+
+    assert result.invalid == invalid
+    assert set(result.groups) == set(messages)
+    for key, group in result.groups.items():
+        indices = [i for i, _ in messages[key]]
+        assert list(group.indices) == indices
+        if use_numpy:
+            assert not isinstance(group.indices, array)
+
+        if group.messages:
+            assert group.messages == [message for _, message in messages[key]]
+            continue
+
+        for name, column in group.columns.items():
+            assert [int(v) for v in column] == [
+                int(getattr(message, name)) for _, message in messages[key]
+            ]
@@ -0,0 +1,29 @@
+import json
+
+import suite
+
+
+def _baseline() -> dict:
+    with open(suite.BASELINE_PATH) as f:
+        return json.load(f)["results"]
+
+
+def test_baseline_covers_every_benchmark(monkeypatch):
+    monkeypatch.setattr(suite, "measure", lambda func: 1.0)
+    results = {}
+    suite.bench_prepare(results)
+    suite.bench_codecs(results)
+
+    baseline = _baseline()
+    assert set(results) <= set(baseline)
+    assert all(value > 0 for value in baseline.values())
+
+
+def test_compare_reports_results_above_the_tolerance():
+    baseline = {"fast": 1.0, "slow": 1.0, "gone": 1.0}
+    results = {"fast": 1.2, "slow": 1.3, "new": 5.0}
+
+    assert suite.compare(results, baseline, suite.DEFAULT_TOLERANCE) == [
+        ("slow", 1.0, 1.3)
+    ]
+    assert suite.compare(results, baseline, 0.5) == []
@@ -0,0 +1,94 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from bleak.backends.device import BLEDevice
+import pytest
+
+from am43_bleak.cache import StateCache
+from am43_bleak.client import OperationFailedError
+from am43_bleak.protocol import MessageType
+
+DEVICE = BLEDevice("02:00:00:00:00:01", None, {}, -60)
+
+
+class FakeClient:
+    def __init__(self):
+        self.battery_level = 50
+        self.requests = []
+        # Set to hold the responses back
+        self.release: asyncio.Event = None
+        self.fail = False
+
+    async def request(self, message_type: MessageType, **kwargs):
+        self.requests.append(message_type)
+        level = self.battery_level
+        if self.release is not None:
+            await self.release.wait()
+        if self.fail:
+            raise OperationFailedError(f"{message_type!r} failed")
+        return SimpleNamespace(payload=SimpleNamespace(message=level))
+
+
+def _cache(client: FakeClient) -> StateCache:
+    @asynccontextmanager
+    async def connect(device):
+        yield client
+
+    return StateCache(connect)
+
+
+async def test_failed_command_keeps_unrelated_values():
+    client = FakeClient()
+    cache = _cache(client)
+    assert await cache.get(DEVICE, MessageType.REQUEST_BATTERY_STATUS) == 50
+
+    client.fail = True
+    with pytest.raises(OperationFailedError):
+        await cache.request(DEVICE, MessageType.UPDATE_NAME, new_name="Kitchen")
+
+    client.battery_level = 40
+    assert await cache.get(DEVICE, MessageType.REQUEST_BATTERY_STATUS) == 50
+
+
+async def test_failed_command_invalidates_the_values_it_changes():
+    client = FakeClient()
+    cache = _cache(client)
+    await cache.get(DEVICE, MessageType.REQUEST_BATTERY_STATUS)
+
+    client.fail = True
+    with pytest.raises(OperationFailedError):
+        await cache.request(DEVICE, MessageType.UPDATE_LIMIT_OR_RESET)
+
+    client.fail = False
+    client.battery_level = 40
+    assert await cache.get(DEVICE, MessageType.REQUEST_BATTERY_STATUS) == 40
+
+
+async def test_read_after_invalidation_does_not_join_older_request():
+    client = FakeClient()
+    client.release = asyncio.Event()
+    cache = _cache(client)
+
+    before = asyncio.ensure_future(
+        cache.get(DEVICE, MessageType.REQUEST_BATTERY_STATUS)
+    )
+    await asyncio.sleep(0)
+    joined = asyncio.ensure_future(
+        cache.get(DEVICE, MessageType.REQUEST_BATTERY_STATUS)
+    )
+    await asyncio.sleep(0)
+
+    client.battery_level = 40
+    cache.invalidate(DEVICE.address, MessageType.REQUEST_BATTERY_STATUS)
+    after = asyncio.ensure_future(cache.get(DEVICE, MessageType.REQUEST_BATTERY_STATUS))
+    await asyncio.sleep(0)
+    client.release.set()
+
+    assert await before == 50
+    assert await joined == 50
+    assert await after == 40
+    assert len(client.requests) == 2
+    # Only the value fetched after the invalidation is stored
+    client.battery_level = 30
+    assert await cache.get(DEVICE, MessageType.REQUEST_BATTERY_STATUS) == 40
@@ -0,0 +1,146 @@
+import asyncio
+
+from am43_bleak.client import AM43Client, DeviceSettings
+from am43_bleak.protocol import (
+    FaultNotification,
+    IlluminanceLevel,
+    Message,
+    MessageType,
+    OperationResult,
+    Timer,
+    TimerRepeat,
+)
+from am43_bleak.retry import RetryPolicy
+from am43_bleak.simulator import SimulatedBleakClient, SimulatedDevice
+
+ADDRESS = "02:00:00:00:00:01"
+
+
+def _device() -> SimulatedDevice:
+    device = SimulatedDevice(ADDRESS, require_authentication=False)
+    device.state.battery_level = 87
+    device.state.has_light_device = True
+    device.state.illuminance_level = 7
+    timer = Timer(
+        enabled=True, target_position=100, repeat=TimerRepeat.MONDAY, minutes=15
+    )
+    timer.hours = 7
+    device.state.timers[0] = timer
+    return device
+
+
+def _confirmations(device: SimulatedDevice) -> list:
+    return [
+        MessageType(m.payload.message_type)
+        for m in device.received
+        if isinstance(m.payload.message, OperationResult)
+    ]
+
+
+class _DroppingClient(SimulatedBleakClient):
+    """Loses the first reply of the given message type"""
+
+    def __init__(self, device: SimulatedDevice, message_type: MessageType, **kwargs):
+        super().__init__(device, **kwargs)
+        self.message_type = message_type
+        self.dropped = 0
+
+    def notify(self, message: Message):
+        if message.payload.message_type == self.message_type and not self.dropped:
+            self.dropped += 1
+            return
+        super().notify(message)
+
+
+async def test_concurrent_requests_get_their_own_responses():
+    device = _device()
+    async with AM43Client(
+        device.ble_device(),
+        client=SimulatedBleakClient(
+            device, latency=0.01, jitter=0.01, fragment_size=5, seed=1
+        ),
+    ) as client:
+        results = await asyncio.gather(
+            client.get_settings(),
+            client.get_battery_level(),
+            client.get_illuminance(),
+            client.set_position(42),
+            client.get_battery_level(),
+        )
+
+    settings, battery_level, illuminance, position, other_battery_level = results
+    assert isinstance(settings, DeviceSettings)
+    assert settings.settings.speed == device.state.speed
+    assert len(settings.timers.timers) == 1
+    assert settings.seasons.summer == device.state.summer
+    assert battery_level == other_battery_level == 87
+    assert isinstance(illuminance, IlluminanceLevel)
+    assert illuminance.level == 7
+    assert position is None
+    assert device.state.position == 42
+
+
+async def test_device_messages_are_confirmed():
+    device = _device()
+    simulated = SimulatedBleakClient(device, latency=0.001)
+    async with AM43Client(device.ble_device(), client=simulated) as client:
+        await client.get_battery_level()
+        simulated.notify(
+            Message.prepare(
+                MessageType.FAULT,
+                is_device_response=True,
+                message=FaultNotification(code=0x12),
+            )
+        )
+        await asyncio.sleep(0.05)
+
+    assert _confirmations(device) == [
+        MessageType.REQUEST_BATTERY_STATUS,
+        MessageType.FAULT,
+    ]
+
+
+async def test_settings_wait_for_every_response():
+    device = _device()
+    simulated = _DroppingClient(device, MessageType.LIST_SEASONS, latency=0.001)
+    async with AM43Client(
+        device.ble_device(), client=simulated, timeout=0.05
+    ) as client:
+        settings = await client.get_settings()
+
+    assert simulated.dropped == 1
+    # Re-sent, since the first reply lacked the seasons
+    request_settings = [
+        m
+        for m in device.received
+        if m.payload.message_type == MessageType.REQUEST_SETTINGS
+    ]
+    assert len(request_settings) == 2
+    assert settings.seasons.winter == device.state.winter
+
+
+class _RecordingPolicy(RetryPolicy):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.samples = []
+
+    def add_rtt_sample(self, rtt: float):
+        self.samples.append(rtt)
+        super().add_rtt_sample(rtt)
+
+
+async def test_rtt_excludes_waiting_for_other_writes():
+    device = _device()
+    policy = _RecordingPolicy()
+    async with AM43Client(
+        device.ble_device(),
+        client=SimulatedBleakClient(device, latency=0.01),
+        retry_policy=policy,
+    ) as client:
+        async with client._write_lock:
+            request = asyncio.ensure_future(client.get_battery_level())
+            await asyncio.sleep(0.2)
+        await request
+
+    assert len(policy.samples) == 1
+    assert policy.samples[0] < 0.1
@@ -0,0 +1,259 @@
+from dataclasses import dataclass
+
+from construct import Int8ub, Optional
+from construct_typed import csfield
+import pytest
+
+from am43_bleak.codec import MessageCodecMap, compiled_message_format
+from am43_bleak.protocol import (
+    CLIENT_MESSAGE_TAG,
+    AlwaysOne,
+    BatteryStatusResponse,
+    ButtonsMode,
+    ContentControlDirect,
+    ContentLimitSetOrReset,
+    ContentOperationResult,
+    DataclassMixin,
+    DayOfWeek,
+    DeviceType,
+    DirectControl,
+    Direction,
+    FaultNotification,
+    IlluminanceLevel,
+    LimitCommand,
+    LimitOrReset,
+    LimitOrResetResult,
+    ListSeasonsResponse,
+    ListTimersResponse,
+    Message,
+    MessageType,
+    MessageTypeMap,
+    OperationResult,
+    Password,
+    Payload,
+    PositionControl,
+    PositionNotification,
+    Season,
+    SeasonLightLevel,
+    SeasonLightSwitchState,
+    SetLimitMode,
+    SettingsResponse,
+    SpeedNotification,
+    Timer,
+    TimerRepeat,
+    UpdateDeviceTime,
+    UpdateDeviceType,
+    UpdateName,
+    UpdateSeason,
+    UpdateSettings,
+    UpdateTimer,
+    UpdateTimerAction,
+    WheelGearDiameter,
+    message_format,
+    xor_checksum,
+)
+
+
+def _timer(enabled: bool = True, hours: int = 7) -> Timer:
+    timer = Timer(
+        enabled=enabled,
+        target_position=100,
+        repeat=TimerRepeat.MONDAY | TimerRepeat.FRIDAY,
+        minutes=15,
+    )
+    timer.hours = hours
+    return timer
+
+
+def _season(season_id: int) -> Season:
+    return Season(
+        season_id=season_id,
+        is_enabled=True,
+        light_switch_state=SeasonLightSwitchState.OPEN2OPEN_CLOSE2CLOSE,
+        light_value_to_open=SeasonLightLevel.LUX_500,
+        light_value_to_close=SeasonLightLevel.LUX_20,
+        start_hour=6,
+        start_minute=0,
+        end_hour=22,
+        end_minute=30,
+    )
+
+
+LIMIT_OR_RESET_SUCCESS = (
+    ContentLimitSetOrReset.LIMIT_INIT_SUCCESS,
+    ContentLimitSetOrReset.LIMIT_UPDATE_SUCCESS,
+    ContentLimitSetOrReset.RESET_SUCCESS,
+    ContentLimitSetOrReset.EXIT,
+)
+
+
+def _result(message_class: type, result, is_success: bool):
+    message = message_class(result)
+    message.is_success = is_success
+    return message
+
+
+# Message class -> sample messages, covering every class of the payload maps
+SAMPLES = {
+    AlwaysOne: lambda: [AlwaysOne()],
+    Password: lambda: [Password(pin=1234)],
+    UpdateName: lambda: [UpdateName(new_name="Living room"), UpdateName("Küche")],
+    DirectControl: lambda: [
+        DirectControl(action=action) for action in ContentControlDirect
+    ],
+    UpdateDeviceTime: lambda: [
+        UpdateDeviceTime(day_of_week=DayOfWeek.MONDAY, hour=12, minute=30, second=5)
+    ],
+    OperationResult: lambda: [
+        _result(OperationResult, result, result == ContentOperationResult.SUCCESS)
+        for result in ContentOperationResult
+    ],
+    UpdateTimer: lambda: [
+        UpdateTimer(timer_id=1, action=UpdateTimerAction.UPDATE, timer=_timer()),
+        UpdateTimer(
+            timer_id=2, action=UpdateTimerAction.DELETE, timer=_timer(False, 0)
+        ),
+    ],
+    PositionControl: lambda: [PositionControl(position=p) for p in (0, 42, 100)],
+    LimitOrReset: lambda: [
+        LimitOrReset(command=LimitCommand.SAVE, limit_mode=SetLimitMode.TOP)
+    ],
+    UpdateSeason: lambda: [UpdateSeason(season=_season(1))],
+    UpdateSettings: lambda: [
+        UpdateSettings(
+            device_type=DeviceType.ROLLER_SHADE,
+            buttons_mode=ButtonsMode.INCHING,
+            direction=Direction.FORWARD,
+            speed=30,
+            length=1200,
+            wheel_gear_diameter=WheelGearDiameter.DIAMETER_18MM,
+        )
+    ],
+    UpdateDeviceType: lambda: [
+        UpdateDeviceType(device_type=DeviceType.VENETIAN_BLIND),
+    ],
+    BatteryStatusResponse: lambda: [BatteryStatusResponse(level=87)],
+    SettingsResponse: lambda: [
+        SettingsResponse(
+            has_light_device=True,
+            bottom_limit_is_ok=True,
+            top_limit_is_ok=False,
+            buttons_mode=ButtonsMode.CONTINUOUS,
+            direction=Direction.REVERSE,
+            speed=30,
+            current_position=42,
+            length=1200,
+            wheel_gear_diameter=WheelGearDiameter.DIAMETER_18MM,
+            device_type=DeviceType.ROLLER_SHADE,
+        )
+    ],
+    ListTimersResponse: lambda: [
+        ListTimersResponse(timers=[]),
+        ListTimersResponse(timers=[_timer(), _timer(False, 23)]),
+    ],
+    IlluminanceLevel: lambda: [IlluminanceLevel(has_light_device=True, level=7)],
+    LimitOrResetResult: lambda: [
+        _result(LimitOrResetResult, result, result in LIMIT_OR_RESET_SUCCESS)
+        for result in ContentLimitSetOrReset
+    ],
+    ListSeasonsResponse: lambda: [
+        ListSeasonsResponse(summer=_season(1), winter=_season(2))
+    ],
+    PositionNotification: lambda: [PositionNotification(position=42)],
+    SpeedNotification: lambda: [SpeedNotification(speed=30)],
+    FaultNotification: lambda: [FaultNotification(code=0x12)],
+}
+
+
+def _cases() -> list:
+    ret = []
+    for is_device_response, message_type_map in (
+        (False, Payload.REQUEST_MESSAGE_TYPE_MAP),
+        (True, Payload.RESPONSE_MESSAGE_TYPE_MAP),
+    ):
+        for message_type, message_classes in message_type_map.message_classes.items():
+            for message_class in message_classes:
+                ret.append(
+                    pytest.param(
+                        message_type,
+                        is_device_response,
+                        message_class,
+                        id=f"{'response' if is_device_response else 'request'}-"
+                        f"{message_type.name}-{message_class.__name__}",
+                    )
+                )
+
+    return ret
+
+
+@pytest.mark.parametrize("message_type,is_device_response,message_class", _cases())
+def test_compiled_codec_matches_construct(
+    message_type, is_device_response, message_class
+):
+    for sample in SAMPLES[message_class]():
+        message = Message.prepare(
+            message_type, is_device_response=is_device_response, message=sample
+        )
+
+        data = message_format.build(message)
+        assert compiled_message_format.build(message) == data
+
+        parsed = message_format.parse(data)
+        compiled = compiled_message_format.parse(data)
+        assert compiled == parsed
+        assert compiled.payload.message == parsed.payload.message
+        assert type(compiled.payload.message) is type(parsed.payload.message)
+
+        assert message_format.build(compiled) == data
+        assert compiled_message_format.build(parsed) == data
+
+
+def _frame(message_type: int, body: bytes, is_device_response: bool = True) -> bytes:
+    payload = bytes((0x9A, message_type, len(body))) + body
+    frame = payload + bytes((xor_checksum(payload),))
+    return frame if is_device_response else CLIENT_MESSAGE_TAG + frame
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        _frame(0x55, b"\x01\x02"),
+        _frame(MessageType.LIST_TIMERS, b"", is_device_response=False),
+        _frame(MessageType.REQUEST_POSITION, b"\x01\x02\x03"),
+    ],
+)
+def test_unknown_messages_are_kept_raw(data):
+    parsed = message_format.parse(data)
+    compiled = compiled_message_format.parse(data)
+    assert compiled == parsed
+    assert compiled.payload.message == parsed.payload.message
+    assert compiled.payload.message_type == parsed.payload.message_type
+    assert compiled_message_format.build(compiled) == data
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        _frame(MessageType.REQUEST_SETTINGS, b"\x01\x02"),
+        _frame(MessageType.REQUEST_BATTERY_STATUS, bytes(5))[:-1] + b"\x00",
+        b"\x9a\xa2",
+    ],
+)
+def test_broken_frames_raise(data):
+    # Not handed over to construct, which would raise its own errors
+    with pytest.raises(ValueError):
+        compiled_message_format.parse(data)
+
+
+@dataclass
+class _Uncompilable(DataclassMixin):
+    value: int = csfield(Optional(Int8ub))
+
+
+def test_uncompilable_message_types_are_left_to_construct():
+    codecs = MessageCodecMap(
+        MessageTypeMap({MessageType.REQUEST_SPEED: (_Uncompilable,)})
+    )
+    assert MessageType.REQUEST_SPEED in codecs
+    assert codecs[MessageType.REQUEST_SPEED] is None
+    assert MessageType.REQUEST_ILLUMINANCE not in codecs
@@ -0,0 +1,103 @@
+import asyncio
+from contextlib import nullcontext
+
+import pytest
+
+from am43_bleak.client import OperationFailedError
+from am43_bleak.commands import Command, CommandQueue, CommandStatus
+from am43_bleak.protocol import ContentControlDirect, MessageType
+
+DEBOUNCE = 0.01
+STOP = Command(MessageType.CONTROL_DIRECT, ContentControlDirect.STOP)
+
+
+def _position(position: int) -> Command:
+    return Command(MessageType.CONTROL_POSITION, position)
+
+
+class FakeClient:
+    def __init__(self):
+        self.sent = []
+        # Set to hold the position commands back
+        self.release: asyncio.Event = None
+        self.fail = False
+
+    async def set_position(self, position: int):
+        self.sent.append(_position(position))
+        if self.release is not None:
+            await self.release.wait()
+        if self.fail:
+            raise OperationFailedError("CONTROL_POSITION failed")
+
+    async def stop(self):
+        self.sent.append(STOP)
+
+
+def _queue(client: FakeClient) -> tuple:
+    queue = CommandQueue(lambda: nullcontext(client), debounce=DEBOUNCE)
+    results = []
+    queue.subscribe(results.append)
+    return queue, results
+
+
+async def test_bursts_are_coalesced():
+    client = FakeClient()
+    queue, results = _queue(client)
+
+    first, second, last = await asyncio.gather(
+        queue.set_position(10), queue.set_position(20), queue.set_position(30)
+    )
+
+    assert client.sent == [_position(30)]
+    assert first.status == second.status == CommandStatus.COALESCED
+    assert first.superseded_by == _position(30)
+    assert last.status == CommandStatus.SENT
+    assert [r.status for r in results] == [
+        CommandStatus.COALESCED,
+        CommandStatus.COALESCED,
+        CommandStatus.SENT,
+    ]
+
+
+async def test_stop_preempts_the_command_in_flight():
+    client = FakeClient()
+    client.release = asyncio.Event()
+    queue, _ = _queue(client)
+
+    moving = queue.set_position(10)
+    while not client.sent:
+        await asyncio.sleep(DEBOUNCE)
+    waiting = queue.set_position(20)
+    stopped = await queue.stop()
+
+    assert (await moving).status == CommandStatus.PREEMPTED
+    assert (await moving).superseded_by == STOP
+    assert (await waiting).status == CommandStatus.PREEMPTED
+    assert stopped.status == CommandStatus.SENT
+    assert client.sent == [_position(10), STOP]
+
+
+async def test_stop_is_not_coalesced_with_the_next_command():
+    client = FakeClient()
+    queue, _ = _queue(client)
+
+    stopped = queue.stop()
+    moved = queue.set_position(50)
+
+    assert (await stopped).status == CommandStatus.SENT
+    assert (await moved).status == CommandStatus.SENT
+    assert client.sent == [STOP, _position(50)]
+
+
+async def test_failures_are_reported():
+    client = FakeClient()
+    client.fail = True
+    queue, results = _queue(client)
+
+    with pytest.raises(OperationFailedError):
+        await queue.set_position(10)
+
+    [result] = results
+    assert result.command == _position(10)
+    assert result.status == CommandStatus.FAILED
+    assert isinstance(result.error, OperationFailedError)
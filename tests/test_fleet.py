@@ -0,0 +1,75 @@
+from bleak.exc import BleakError
+
+from am43_bleak.client import AM43Client
+from am43_bleak.fleet import send_group_command
+from am43_bleak.pool import ConnectionPool
+from am43_bleak.protocol import PositionControl
+from am43_bleak.simulator import SimulatedAdapter, SimulatedBleakClient, SimulatedDevice
+
+STAGGER = 0.05
+
+
+async def test_staggered_group_command_outcomes():
+    adapter = SimulatedAdapter("hci0")
+    failing_adapter = SimulatedAdapter("hci1")
+    failing_adapter.is_failing = True
+    devices = {
+        device.address: (device, device_adapter)
+        for device, device_adapter in (
+            (
+                SimulatedDevice("02:00:00:00:00:01", require_authentication=False),
+                adapter,
+            ),
+            # Rejects the command, not authenticated
+            (SimulatedDevice("02:00:00:00:00:02"), adapter),
+            (
+                SimulatedDevice("02:00:00:00:00:03", require_authentication=False),
+                failing_adapter,
+            ),
+            (
+                SimulatedDevice("02:00:00:00:00:04", require_authentication=False),
+                adapter,
+            ),
+        )
+    }
+
+    def client_factory(ble_device) -> AM43Client:
+        device, device_adapter = devices[ble_device.address]
+        return AM43Client(
+            ble_device,
+            client=SimulatedBleakClient(device, latency=0.001, adapter=device_adapter),
+        )
+
+    pool = ConnectionPool(client_factory=client_factory)
+    ble_devices = [
+        device_adapter.ble_device(device) for device, device_adapter in devices.values()
+    ]
+    # Already connected, goes first
+    async with pool.acquire(ble_devices[-1]):
+        pass
+
+    outcomes = await send_group_command(
+        pool, ble_devices, PositionControl(position=42), stagger=STAGGER
+    )
+    await pool.close()
+
+    assert [o.device for o in outcomes] == ble_devices
+    succeeded, rejected, failed, connected = outcomes
+
+    assert succeeded.is_success and connected.is_success
+    assert [device.state.position for device, _ in devices.values()] == [42, 0, 0, 42]
+
+    assert not rejected.is_success
+    assert rejected.error is None
+    assert rejected.result.is_success is False
+
+    assert not failed.is_success
+    assert isinstance(failed.error, BleakError)
+    assert failed.result is None
+    assert failed.command_time is None
+    assert failed.total_time is not None
+
+    # Staggered in the order they were issued in, the connected one first
+    issued = [connected, succeeded, rejected, failed]
+    for earlier, later in zip(issued, issued[1:]):
+        assert later.scheduled_at - earlier.scheduled_at >= STAGGER * 0.9
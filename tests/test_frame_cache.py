@@ -0,0 +1,31 @@
+import pytest
+
+from am43_bleak.codec import compiled_message_format
+from am43_bleak.frame_cache import FrameCache
+from am43_bleak.protocol import ContentControlDirect, Message, MessageType
+
+
+def test_values_of_other_types_are_not_served_cached_frames():
+    frames = FrameCache()
+    frame = frames.build(MessageType.CONTROL_DIRECT, action=ContentControlDirect.OPEN)
+    assert frame == compiled_message_format.build(
+        Message.prepare(MessageType.CONTROL_DIRECT, action=ContentControlDirect.OPEN)
+    )
+
+    # Rejected the same way as without the cache
+    with pytest.raises(TypeError):
+        frames.build(MessageType.CONTROL_DIRECT, action=0xDD)
+
+
+def test_frames_are_evicted():
+    frames = FrameCache(maxsize=2)
+    constant = len(frames)
+    for position in (10, 20, 30):
+        frames.build(MessageType.CONTROL_POSITION, position=position)
+
+    assert len(frames) == constant + 2
+    assert frames.build(MessageType.CONTROL_POSITION, position=10) == (
+        compiled_message_format.build(
+            Message.prepare(MessageType.CONTROL_POSITION, position=10)
+        )
+    )
@@ -0,0 +1,22 @@
+import os
+
+from import_time import MODULES, built_structs
+import pytest
+
+import am43_bleak
+
+
+@pytest.fixture(autouse=True)
+def _package_path(monkeypatch):
+    # The modules are imported in fresh interpreters, which need to find the
+    # package the same way
+    source = os.path.dirname(os.path.dirname(am43_bleak.__file__))
+    path = os.environ.get("PYTHONPATH")
+    monkeypatch.setenv(
+        "PYTHONPATH", source if not path else os.pathsep.join((source, path))
+    )
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_no_constructs_built_on_import(module):
+    assert built_structs(module) == 0
@@ -0,0 +1,26 @@
+from am43_bleak.client import AM43Client
+from am43_bleak.instrumentation import Instrumentation
+from am43_bleak.retry import RetryPolicy
+from am43_bleak.simulator import SimulatedBleakClient, SimulatedDevice
+
+ADDRESS = "02:00:00:00:00:01"
+
+
+async def test_retry_gauges_follow_the_policy():
+    device = SimulatedDevice(ADDRESS, require_authentication=False)
+    instrumentation = Instrumentation()
+    policy = RetryPolicy(retry_count=5, initial_timeout=2.0, min_timeout=0.01)
+    client = AM43Client(
+        device.ble_device(),
+        client=SimulatedBleakClient(device, latency=0.001),
+        instrumentation=instrumentation,
+        retry_policy=policy,
+    )
+    assert instrumentation.gauges[("retry_count", ADDRESS)] == 5
+    assert instrumentation.gauges[("retry_timeout_seconds", ADDRESS)] == 2.0
+
+    async with client:
+        await client.get_battery_level()
+
+    assert policy.rto < 2.0
+    assert instrumentation.gauges[("retry_timeout_seconds", ADDRESS)] == policy.rto
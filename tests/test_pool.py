@@ -0,0 +1,64 @@
+import asyncio
+
+from bleak.backends.device import BLEDevice
+
+from am43_bleak.pool import ConnectionPool
+
+
+class FakeClient:
+    # Addresses connected at the moment, and the most at once
+    connected: set = set()
+    peak = 0
+
+    def __init__(self, device: BLEDevice, disconnect_time: float = 0.0):
+        self.device = device
+        self.disconnect_time = disconnect_time
+        self.is_connected = False
+
+    async def connect(self):
+        await asyncio.sleep(0.01)
+        self.is_connected = True
+        FakeClient.connected.add(self.device.address)
+        FakeClient.peak = max(FakeClient.peak, len(FakeClient.connected))
+
+    async def disconnect(self):
+        await asyncio.sleep(self.disconnect_time)
+        self.is_connected = False
+        FakeClient.connected.discard(self.device.address)
+
+
+def _device(i: int, adapter: str = "hci0") -> BLEDevice:
+    return BLEDevice(f"02:00:00:00:00:{i:02X}", None, {"source": adapter}, -60)
+
+
+async def test_eviction_keeps_the_slot_until_disconnected():
+    FakeClient.connected = set()
+    FakeClient.peak = 0
+    pool = ConnectionPool(
+        max_connections=2,
+        client_factory=lambda device: FakeClient(device, disconnect_time=0.2),
+    )
+    for i in range(2):
+        async with pool.acquire(_device(i)):
+            pass
+
+    async def use(device: BLEDevice):
+        async with pool.acquire(device):
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(use(_device(i)) for i in range(2, 6)))
+    await pool.close()
+
+    assert FakeClient.peak == 2
+    assert not pool._closing
+
+
+async def test_idle_connections_are_closed():
+    FakeClient.connected = set()
+    pool = ConnectionPool(idle_timeout=0.01, client_factory=FakeClient)
+    async with pool.acquire(_device(1)):
+        pass
+
+    await asyncio.sleep(0.05)
+    assert len(pool) == 0
+    assert not FakeClient.connected
@@ -0,0 +1,68 @@
+from message_build import REQUESTS, SEASON, make_timer
+import pytest
+
+from am43_bleak.codec import compiled_message_format
+from am43_bleak.protocol import (
+    FaultNotification,
+    Message,
+    MessageType,
+    PositionNotification,
+    message_format,
+    xor_checksum,
+)
+from am43_bleak.records import RecordFormat, message_to_record
+from am43_bleak.simulator import SimulatedDevice
+
+
+def _frames() -> list:
+    """Every request, and the responses of a simulated device to them"""
+    device = SimulatedDevice(
+        "02:00:00:00:00:01", require_authentication=False, report_movement=True
+    )
+    device.state.timers[:2] = [make_timer(), make_timer()]
+    device.state.summer = SEASON
+
+    messages = [
+        Message.prepare(
+            MessageType.FAULT,
+            is_device_response=True,
+            message=FaultNotification(code=0x12),
+        ),
+        Message.prepare(
+            MessageType.REQUEST_POSITION,
+            is_device_response=True,
+            message=PositionNotification(position=42),
+        ),
+    ]
+    for prepare in REQUESTS.values():
+        message = prepare()
+        messages.append(message)
+        messages.extend(device.handle(message))
+
+    frames = [message_format.build(message) for message in messages]
+    # Kept raw: an unknown type, and a notification of an unexpected size
+    for message_type, body in ((0x55, b"\x01\x02"), (MessageType.FAULT, b"\x01\x02")):
+        payload = bytes((0x9A, message_type, len(body))) + body
+        frames.append(payload + bytes((xor_checksum(payload),)))
+
+    return frames
+
+
+@pytest.mark.parametrize("keep_raw", [False, True])
+def test_records_match_parsed_messages(keep_raw):
+    record_format = RecordFormat(keep_raw=keep_raw)
+    for frame in _frames():
+        record = record_format.parse(frame)
+        assert record == message_to_record(
+            compiled_message_format.parse(frame), keep_raw
+        )
+        assert record == message_to_record(message_format.parse(frame), keep_raw)
+        assert type(record.message) is type(
+            message_to_record(message_format.parse(frame)).message
+        )
+
+
+def test_broken_frames_raise():
+    frame = message_format.build(REQUESTS[MessageType.REQUEST_SETTINGS]())
+    with pytest.raises(ValueError):
+        RecordFormat().parse(frame[:-1] + bytes((frame[-1] ^ 0x01,)))
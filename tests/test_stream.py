@@ -0,0 +1,74 @@
+from am43_bleak.protocol import (
+    BatteryStatusResponse,
+    Message,
+    MessageType,
+    PositionControl,
+    message_format,
+)
+from am43_bleak.stream import StreamDecoder
+
+BATTERY = message_format.build(
+    Message.prepare(
+        MessageType.REQUEST_BATTERY_STATUS,
+        is_device_response=True,
+        message=BatteryStatusResponse(level=87),
+    )
+)
+POSITION = message_format.build(
+    Message.prepare(MessageType.CONTROL_POSITION, message=PositionControl(position=42))
+)
+SUCCESS = message_format.build(
+    Message.prepare(
+        MessageType.CONTROL_POSITION, is_device_response=True, operation_result=True
+    )
+)
+# A fault notification of an unexpected size, which ends with the client tag
+FAULT = bytes.fromhex("9a a6 04 c7 00 ff 00 00")
+
+
+def _parse(*frames: bytes) -> list:
+    return [message_format.parse(frame) for frame in frames]
+
+
+def test_fragmented_frames():
+    decoder = StreamDecoder()
+    data = POSITION + BATTERY
+    ret = []
+    for i in range(len(data)):
+        messages = decoder.feed(data[i : i + 1])
+        if i not in (len(POSITION) - 1, len(data) - 1):
+            assert messages == []
+        ret += messages
+
+    assert ret == _parse(POSITION, BATTERY)
+    assert decoder.skipped_bytes == 0
+    assert decoder.malformed_frames == 0
+
+
+def test_several_frames_per_chunk():
+    decoder = StreamDecoder()
+    assert decoder.feed(BATTERY + POSITION + SUCCESS + BATTERY[:3]) == _parse(
+        BATTERY, POSITION, SUCCESS
+    )
+    assert decoder.feed(BATTERY[3:]) == _parse(BATTERY)
+
+
+def test_noise_is_skipped():
+    decoder = StreamDecoder()
+    noise = b"\x01\x9a\x77\x02\x00\xff"
+    assert decoder.feed(noise + BATTERY + noise + POSITION) == _parse(BATTERY, POSITION)
+    assert decoder.skipped_bytes == 2 * len(noise)
+    assert decoder.malformed_frames == 0
+
+
+def test_bad_checksums_are_counted():
+    decoder = StreamDecoder()
+    broken = BATTERY[:-1] + bytes((BATTERY[-1] ^ 0x01,))
+    assert decoder.feed(broken + POSITION) == _parse(POSITION)
+    assert decoder.malformed_frames == 1
+
+
+def test_consumed_bytes_are_not_a_client_tag():
+    decoder = StreamDecoder()
+    assert decoder.feed(FAULT + BATTERY) == _parse(FAULT, BATTERY)
+    assert decoder.malformed_frames == 0
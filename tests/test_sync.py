@@ -0,0 +1,134 @@
+from dataclasses import replace
+
+from am43_bleak.client import AM43Client, OperationFailedError
+from am43_bleak.pool import ConnectionPool
+from am43_bleak.protocol import (
+    ButtonsMode,
+    DeviceType,
+    Direction,
+    MessageType,
+    SeasonLightLevel,
+    Timer,
+    TimerRepeat,
+    UpdateSettings,
+    UpdateTimerAction,
+    WheelGearDiameter,
+)
+from am43_bleak.simulator import SimulatedBleakClient, SimulatedDevice
+from am43_bleak.sync import DesiredConfig, diff_config, sync_config, sync_group_config
+
+
+def _timer(hours: int, enabled: bool = True) -> Timer:
+    timer = Timer(
+        enabled=enabled, target_position=100, repeat=TimerRepeat.MONDAY, minutes=15
+    )
+    timer.hours = hours
+    return timer
+
+
+def _device(address: str = "02:00:00:00:00:01", **kwargs) -> SimulatedDevice:
+    device = SimulatedDevice(address, **kwargs)
+    device.state.timers[:3] = [_timer(6), _timer(7), _timer(8)]
+    return device
+
+
+def _client(device: SimulatedDevice) -> AM43Client:
+    return AM43Client(
+        device.ble_device(), client=SimulatedBleakClient(device, latency=0.001)
+    )
+
+
+def _sent(device: SimulatedDevice) -> list:
+    return [
+        MessageType(m.payload.message_type)
+        for m in device.received
+        if m.payload.message_type != MessageType.REQUEST_SETTINGS
+    ]
+
+
+SETTINGS = UpdateSettings(
+    device_type=DeviceType.ROLLER_SHADE,
+    buttons_mode=ButtonsMode.CONTINUOUS,
+    direction=Direction.FORWARD,
+    speed=50,
+    length=1000,
+    wheel_gear_diameter=WheelGearDiameter.DIAMETER_18MM,
+)
+
+
+async def test_only_the_differences_are_sent():
+    device = _device(require_authentication=False)
+    summer = replace(
+        device.state.summer,
+        is_enabled=True,
+        light_value_to_open=SeasonLightLevel.LUX_500,
+    )
+    desired = DesiredConfig(
+        timers=[_timer(6), _timer(9, enabled=False)],
+        seasons=[summer, device.state.winter],
+        settings=SETTINGS,
+    )
+
+    async with _client(device) as client:
+        changes = await sync_config(client, desired)
+        assert diff_config(await client.get_settings(), desired) == []
+        assert await sync_config(client, desired) == []
+
+    timer_changes = [
+        (c.message.timer_id, c.message.action)
+        for c in changes
+        if c.message_type == MessageType.UPDATE_TIMER
+    ]
+    assert timer_changes == [
+        (1, UpdateTimerAction.UPDATE),
+        (2, UpdateTimerAction.DELETE),
+    ]
+    # Groups of different message types are sent concurrently
+    assert sorted(_sent(device)) == [
+        MessageType.UPDATE_SETTINGS,
+        MessageType.UPDATE_TIMER,
+        MessageType.UPDATE_TIMER,
+        MessageType.UPDATE_SEASON,
+    ]
+    assert device.state.summer == summer
+    assert device.state.speed == 50
+    assert [t.hours if t else None for t in device.state.timers] == [6, 9, None, None]
+
+
+async def test_dry_run_sends_nothing():
+    device = _device(require_authentication=False)
+    async with _client(device) as client:
+        changes = await sync_config(client, DesiredConfig(timers=[]), dry_run=True)
+
+    assert len(changes) == 3
+    assert _sent(device) == []
+    assert all(device.state.timers[:3])
+
+
+async def test_group_outcomes():
+    devices = {
+        device.address: device
+        for device in (
+            _device("02:00:00:00:00:01", pin=1234),
+            # The PIN is rejected
+            _device("02:00:00:00:00:02", pin=4321),
+        )
+    }
+    pool = ConnectionPool(
+        pins={"02:00:00:00:00:01": 1234, "02:00:00:00:00:02": 1234},
+        client_factory=lambda ble_device: _client(devices[ble_device.address]),
+    )
+
+    outcomes = await sync_group_config(
+        pool,
+        [device.ble_device() for device in devices.values()],
+        DesiredConfig(timers=[_timer(6)]),
+    )
+    await pool.close()
+
+    succeeded, failed = outcomes
+    assert succeeded.is_success
+    assert len(succeeded.changes) == 2
+    assert not failed.is_success
+    assert isinstance(failed.error, OperationFailedError)
+    assert failed.finished_at >= failed.started_at